@@ -1,70 +1,33 @@
-from tkinter.constants import ACTIVE, CENTER, DISABLED, FLAT, NORMAL, S, SOLID, GROOVE, RAISED, RIDGE, SUNKEN
+from tkinter.constants import ACTIVE, CENTER, DISABLED, FLAT, LEFT, NORMAL, S, SOLID, GROOVE, RAISED, RIDGE, SUNKEN
 from tkinter import Checkbutton, filedialog as fd
 from tkinter import ttk
 import tkinter as tk
 from typing import Text
 from typing_extensions import IntVar
-import RPi.GPIO as GPIO
-from datetime import datetime
-import time
 from PIL import ImageTk, Image
 from pathlib import Path
-import glob
 import os
-import json
+import argparse
+from eventbuilder import cameras
+from eventbuilder import folders
+from eventbuilder.options import add_engine_arguments, build_control
+from eventbuilder.control import IDLE, LIVE, WAITING
+from eventbuilder import config
+from eventbuilder import tuner
+from eventbuilder.catalog import Catalog, Watcher
+from eventbuilder.packer import open_frame
 
 # export DISPLAY=localhost:10.0
 
-# GPIO Setup
-StateCom      = [11, 13, 15] # Output signal to RPis
-InPins        = [18, 36, 40]
-TriggerEnable = [16, 32, 38]
-TriggerReset  = 22
-TriggerLatch  = 29
-EndEvent      = 31
-Error_LED     = 38
-Trig_0_LED    = 37
-
-GPIO.setmode(GPIO.BOARD) # use Physical GPIO Numbering
-GPIO.setup(InPins, GPIO.IN)
-GPIO.setup(TriggerEnable, GPIO.OUT)
-GPIO.output(TriggerEnable, GPIO.LOW)
-GPIO.setup(StateCom, GPIO.OUT)
-GPIO.output(StateCom, GPIO.LOW)
-GPIO.setup(Error_LED, GPIO.OUT)
-GPIO.output(Error_LED, GPIO.LOW)
-GPIO.setup(Trig_0_LED, GPIO.OUT)
-GPIO.output(Trig_0_LED, GPIO.LOW)
-GPIO.setup(TriggerReset, GPIO.OUT)
-GPIO.output(TriggerReset, GPIO.LOW)
-GPIO.setup(TriggerLatch, GPIO.IN)
-GPIO.setup(EndEvent, GPIO.OUT)
-GPIO.output(EndEvent, GPIO.LOW)
-
-
-# Tkinter setup
-tk_root = tk.Tk()
-tk_root.title('Event Builder')
-tabControl = ttk.Notebook(tk_root)
-tab1 = ttk.Frame(tabControl)
-tab2 = ttk.Frame(tabControl)
-tab3 = ttk.Frame(tabControl)
-tab3 = ttk.Frame(tabControl)
-tabControl.add(tab1, text='Run Event')
-tabControl.add(tab2, text='Camera Settings')
-tabControl.add(tab3, text='Image Viewer')
-tabControl.add(tab3, text='Playback Images')
-tabControl.pack(expand=1, fill='both')
+# Refresh interval of the Run Event tab in milliseconds (20 Hz). Run control itself runs at
+# --- its own rate in the event control thread.
+DisplayInterval = 50
+
 # Global padding settings
 padx = 4
 pady = 4
 
 
-# Initializing the dump folder as the default save path
-if not os.path.isdir('/home/pi/camera-data/dump'):
-    os.mkdir('/home/pi/camera-data/dump')
-
-
 
 ##############################################
 ############# Tab 1: event logic #############
@@ -83,7 +46,7 @@ if not os.path.isdir('/home/pi/camera-data/dump'):
 ### --- button which cleans up/resets all of the GPIO pins before exiting.
 
 class EB:
-    def __init__(self, master):
+    def __init__(self, master, control):
         self.master = master
 
         # Trig enable entry box
@@ -98,29 +61,56 @@ class EB:
         self.max_time_entry.grid(row=1, column=1, padx=padx, pady=pady)
         ttk.Label(self.master, text='Maxium Event Time: ').grid(row=1, column=0)
 
+        # Autorun: number of events (0 runs until stopped) and whether to stop when an event fails
+        self.autorun_events_entry = ttk.Spinbox(master=self.master, width=10, from_=0, to=float('inf'), increment=1, format='%10.0f')
+        self.autorun_events_entry.insert(0, 100)
+        self.autorun_events_entry.grid(row=2, column=1, padx=padx, pady=pady)
+        ttk.Label(self.master, text='Autorun Events: ').grid(row=2, column=0)
+        self.stop_on_error = tk.IntVar(value=1)
+        Checkbutton(self.master, text='Stop Autorun on Error', variable=self.stop_on_error).grid(row=3, column=1, padx=padx, pady=pady)
+
         # Showing event time 
         self.show_time = tk.StringVar()
         self.show_time.set('Event Time: ' +str(0))
         self.display_time = ttk.Label(self.master, textvariable=self.show_time, relief=SUNKEN, width=16, padding=pady)
         self.display_time.grid(row=11, column=0, padx=padx, pady=pady)
 
+        # The event control thread that runs the events. This tab only sends it commands
+        # --- and shows the snapshots it sends back.
+        self.control = control
+
         # Initializing start, stop, quit buttons
         self.buttonstart = ttk.Button(self.master, text='Start Event', command=self.run_event)
         self.buttonstart.grid(row=12, column=0, padx=padx, pady=pady)
 
-        self.buttonmantrig = ttk.Button(self.master, text='Stop Event', state=DISABLED)
+        self.buttonmantrig = ttk.Button(self.master, text='Stop Event', command=self.control.stop_event, state=DISABLED)
         self.buttonmantrig.grid(row=13, column=0, padx=padx, pady=pady)
 
-        self.buttonsingletake = ttk.Button(self.master, text='Take Image', command=self.trig_enable_pulse)
+        self.buttonsingletake = ttk.Button(self.master, text='Take Image', command=self.control.take_image)
         self.buttonsingletake.grid(row=14, column=0, padx=padx, pady=pady)
         
         self.buttonquit = ttk.Button(self.master, text='Quit', command=self.leave)
         self.buttonquit.grid(row=15, column=0, padx=padx, pady=pady)
 
-        # RPi status labels (set initially to neutral when event is not running)
+        # Autorun buttons
+        self.buttonautorun = ttk.Button(self.master, text='Autorun', command=self.autorun)
+        self.buttonautorun.grid(row=16, column=0, padx=padx, pady=pady)
+
+        self.buttonpause = ttk.Button(self.master, text='Pause Autorun', command=self.control.pause_autorun, state=DISABLED)
+        self.buttonpause.grid(row=17, column=0, padx=padx, pady=pady)
+
+        self.buttonstopautorun = ttk.Button(self.master, text='Stop Autorun', command=self.control.stop_autorun, state=DISABLED)
+        self.buttonstopautorun.grid(row=18, column=0, padx=padx, pady=pady)
+
+        # RPi status labels, one per camera in the registry (set initially to neutral when event is not running)
         status_label = ttk.Label(self.master, text='    RPi Status', relief=RIDGE, width=12, padding=pady, justify=CENTER)
         status_label.grid(row=11, column=1, padx=4*padx, pady=pady)
-        for i in range(len(InPins)):
+        status_frame = ttk.Frame(self.master)
+        status_frame.grid(row=12, column=1, rowspan=7, sticky='n')
+        self.status_labels = []
+        for i, cam in enumerate(cameras.active()):
+            self.status_labels.append(ttk.Label(status_frame, text=cam.name, relief=SUNKEN, padding=pady))
+            self.status_labels[-1].grid(row=i, column=0, padx=padx, pady=pady)
             self.set_status_neutral(i)
 
         # Making space for error labels -> sets tkinter window size appropriately
@@ -129,396 +119,268 @@ class EB:
         self.error.grid(row=25, column=0, padx=padx, pady=pady)
         self.waiting_label = ttk.Label(self.master, text='')
         self.waiting_label.grid(row=26, column=0, padx=padx, pady=pady)
+        self.autorun_label = ttk.Label(self.master, text='')
+        self.autorun_label.grid(row=27, column=0, columnspan=2, padx=padx, pady=pady)
+        self.storage_label = ttk.Label(self.master, text='')
+        self.storage_label.grid(row=28, column=0, columnspan=2, padx=padx, pady=pady)
 
-        self.trig_0_state = False
-        self.run_state = False
-        self.event_time = 0
+        self.state = IDLE
+        self.statuses = [None]*len(self.status_labels)
+        self.directory = folders.DumpDir
+        self.autorun_state = ''
+        self.error_text = ''
+        self.refusals = 0
+
+        self.control.start()
+        self.refresh()
 
         
     # The following three functions are for changing the status labels for the RPis
     def set_status_neutral(self, cam):
-        status = ttk.Label(self.master, text='Cam_'+str(cam), relief=SUNKEN, padding=pady, background='gray')
-        status.grid(row=cam+12, column=1, padx=padx, pady=pady)
+        self.status_labels[cam].configure(background='gray')
 
     def set_status_on(self, cam):
-        status = ttk.Label(self.master, text='Cam_'+str(cam), relief=SUNKEN, padding=pady, background='green')
-        status.grid(row=cam+12, column=1, padx=padx, pady=pady)
+        self.status_labels[cam].configure(background='green')
 
     def set_status_off(self, cam):
-        status = ttk.Label(self.master, text='Cam_'+str(cam), relief=SUNKEN, padding=pady, background='red')
-        status.grid(row=cam+12, column=1, padx=padx, pady=pady)
-
-
-    # Returns false if all InPins are not recieving a high signal
-    # Helper for fifo_signal and iterate. Also used in end_event to 
-    # --- save status of pins when the event ends
-    def check_in_pins(self):
-        for i in range(len(InPins)):
-            if not GPIO.input(InPins[i]):
-                return False
-        return True
-
-    # Returns true when all in pins are inactive
-    # Used in wait_for_end to make sure that all RPis are inactive
-    # --- before a new event can start
-    def check_all_in_pins(self):
-        for i in range(len(InPins)):
-            if GPIO.input(InPins[i]):
-                return False
-        return True
-
-
-    # Following two functions enable and disable the trigger_enable pin
-    # --- that is sent to all the RPis.
-    # send_trig_enable is used when running an event and is called after 
-    # --- trig_enable_time
-    def send_trig_enable(self):
-        for i in range(len(TriggerEnable)):
-            GPIO.output(TriggerEnable[i], GPIO.HIGH)
-
-    # Called when an event ends
-    def disable_trig_enable(self):
-        for i in range(len(TriggerEnable)):
-            GPIO.output(TriggerEnable[i], GPIO.LOW)
-
-    def trig_enable_pulse(self):
-        self.send_trig_enable()
-        time.sleep(0.01)
-        self.disable_trig_enable()
-
-
-    # Send 10 millisecond trigger_reset signal.
-    # Called when starting an event, if trig_latch is enabled when trying
-    # --- to start an event, after an event finishes.
-    def send_trig_reset(self):
-        GPIO.output(TriggerReset, GPIO.HIGH)
-        time.sleep(0.01)
-        GPIO.output(TriggerReset, GPIO.LOW)
-
-
-    # Checks evry 10 ms (for a total of 1 second) if all RPis respond and are ready. 
-    # Sets trig_0_state to false if all RPis are ready (event can keep running)
-    def fifo_signal(self):
-        for i in range(100):
-            if (self.check_in_pins()): # input signals from RPis
-                # need to add (?): send output signal to arduino once all RPi_State == Active
-                for i in range(len(InPins)):
-                    self.set_status_on(i)
-                self.buttonstart.grid_forget()
-                self.buttonstart = ttk.Button(self.master, text='Start Event', state=DISABLED)
-                self.buttonstart.grid(row=12, column=0, padx=padx, pady=pady)
-                self.buttonsingletake.grid_forget()
-                self.buttonsingletake = ttk.Button(self.master, text='Take Image', state=DISABLED)
-                self.buttonsingletake.grid(row=14, column=0, padx=padx, pady=pady)
-                make_folder()
-                self.trig_0_state = False
-                return False
-            else:
-                time.sleep(0.01)
-        self.trig_0_state = True
-        return True
-
-
-    # Recursively calls itself (keeps the event running) until timer exceeds max time,
-    # Stop Event button is pressed, Trigger_latch is enabled, or one of the RPi pins becomes inactive
-    def iterate(self):
-        self.event_time = time.perf_counter() - self.tic
-        self.latch_status = GPIO.input(TriggerLatch)
-        if self.latch_status:
-            print('trigger latched')
-            self.save_event()
-        elif (self.event_time > self.max_time or self.trig_0_state or (not self.check_in_pins())):
-            GPIO.output(EndEvent, GPIO.HIGH)
-            time.sleep(0.01)
-            GPIO.output(EndEvent, GPIO.LOW)
-            self.master.after(10, self.iterate)
-        else: 
-            self.show_time.set('Event Time: '+str(round(self.event_time, 4)))
-            self.master.after(10, self.iterate)
-
-
-    # If Man_Trigger button is pressed, sets trig_0_state to true and ends the event
-    # before timer passes max time.
-    def set_trig(self):
-        self.trig_0_state = True
+        self.status_labels[cam].configure(background='red')
 
 
-    # The function that is called by the Start Event button
+    # The function that is called by the Start Event button. Reads the entry boxes
+    # --- and asks the event control thread to start an event.
     def run_event(self):
-        # Reset error label
-        self.error.grid_forget()
-        self.error = ttk.Label(self.master, text='')
-        self.error.grid(row=25, column=0, padx=padx, pady=pady)
-
-        # Output signal sent to RPis (state_com)
-        for i in range(len(StateCom)):
-            GPIO.output(StateCom[i], GPIO.HIGH)
-
-        # Check if trigger latch is enabled then check that all RPis are active
-        self.send_trig_reset()
-        self.disable_trig_enable()
-        self.latch_status = GPIO.input(TriggerLatch)
-
-        if not self.latch_status:
-            fifo_status = self.fifo_signal()
-        else: fifo_status = True
-
-        # If above checks pass: save max_time (error if invalid input), send a trig_reset signal, 
-        # --- switch state of buttons to start and stop the event, start the timer, send trig enable signal
-        # --- after time set in the trig_enable entry box, and call iterate to run the timer.
-        if (not self.latch_status) and (not fifo_status):
-            try:
-                self.run_state = True
-                self.max_time = float(self.max_time_entry.get())
-                self.send_trig_reset()
-                self.buttonmantrig.grid_forget()
-                self.buttonmantrig = ttk.Button(self.master, text='Stop Event', command=self.set_trig)
-                self.buttonmantrig.grid(row=13, column=0, padx=padx, pady=pady)
-                self.tic = time.perf_counter()
-                self.master.after(int(float(self.trig_enable_time_entry.get())*1000), self.send_trig_enable)
-                self.iterate()
-            except ValueError:
-                self.error = ttk.Label(self.master, text='Error: Invalid input!')
-                self.error.grid(row=25, column=0, padx=padx, pady=pady)
-                for i in range(len(StateCom)):
-                    GPIO.output(StateCom[i], GPIO.LOW)
-
-        # If either of the above checks fail: reset error label, if the trig_latch is enabled, print 
-        # --- error for trig_latch and send a trig_reset signal to reset latch. The user can then re-run 
-        # --- the event. If one of the RPi pins is inactive, error label and update status labels of RPis
-        # --- to indicate which RPi is inactive. Call cleanup to reset GPIO and RPi status.
-        else:
-            # Initializing soft link to the dump folder
-            os.symlink('/home/pi/camera-data/dump', 'temp')
-            os.rename('temp', '/home/pi/camera-data/Images')
-            self.error.grid_forget()
-            self.error = ttk.Label(self.master, text='')
-            self.error.grid(row=25, column=0, padx=padx, pady=pady)
-            if self.latch_status:
-                label = self.error.cget('text')
-                label = label + 'Trigger Latch enabled,\nTrigger Reset signal sent.\nPlease try again.\n'
-                self.error.configure(text=label)
-            if fifo_status:
-                label = self.error.cget('text')
-                label = label + 'Error: Inactive RPi!\n'
-                self.error.configure(text=label)
-            self.run_state = False
-            self.cleanup() 
-
-
-    # Create a text file with info on Max Time, run time, and what 
-    # --- caused the event to end. Call cleanup.
-    def save_event(self):
-        # Saving information
-        global today
-        global index
-        f = open(curr_directory+'/info.txt', 'x+')
-        f.write('Date: '+today+'\n')
-        f.write('Event: '+str(index)+'\n')
-        f.write('Time Saved: '+datetime.now().strftime('%H:%M:%S')+'\n')
-        f.write('Trigger Enable Time: '+str(self.trig_enable_time_entry.get())+'\n')
-        f.write('Max Time: '+str(self.max_time)+'\n')
-        f.write(self.show_time.get()+'\n')
-        f.write('End condition: ')
-        if self.event_time > self.max_time:
-            f.write('Exceeded max time; ')
-        if self.trig_0_state:
-            f.write('Man_Trigger button pressed; ')
-        if not self.check_in_pins():
-            f.write('Camera(s) ')
-            for i in range(len(InPins)):
-                if not GPIO.input(InPins[i]):
-                    f.write(str(i+1)+' ')
-            f.write('were inactive; ')
-        if self.latch_status:
-            f.write('Trigger_latch was enabled')
-        f.close()
-        print('Saved!')
-        self.cleanup()
-
-
-    # Set the status of all the RPi pins before turning off the state_com (useful for determining 
-    # --- which RPi(s) failed, if any, before some other method for ending the event). Set state_com 
-    # --- to inactive. Turn off trig_enable signal. Send a trig_reset and EndEvent signal. Call wait_for_end.
-    def cleanup(self):
-        for i in range(len(InPins)):
-            if not GPIO.input(InPins[i]):
-                self.set_status_off(i)
-            else: self.set_status_neutral(i)
-        for i in range(len(StateCom)):
-            GPIO.output(StateCom[i], GPIO.LOW)
-        self.disable_trig_enable()
-        GPIO.output(EndEvent, GPIO.HIGH)
-        time.sleep(1)
-        GPIO.output(EndEvent, GPIO.LOW)
-        self.send_trig_reset()
-        if self.run_state:
-            self.waiting_label = ttk.Label(self.master, text='Waiting for RPis to save...')
-            self.waiting_label.grid(row=26, column=0, padx=padx, pady=pady)
-            self.buttonmantrig.grid_forget()
-            self.buttonmantrig = ttk.Button(self.master, text='Stop Event', state=DISABLED)
-            self.buttonmantrig.grid(row=13, column=0, padx=padx, pady=pady)
-            self.buttonsingletake.grid_forget()
-            self.buttonsingletake = ttk.Button(self.master, text='Take Image', state=DISABLED)
-            self.buttonsingletake.grid(row=14, column=0, padx=padx, pady=pady)
-        self.wait_for_end()
-
-
-    # Waits until all RPis are inactive. This prevents starting a new event before 
-    # --- camera's are done saving their images by keeping the start event button disabled.
-    def wait_for_end(self):
-        if not self.check_all_in_pins():
-            self.master.after(5, self.wait_for_end)
-        else: self.reset_buttons()
-
-
-    # Reset the start and stop event buttons
-    def reset_buttons(self):
-        if self.waiting_label.winfo_exists():
-            self.waiting_label.grid_forget()
-        self.buttonstart.grid_forget()
-        self.buttonstart = ttk.Button(self.master, text='Start Event', command=self.run_event)
-        self.buttonstart.grid(row=12, column=0, padx=padx, pady=pady)
-        self.buttonmantrig.grid_forget()
-        self.buttonmantrig = ttk.Button(self.master, text='Stop Event', state=DISABLED)
-        self.buttonmantrig.grid(row=13, column=0, padx=padx, pady=pady)
-        self.buttonsingletake.grid_forget()
-        self.buttonsingletake = ttk.Button(self.master, text='Take Image', command=self.trig_enable_pulse)
-        self.buttonsingletake.grid(row=14, column=0, padx=padx, pady=pady)
-
-
-    # Clears GPIO pins and closes tkinter window
+        try:
+            max_time = float(self.max_time_entry.get())
+            trig_enable_time = float(self.trig_enable_time_entry.get())
+        except ValueError:
+            self.error.configure(text='Error: Invalid input!')
+            return
+        self.error.configure(text='')
+        self.buttonstart.config(state=DISABLED)
+        self.buttonsingletake.config(state=DISABLED)
+        self.control.start_event(max_time, trig_enable_time)
+
+
+    # Called by the Autorun button. Same as Start Event, but the event control thread keeps
+    # --- starting events until the number of events is reached, autorun is stopped or (with
+    # --- 'Stop Autorun on Error') an event fails.
+    def autorun(self):
+        try:
+            max_time = float(self.max_time_entry.get())
+            trig_enable_time = float(self.trig_enable_time_entry.get())
+            events = int(float(self.autorun_events_entry.get()))
+        except ValueError:
+            self.error.configure(text='Error: Invalid input!')
+            return
+        self.error.configure(text='')
+        self.buttonstart.config(state=DISABLED)
+        self.buttonsingletake.config(state=DISABLED)
+        self.buttonautorun.config(state=DISABLED)
+        self.control.start_autorun(events, max_time, trig_enable_time, bool(self.stop_on_error.get()))
+
+
+    # Called every DisplayInterval ms. Takes the snapshots sent by the event control thread since
+    # --- the last refresh, updates the widgets when the state changed and redraws the event time.
+    def refresh(self):
+        snapshot = None
+        while not self.control.snapshots.empty():
+            snapshot = self.control.snapshots.get_nowait()
+            if (snapshot.state != self.state or snapshot.statuses != self.statuses
+                    or snapshot.autorun_state != self.autorun_state or snapshot.error != self.error_text
+                    or snapshot.refusals != self.refusals):
+                self.show_state(snapshot)
+        if snapshot is not None:
+            self.show_time.set('Event Time: '+str(round(snapshot.event_time, 4)))
+            self.autorun_label.configure(text=snapshot.autorun)
+            self.storage_label.configure(text=snapshot.storage)
+            for label, cam, hz in zip(self.status_labels, cameras.active(), snapshot.heartbeats):
+                label.configure(text=cam.name if hz is None else '{} {:.1f} Hz'.format(cam.name, hz))
+        self.master.after(DisplayInterval, self.refresh)
+
+
+    def show_state(self, snapshot):
+        self.state = snapshot.state
+        self.directory = snapshot.directory
+        for i, status in enumerate(snapshot.statuses):
+            if status != self.statuses[i]:
+                if status is None:
+                    self.set_status_neutral(i)
+                elif status:
+                    self.set_status_on(i)
+                else: self.set_status_off(i)
+        self.statuses = list(snapshot.statuses)
+        self.error.configure(text=snapshot.error or snapshot.refused)
+        self.error_text = snapshot.error
+        self.refusals = snapshot.refusals
+        if snapshot.state == WAITING and not snapshot.error:
+            self.waiting_label.configure(text='Waiting for RPis to save...')
+        else: self.waiting_label.configure(text='')
+        self.autorun_state = snapshot.autorun_state
+        autorun = snapshot.autorun_state in ('running', 'paused')
+        idle = snapshot.state == IDLE and not autorun
+        self.buttonstart.config(state=NORMAL if idle else DISABLED)
+        self.buttonsingletake.config(state=NORMAL if idle else DISABLED)
+        self.buttonautorun.config(state=NORMAL if idle else DISABLED)
+        self.buttonmantrig.config(state=NORMAL if snapshot.state == LIVE else DISABLED)
+        self.buttonstopautorun.config(state=NORMAL if autorun else DISABLED)
+        if snapshot.autorun_state == 'paused':
+            self.buttonpause.config(text='Resume Autorun', command=self.control.resume_autorun, state=NORMAL)
+        else: self.buttonpause.config(text='Pause Autorun', command=self.control.pause_autorun, state=NORMAL if autorun else DISABLED)
+
+
+    # Stops the event control thread (which cleans up the GPIO pins) and closes tkinter window
     def leave(self):
-        os.symlink('/home/pi/camera-data/dump', 'temp')
-        os.rename('temp', '/home/pi/camera-data/Images')
-        self.cleanup()
-        GPIO.cleanup()
-        tk_root.quit()
+        self.control.quit()
+        self.control.join()
+        self.master.quit()
         exit()
 
 
-# Makes new folder for current event and sets softlink to the created folder
-curr_directory = 'temp'
-today = ''
-index = 0
-def make_folder():
-    global curr_directory
-    global today
-    global index
-    now = datetime.now()
-    today = now.strftime('%Y') + now.strftime('%m') + now.strftime('%d')
-
-    try:
-        os.mkdir('/home/pi/camera-data/'+ today)
-    except FileExistsError:
-        print('Directory for today already exists')
-
-    # Determine how many folders events are already in the folder to 
-    # make a new folder with updated index
-    index = 0
-    for root, dirs, files in os.walk('/home/pi/camera-data/' + today):
-        for d in dirs:
-            index += 1
-    try:
-        os.mkdir('/home/pi/camera-data/'+ today + '/' + str(index))
-    except Exception as e:
-        print(e)
-
-    # Create the symbolic (aka soft) link to the newly created folder
-    curr_directory = '/home/pi/camera-data/'+ today +'/'+str(index)
-    os.symlink(curr_directory, 'temp')
-    os.rename('temp', '/home/pi/camera-data/Images')
-    print('Made directory: ', curr_directory)
-
-
-# Making the tab
-event = EB(tab1)
-
-
 
 ##############################################
 ######### Tab 2: Camera Settings #############
 ##############################################
 
 ### Makes a new tab with several entry boxes to adjust the camera configX.json files. 
-### Makes three config files, one for each camera. All config files have the same settings
+### Makes one config file for each camera in the registry. All config files have the same settings
 ### --- except for 'cam_name'
 
-# Setting labels on the left side
-ttk.Label(tab2, text='Exposure: ').grid(row=10, column=0, padx=padx, pady=pady)
-ttk.Label(tab2, text='Buffer Length: ').grid(row=11, column=0, padx=padx, pady=pady)
-ttk.Label(tab2, text='Frames After: ').grid(row=12, column=0, padx=padx, pady=pady)
-ttk.Label(tab2, text='ADC Threshold: ').grid(row=13, column=0, padx=padx, pady=pady)
-ttk.Label(tab2, text='Pixel Threshold: ').grid(row=14, column=0, padx=padx, pady=pady)
-
-
-# The following entry boxes can have their minimum and maximum values set (using from_, to) 
-# --- as well as how much to increment by and how many digits and decimal positions to show (format)
-
-# Exposure entry box
-exposure_spinbox = ttk.Spinbox(master=tab2, width=10, from_=0, to=10000, increment=10, format='%5.0f')
-exposure_spinbox.insert(0, 300)
-exposure_spinbox.grid(row=10, column=1)
-
-# Buffer Length entry box
-buffer_spinbox = ttk.Spinbox(master=tab2, width=10, from_=0, to=10000, increment=10, format='%5.0f')
-buffer_spinbox.insert(0, 100)
-buffer_spinbox.grid(row=11, column=1)
-
-# Frames after entry box
-fafter_spinbox = ttk.Spinbox(master=tab2, width=10, from_=0, to=10000, increment=10, format='%5.0f')
-fafter_spinbox.insert(0, 50)
-fafter_spinbox.grid(row=12, column=1)
-
-# ADC Threshold entry box
-adc_spinbox = ttk.Spinbox(master=tab2, width=10, from_=0, to=10000, increment=10, format='%5.0f')
-adc_spinbox.insert(0, 10)
-adc_spinbox.grid(row=13, column=1)
-
-# Pixel Threshold entry box
-pix_spinbox = ttk.Spinbox(master=tab2, width=10, from_=0, to=10000, increment=10, format='%5.0f')
-pix_spinbox.insert(0, 300)
-pix_spinbox.grid(row=14, column=1)
-
-
-# Makes the config dictionary for each config.json file.
-# Some values are set as their defaults and cannot be changed (yet) by the event builder.
-config = {}
-def make_config(cam):
-    config['exposure'] = int(exposure_spinbox.get())
-    config["resolution"] = [1280,800]
-    config["frame_sync"] = True
-    config["mode"] = 11 #5
-    config["buffer_len"] = int(buffer_spinbox.get())
-    config["frames_after"] = int(fafter_spinbox.get())
-    config["adc_threshold"] = int(adc_spinbox.get())
-    config["pix_threshold"] = int(pix_spinbox.get())
-    config["save_path"] = "/mnt/event-builder/Images/"
-    config["config_path"]= "/mnt/event-builder/cam"+str(cam)+"-config.json"
-    config["cam_name"] = 'cam'+str(cam)
-    config["image_format"] = ".bmp"
-    config["date_format"] = "%Y-%m-%d_%H:%M:%S"
-    config["input_pins"] = {"state_com": 5,
-                            "trig_en": 6,
-                            "trig_latch": 13}
-    config["output_pins"] = {"state": 23,
-                            "trig": 24}
-
-
-# Function that is called by the save button. 
-# Overwrites the pre-existing config.json files or creates new ones.
-def save_config():
-    for i in range(3):
-        config_path = '/home/pi/camera-data/cam'+str(i)+'-config.json'
-        make_config(i)
-        with open(config_path, 'w') as f:
-            json.dump(config, f, indent=2)
-    save_label = ttk.Label(tab2, text='Saved!')
-    save_label.grid(row=101, column=1, padx=padx, pady=pady)
-    save_label.after(1000, save_label.destroy)
-
-save_button = ttk.Button(tab2, text='Save', command=save_config)
-save_button.grid(row=100, column=1, padx=padx, pady=pady)
+# (label, setting, maximum, increment) of the entry boxes, top to bottom
+SettingFields = [
+    ('Exposure: ', 'exposure', 10000, 10),
+    ('Buffer Length: ', 'buffer_len', 10000, 10),
+    ('Frames After: ', 'frames_after', 10000, 10),
+    ('ADC Threshold: ', 'adc_threshold', 10000, 10),
+    ('Pixel Threshold: ', 'pix_threshold', 10000, 10),
+    ('Sensor Mode: ', 'mode', 20, 1),
+    ('Width: ', 'width', 10000, 16),
+    ('Height: ', 'height', 10000, 16),
+    ('ROI x: ', 'roi_x', 10000, 16),
+    ('ROI y: ', 'roi_y', 10000, 16),
+    ('ROI Width (0: full): ', 'roi_width', 10000, 16),
+    ('ROI Height (0: full): ', 'roi_height', 10000, 16),
+    ('Binning: ', 'binning', 4, 1),
+]
+
+# Buffer planner: the longest buffer_len for the pre-trigger time that every camera has the RAM for,
+# --- checked against the save budget at the write bandwidth the EB has measured (see config.plan_buffer).
+# The save budget is also the one events wait on (see storage.py), so changing it applies straight away.
+# (label, setting, maximum, increment, default) of its entry boxes
+PlanFields = [
+    ('Pre-trigger (ms, 0: max): ', 'pre_trigger', 100000, 10, 500),
+    ('Save budget (s, 0: none): ', 'save_budget', 600, 1, None),
+]
+
+class CS:
+    def __init__(self, master, control):
+        self.master = master
+        self.control = control
+
+        # The entry boxes can have their minimum and maximum values set (using from_, to)
+        # --- as well as how much to increment by and how many digits and decimal positions to show (format)
+        self.spinboxes = {}
+        for row, (label, name, to, increment) in enumerate(SettingFields, 10):
+            ttk.Label(self.master, text=label).grid(row=row, column=0, padx=padx, pady=pady)
+            self.spinboxes[name] = ttk.Spinbox(master=self.master, width=10, from_=0, to=to, increment=increment,
+                                               format='%5.0f', command=self.show_estimate)
+            self.spinboxes[name].insert(0, config.DefaultSettings[name])
+            self.spinboxes[name].grid(row=row, column=1)
+            self.spinboxes[name].bind('<KeyRelease>', lambda e: self.show_estimate())
+
+        # What the settings cost per camera (frame rate, memory, bytes per event), updated as they are changed
+        self.estimate_label = ttk.Label(self.master, text='', justify=LEFT)
+        self.estimate_label.grid(row=90, column=0, columnspan=3, padx=padx, pady=pady)
+
+        self.plan_boxes = {}
+        for row, (label, name, to, increment, default) in enumerate(PlanFields, 30):
+            ttk.Label(self.master, text=label).grid(row=row, column=0, padx=padx, pady=pady)
+            self.plan_boxes[name] = ttk.Spinbox(master=self.master, width=10, from_=0, to=to, increment=increment, format='%5.0f')
+            self.plan_boxes[name].insert(0, config.SaveBudget if default is None else default)
+            self.plan_boxes[name].grid(row=row, column=1)
+        self.plan_boxes['save_budget'].config(command=self.set_save_budget)
+        self.plan_boxes['save_budget'].bind('<KeyRelease>', lambda e: self.set_save_budget())
+
+        self.plan_label = ttk.Label(self.master, text='', justify=LEFT)
+        self.plan_label.grid(row=33, column=0, columnspan=3, padx=padx, pady=pady)
+        self.plan_button = ttk.Button(self.master, text='Plan Buffer', command=self.plan_buffer)
+        self.plan_button.grid(row=32, column=1, padx=padx, pady=pady)
+
+        # Thresholds from the trigger tuner (see eventbuilder/tuner.py): puts the best adc/pix_threshold pair it
+        # --- found in their boxes, to be saved like any other setting
+        self.tuning_label = ttk.Label(self.master, text='', justify=LEFT)
+        self.tuning_label.grid(row=35, column=0, columnspan=3, padx=padx, pady=pady)
+        self.tuning_button = ttk.Button(self.master, text='Use Tuned Thresholds', command=self.use_tuning)
+        self.tuning_button.grid(row=34, column=1, padx=padx, pady=pady)
+
+        self.save_button = ttk.Button(self.master, text='Save', command=self.save_config)
+        self.save_button.grid(row=100, column=1, padx=padx, pady=pady)
+        self.show_estimate()
+
+
+    def settings_from_tab(self):
+        return {name: int(float(box.get())) for name, box in self.spinboxes.items()}
+
+
+    def set_save_budget(self):
+        try:
+            config.SaveBudget = float(self.plan_boxes['save_budget'].get())
+        except ValueError:
+            pass
+
+
+    # Function that is called by the plan button. Puts the planned buffer_len in its box and saves the config.
+    def plan_buffer(self):
+        try:
+            pre_trigger = float(self.plan_boxes['pre_trigger'].get())/1e3
+            plan = config.plan_buffer(self.settings_from_tab(), pre_trigger or None, bandwidth=self.control.storage.bandwidth())
+        except ValueError as e:
+            self.plan_label.config(text='Error: ' + str(e))
+            return
+        self.plan_label.config(text=config.format_plan(plan))
+        self.spinboxes['buffer_len'].delete(0, 'end')
+        self.spinboxes['buffer_len'].insert(0, plan['buffer_len'])
+        self.show_estimate()
+        self.save_config()
+
+
+    def use_tuning(self):
+        try:
+            result = tuner.best(tuner.load_results())
+        except (OSError, ValueError) as e:
+            self.tuning_label.config(text='No tuning results: ' + str(e))
+            return
+        if result is None:
+            self.tuning_label.config(text='No tuning results')
+            return
+        for name in ('adc_threshold', 'pix_threshold'):
+            self.spinboxes[name].delete(0, 'end')
+            self.spinboxes[name].insert(0, result[name])
+        self.tuning_label.config(text=tuner.format_result(result))
+        self.show_estimate()
+
+
+    def show_estimate(self):
+        try:
+            settings = self.settings_from_tab()
+            lines = ['{}: {}'.format(cam.name, config.format_estimate(config.estimate(config.make_config(cam, settings))))
+                     for cam in cameras.active()]
+        except ValueError as e:
+            lines = ['Error: ' + str(e)]
+        self.estimate_label.config(text='\n'.join(lines))
+
+
+    # Function that is called by the save button.
+    # Writes the config files that changed (see config.py), the cameras pick them up from there.
+    def save_config(self):
+        try:
+            saved = config.save_config(self.settings_from_tab())
+        except ValueError as e:
+            self.estimate_label.config(text='Error: ' + str(e))
+            return
+        changed = [name + ' v' + str(version) for name, (version, digest, written) in saved.items() if written]
+        save_label = ttk.Label(self.master, text='Saved ' + ', '.join(changed) if changed else 'Unchanged')
+        save_label.grid(row=101, column=1, padx=padx, pady=pady)
+        save_label.after(1000, save_label.destroy)
 
 
 
@@ -538,60 +400,49 @@ save_button.grid(row=100, column=1, padx=padx, pady=pady)
 ### --- Then you can hit play and view the images the same as before.
 
 class PI:
-    def __init__(self, master):
+    def __init__(self, master, event):
         self.master = master
-        self.img0_list = []
-        self.img1_list = []
-        self.img2_list = []
-        self.img0_names = []
-        self.img1_names = []
-        self.img2_names = []
+        self.event = event
+        # One pane per camera in the registry: image and name lists, the selection and the labels
+        self.cams = cameras.active()
+        self.img_lists = [[] for cam in self.cams]
+        self.img_names = [[] for cam in self.cams]
         self.img_number = 0
         self.baseheight = 300
+        self.catalog = Catalog()
+
+        self.cam_selected = [tk.IntVar() for cam in self.cams]
+
+        self.name_labels = [ttk.Label(self.master) for cam in self.cams]
+        self.img_labels = [ttk.Label(self.master) for cam in self.cams]
+        for i in range(len(self.cams)):
+            self.name_labels[i].grid(row=10, column=10+5*i, columnspan=5, padx=padx, pady=pady)
+            self.img_labels[i].grid(row=11, column=10+5*i, columnspan=5, padx=padx, pady=pady)
 
-        self.cam0 = tk.IntVar()
-        self.cam1 = tk.IntVar()
-        self.cam2 = tk.IntVar()
-
-        self.img0_name = ttk.Label(tab3)
-        self.img1_name = ttk.Label(tab3)
-        self.img2_name = ttk.Label(tab3)
-        self.img0 = ttk.Label(tab3)
-        self.img1 = ttk.Label(tab3)
-        self.img2 = ttk.Label(tab3)
-
-        self.img0_name.grid(row=10, column=10, columnspan=5, padx=padx, pady=pady)
-        self.img0.grid(row=11, column=10, columnspan=5, padx=padx, pady=pady)
-        self.img1_name.grid(row=10, column=15, columnspan=5, padx=padx, pady=pady)
-        self.img1.grid(row=11, column=15, columnspan=5, padx=padx, pady=pady)
-        self.img2_name.grid(row=10, column=20, columnspan=5, padx=padx, pady=pady)
-        self.img2.grid(row=11, column=20, columnspan=5, padx=padx, pady=pady)
-
-        self.button_play = ttk.Button(tab3, text='Play', command=self.init_play, state=DISABLED)
+        self.button_play = ttk.Button(self.master, text='Play', command=self.init_play, state=DISABLED)
         self.button_play.grid(row=20, column=17, padx=padx, pady=pady)
 
-        self.button_forward = ttk.Button(tab3, text='>>', command=self.forward, state=DISABLED)
-        self.button_back = ttk.Button(tab3, text='<<', command=self.back, state=DISABLED)
+        self.button_forward = ttk.Button(self.master, text='>>', command=self.forward, state=DISABLED)
+        self.button_back = ttk.Button(self.master, text='<<', command=self.back, state=DISABLED)
         self.button_back.grid(row=20, column=16, padx=padx, pady=pady)
         self.button_forward.grid(row=20, column=18, padx=padx, pady=pady)
 
-        ttk.Label(tab3, text='Camera Select: ').grid(row=31, column=14, columnspan=2, padx=padx, pady=pady)
-        Checkbutton(tab3, text='Cam0', variable=self.cam0).grid(row=31, column=16, padx=padx, pady=pady)
-        Checkbutton(tab3, text='Cam1', variable=self.cam1).grid(row=31, column=17, padx=padx, pady=pady)
-        Checkbutton(tab3, text='Cam2', variable=self.cam2).grid(row=31, column=18, padx=padx, pady=pady)
+        ttk.Label(self.master, text='Camera Select: ').grid(row=31, column=14, columnspan=2, padx=padx, pady=pady)
+        for i, cam in enumerate(self.cams):
+            Checkbutton(self.master, text=cam.name, variable=self.cam_selected[i]).grid(row=31, column=16+i, padx=padx, pady=pady)
 
-        self.button_reload = ttk.Button(tab3, text='Reload', command=self.reload)
+        self.button_reload = ttk.Button(self.master, text='Reload', command=self.reload)
         self.button_reload.grid(row=34, column=17, padx=padx, pady=pady)
 
-        ttk.Label(tab3, text='Interval: ').grid(row=32, column=14, padx=padx, pady=pady)
-        self.interval_spinbox = ttk.Spinbox(master=tab3, width=20, from_=0, to=10000, increment=10, format='%5.0f')
+        ttk.Label(self.master, text='Interval: ').grid(row=32, column=14, padx=padx, pady=pady)
+        self.interval_spinbox = ttk.Spinbox(master=self.master, width=20, from_=0, to=10000, increment=10, format='%5.0f')
         self.interval_spinbox.insert(0, 1)
         self.interval_spinbox.grid(row=32, column=16, columnspan=3)
 
-        button_select_dir = ttk.Button(tab3, text='Choose directory', command=self.load_dir)
+        button_select_dir = ttk.Button(self.master, text='Choose directory', command=self.load_dir)
         button_select_dir.grid(row=33, column=17, padx=padx, pady=pady)
 
-        self.directory_label = ttk.Label(tab3, text='CurrDir: ')
+        self.directory_label = ttk.Label(self.master, text='CurrDir: ')
         self.directory_label.grid(row=35, column=15, columnspan=5, padx=padx, pady=pady)
 
         self.active_state = False
@@ -599,52 +450,42 @@ class PI:
 
 
     def load_dir(self):
-        self.directory = fd.askdirectory(parent=tk_root, initialdir=curr_directory)
+        self.directory = fd.askdirectory(parent=self.master, initialdir=self.event.directory)
         self.reload()
 
 
     # Resets the names list, images list, name labels, and image labels then reloads the 
     # new names and image lists of the cameras that are selected.
     def reload(self):
-        self.img0_list = []
-        self.img1_list = []
-        self.img2_list = []
-        self.img0_names = []
-        self.img1_names = []
-        self.img2_names = []
-        self.img0_name.config(text='')
-        self.img0.config(image=None)
-        self.img1_name.config(text='')
-        self.img1.config(image=None)
-        self.img2_name.config(text='')
-        self.img2.config(image=None)
         self.img_number = 0
-        if self.cam0.get():
-            self.img0_list, self.img0_names = self.image_walk(self.directory, 0)
-        if self.cam1.get():
-            self.img1_list, self.img1_names = self.image_walk(self.directory, 1)
-        if self.cam2.get():
-            self.img2_list, self.img2_names = self.image_walk(self.directory, 2)
+        for i, cam in enumerate(self.cams):
+            self.img_lists[i] = []
+            self.img_names[i] = []
+            self.name_labels[i].config(text='')
+            self.img_labels[i].config(image='')
+            if self.cam_selected[i].get():
+                self.img_lists[i], self.img_names[i] = self.image_walk(self.directory, cam.number)
         self.directory_label.config(text='CurrDir: '+str(self.directory))
         self.button_play.config(state=NORMAL)        
 
 
     # Sorts the images in a directory and adds them to the image list and name list. The images and
     # names should have the same index since both are created by the same filename.
+    # The file names come from the catalog (see eventbuilder/catalog.py) instead of listing the directory,
+    # --- and packed events are read from their pack.
     def image_walk(self, directory, camera):
         image_list = []
         name_list = []
         os.chdir(directory)
-        for filename in sorted(glob.glob('*.bmp')):
-            if filename[3] == str(camera):
-                # rescaling images to height = baseheight pixels
-                img = Image.open(filename)
-                hpercent = (self.baseheight / float(img.size[1]))
-                wsize = int((float(img.size[0]) * float(hpercent)))
-                img = img.resize((wsize, self.baseheight), Image.ANTIALIAS)
-                image = ImageTk.PhotoImage(img)
-                image_list.append(image)
-                name_list.append(filename)
+        for filename in self.catalog.frame_names(directory, camera):
+            # rescaling images to height = baseheight pixels
+            img = Image.open(open_frame(directory, filename))
+            hpercent = (self.baseheight / float(img.size[1]))
+            wsize = int((float(img.size[0]) * float(hpercent)))
+            img = img.resize((wsize, self.baseheight), Image.ANTIALIAS)
+            image = ImageTk.PhotoImage(img)
+            image_list.append(image)
+            name_list.append(filename)
         return image_list, name_list   
 
 
@@ -654,24 +495,10 @@ class PI:
         self.active_state = True
         if not self.pause_state:
             self.img_number = 0
-            if self.cam0.get():
-                self.img0_name = ttk.Label(tab3, text=str(self.img0_names[self.img_number]))
-                self.img0 = ttk.Label(tab3, image=self.img0_list[self.img_number])
-                self.img0_name.grid(row=10, column=10, columnspan=5, padx=padx, pady=pady)
-                self.img0.grid(row=11, column=10, columnspan=5, padx=padx, pady=pady)
-            if self.cam1.get():
-                self.img1_name = ttk.Label(tab3, text=str(self.img1_names[self.img_number]))
-                self.img1 = ttk.Label(tab3, image=self.img1_list[self.img_number])
-                self.img1_name.grid(row=10, column=15, columnspan=5, padx=padx, pady=pady)
-                self.img1.grid(row=11, column=15, columnspan=5, padx=padx, pady=pady)
-            if self.cam2.get():
-                self.img2_name = ttk.Label(tab3, text=str(self.img2_names[self.img_number]))
-                self.img2 = ttk.Label(tab3, image=self.img2_list[self.img_number])
-                self.img2_name.grid(row=10, column=20, columnspan=5, padx=padx, pady=pady)
-                self.img2.grid(row=11, column=20, columnspan=5, padx=padx, pady=pady)
+            self.scroll()
             self.button_play.config(text='Pause', command=self.pause)
             self.img_number += 1
-            tab3.after(int(self.interval_spinbox.get()), self.play)
+            self.master.after(int(self.interval_spinbox.get()), self.play)
         else: 
             self.button_play.config(text='Pause', command=self.pause)
             self.pause_state = False
@@ -680,12 +507,7 @@ class PI:
 
 
     def find_max(self):
-        max_len = len(self.img0_list)
-        if max_len < len(self.img1_list):
-            max_len = len(self.img1_list)
-        if max_len < len(self.img2_list):
-            max_len = len(self.img2_list)
-        return max_len
+        return max([len(images) for images in self.img_lists], default=0)
 
 
     # Recursively updates calls scroll which updates the images and updates the image number.
@@ -695,21 +517,16 @@ class PI:
         if self.img_number < self.find_max() and self.active_state and not self.pause_state:
             self.scroll()
             self.img_number += 1
-            tab3.after(int(self.interval_spinbox.get()), self.play)      
+            self.master.after(int(self.interval_spinbox.get()), self.play)      
         else:
             self.button_play.config(text='Play', command=self.init_play)
 
 
     def scroll(self):
-        if self.img_number < len(self.img0_list):
-            self.img0_name.config(text=str(self.img0_names[self.img_number]))
-            self.img0.config(image=self.img0_list[self.img_number])
-        if self.img_number < len(self.img1_list):
-            self.img1_name.config(text=str(self.img1_names[self.img_number]))
-            self.img1.config(image=self.img1_list[self.img_number])
-        if self.img_number < len(self.img2_list):
-            self.img2_name.config(text=str(self.img2_names[self.img_number]))
-            self.img2.config(image=self.img2_list[self.img_number])
+        for i in range(len(self.cams)):
+            if self.img_number < len(self.img_lists[i]):
+                self.name_labels[i].config(text=str(self.img_names[i][self.img_number]))
+                self.img_labels[i].config(image=self.img_lists[i][self.img_number])
 
 
     def pause(self, event=None):
@@ -745,14 +562,53 @@ class PI:
             self.button_back.config(state=DISABLED)
 
 
-image_viewer = PI(tab3)
-
-
-tk_root.bind('<Left>', image_viewer.back)
-tk_root.bind('<Right>', image_viewer.forward)
-tk_root.bind('<space>', image_viewer.init_play)
-
 ##############################################
 ##############################################
 
-tk_root.mainloop()
\ No newline at end of file
+# Everything with side effects (the command line, the GPIO pins, the Tk window) happens in main: the
+# --- packer's worker processes are spawned, and a spawned process imports this script again (as
+# --- __mp_main__), which must not touch the pins or open a second window.
+def main():
+    # Command line: the engine options shared with eb-run (see eventbuilder/options.py). The GPIO backend is
+    # --- 'rpi' (RPi.GPIO, default), 'mmap' (direct register access through /dev/gpiomem) or 'sim' (no
+    # --- hardware, for trying out the GUI)
+    parser = argparse.ArgumentParser(description='SBC Event Builder')
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    # Tkinter setup
+    tk_root = tk.Tk()
+    tk_root.title('Event Builder')
+    tabControl = ttk.Notebook(tk_root)
+    tab1 = ttk.Frame(tabControl)
+    tab2 = ttk.Frame(tabControl)
+    tab3 = ttk.Frame(tabControl)
+    tab3 = ttk.Frame(tabControl)
+    tabControl.add(tab1, text='Run Event')
+    tabControl.add(tab2, text='Camera Settings')
+    tabControl.add(tab3, text='Image Viewer')
+    tabControl.add(tab3, text='Playback Images')
+    tabControl.pack(expand=1, fill='both')
+
+    # The event control thread that runs the events, with the dump folder as the default save path (trimmed
+    # --- to the newest files in the background, see eventbuilder/dump.py)
+    control = build_control(args)
+
+    # Keeps the catalog of the data directory up to date, for the Playback tab
+    catalog_watcher = Watcher()
+    catalog_watcher.start()
+
+    # Making the tabs
+    event = EB(tab1, control)
+    CS(tab2, control)
+    image_viewer = PI(tab3, event)
+
+    tk_root.bind('<Left>', image_viewer.back)
+    tk_root.bind('<Right>', image_viewer.forward)
+    tk_root.bind('<space>', image_viewer.init_play)
+
+    tk_root.mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+# Event builder engine: run control for the SBC cameras, independent of the Tk front end in eb.py.
+# Importing it has no side effects: nothing touches GPIO or the disk until setup_gpio/EventControl
+# --- are called. eb-run (cli.py) runs events from the command line.
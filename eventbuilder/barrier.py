@@ -0,0 +1,97 @@
+import threading
+import time
+from .hal import BOTH
+
+### Waits for all cameras' state pins to reach the same level: all asserted when starting an event,
+### --- all deasserted once the cameras are done saving. The pins are followed with edge callbacks, so
+### --- the barrier resolves (and on_reached is called, in the GPIO backend's thread) as soon as the
+### --- last camera gets there. reached() also compares against a pin snapshot, so a missed edge is
+### --- only late, never lost. For every wait the time each camera reached the level is kept, which
+### --- shows which Pi is the slowest to get ready or to save.
+
+class ReadinessBarrier:
+    # names are the cameras' names for format() (Cam_0, Cam_1... by default)
+    def __init__(self, gpio, pins, on_reached=None, names=None):
+        self.gpio = gpio
+        self.pins = list(pins)
+        self.names = list(names) if names is not None else ['Cam_'+str(i) for i in range(len(self.pins))]
+        self.on_reached = on_reached
+        self.cond = threading.Condition()
+        self.level = True
+        self.start_ns = time.monotonic_ns()
+        self.levels = gpio.levels(self.pins)
+        self.reached_ns = [None]*len(self.pins)
+        # Time of the latest rising/falling edge of each pin
+        self.assert_ns = [None]*len(self.pins)
+        self.deassert_ns = [None]*len(self.pins)
+        for pin in self.pins:
+            gpio.add_edge_callback(pin, BOTH, self.on_edge)
+
+
+    # Starts waiting for all pins to go to level (True: all asserted, False: all deasserted)
+    def start(self, level):
+        with self.cond:
+            self.level = level
+            self.start_ns = time.monotonic_ns()
+            self.levels = self.gpio.levels(self.pins)
+            self.reached_ns = [self.start_ns if l == level else None for l in self.levels]
+
+
+    def on_edge(self, pin, level, t_ns):
+        i = self.pins.index(pin)
+        with self.cond:
+            self.update(i, level, t_ns)
+            done = self.all_reached()
+            self.cond.notify_all()
+        if done and self.on_reached is not None:
+            self.on_reached()
+
+    def update(self, i, level, t_ns):
+        self.levels[i] = level
+        if level:
+            self.assert_ns[i] = t_ns
+        else: self.deassert_ns[i] = t_ns
+        if level == self.level and self.reached_ns[i] is None:
+            self.reached_ns[i] = t_ns
+
+    def all_reached(self):
+        return all(l == self.level for l in self.levels)
+
+
+    # True once all pins are at the level. Picks up any edges that were missed from a pin snapshot.
+    def reached(self):
+        with self.cond:
+            levels = self.gpio.levels(self.pins)
+            t_ns = time.monotonic_ns()
+            for i in range(len(self.pins)):
+                if levels[i] != self.levels[i]:
+                    self.update(i, levels[i], t_ns)
+            return self.all_reached()
+
+    # Blocks until all pins are at the level or timeout (seconds) has passed. Returns reached().
+    def wait(self, timeout=None):
+        with self.cond:
+            self.cond.wait_for(self.all_reached, timeout)
+        return self.reached()
+
+
+    # Seconds from start() until each pin reached the level (None for pins that have not yet)
+    def latencies(self):
+        return [None if t is None else (t - self.start_ns)/1e9 for t in self.reached_ns]
+
+    # Indices of the pins that are not at the level
+    def missing(self):
+        return [i for i in range(len(self.pins)) if self.levels[i] != self.level]
+
+    # One line summary like 'Cam_0 12.3 ms, Cam_1 15.0 ms, Cam_2 40.1 ms (slowest Cam_2)'
+    def format(self):
+        latencies = self.latencies()
+        parts = []
+        for i, t in enumerate(latencies):
+            parts.append(self.names[i]+(' -' if t is None else ' {:.1f} ms'.format(t*1000)))
+        known = [(t, i) for i, t in enumerate(latencies) if t is not None]
+        if self.missing():
+            parts[-1] += ' (missing ' + ', '.join(self.names[i] for i in self.missing()) + ')'
+        elif known:
+            parts[-1] += ' (slowest ' + self.names[max(known)[1]] + ')'
+        return ', '.join(parts)
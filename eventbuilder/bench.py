@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import tempfile
+import time
+from . import folders, control, timeline
+from .pins import setup_gpio
+from .control import IDLE
+from .options import add_engine_arguments, engine_options, build_control
+from .sim import VirtualCameras
+
+### Event throughput benchmark. Runs the real EventControl state machine in autorun mode against the
+### --- 'sim' GPIO backend and VirtualCameras (sim.py), in a temporary data directory, then reports the
+### --- event rate, live/dead time and the per-phase latency percentiles from the event timeline.
+### Needs no hardware, so it runs on any Linux box (CI included):
+###
+###     python -m eventbuilder.bench --events 20 --save-time 0.2 --json bench.json
+###
+### Exits with 1 if any event failed or nothing happened for timeout seconds (the run is then stopped
+### --- where it hung), so a broken control path fails the job; the numbers in the
+### --- JSON report can be compared between runs to catch slowdowns.
+
+# Runs the benchmark and returns the report as a dict. engine holds the engine options (see options.py,
+# --- engine_options without), the virtual cameras toggle their heartbeat lines at its heartbeat period.
+def run(events=20, max_time=0.2, trig_enable_time=0.05, ready_delay=0.02, save_time=0.2, trigger_after=None,
+        jitter=0.005, end_event_width=None, data_dir=None, timeout=None, frames=0, frame_size=1024000, engine=None):
+    engine = engine or engine_options()
+    data_dir = data_dir or tempfile.mkdtemp(prefix='eb-bench-')
+    os.makedirs(data_dir, exist_ok=True)
+    folders.set_data_dir(data_dir)
+    if end_event_width is not None:
+        control.EndEventWidth = end_event_width
+
+    gpio = setup_gpio('sim')
+    cameras = VirtualCameras(gpio, ready_delay, save_time, trigger_after, jitter=jitter, heartbeat=engine.heartbeat,
+                             frames=frames, frame_size=frame_size)
+    ctl = build_control(engine, gpio)
+    ctl.start()
+    start = time.perf_counter()
+    ctl.start_autorun(events, max_time, trig_enable_time, stop_on_error=False)
+    timed_out = False
+    try:
+        while True:
+            snapshot = ctl.snapshots.get(timeout=timeout)
+            if snapshot.autorun_state == 'finished' and snapshot.state == IDLE:
+                break
+    except queue.Empty:
+        print('Nothing happened for {} s, stopping the run'.format(timeout))
+        timed_out = True
+    elapsed = time.perf_counter() - start
+    autorun = ctl.autorun
+    ctl.quit()
+    ctl.join(timeout)
+    cameras.stop()
+
+    # A run stopped where it hung may not have flushed its timeline yet
+    s = timeline.stats(timeline.load(folders.TimelineFile) if os.path.exists(folders.TimelineFile) else [])
+    report = {
+        'settings': {'events': events, 'max_time': max_time, 'trig_enable_time': trig_enable_time,
+                     'ready_delay': ready_delay, 'save_time': save_time, 'trigger_after': trigger_after,
+                     'jitter': jitter, 'end_event_width': control.EndEventWidth, 'frames': frames,
+                     'frame_size': frame_size, **vars(engine)},
+        'data_dir': folders.DataDir,
+        'elapsed': elapsed,
+        'timed_out': timed_out,
+        'started': autorun.started,
+        'saved': autorun.saved,
+        'errors': autorun.errors,
+        'events_per_s': autorun.saved/elapsed if elapsed else 0,
+        'live_time': sum(s['live']),
+        'dead_time': sum(s['dead']),
+        'live_fraction': sum(s['live'])/elapsed if elapsed else 0,
+        'phases': {},
+    }
+    for name, values in s['phases']:
+        if values:
+            report['phases'][name] = {'n': len(values), 'p50': timeline.percentile(values, 50),
+                                      'p90': timeline.percentile(values, 90), 'p99': timeline.percentile(values, 99),
+                                      'max': values[-1]}
+    return report
+
+
+def format_report(report):
+    lines = []
+    if report['timed_out']:
+        lines.append('Timed out: the run was stopped after {:.2f} s'.format(report['elapsed']))
+    lines.append('{} events in {:.2f} s: {} saved, {} errors, {:.2f} events/s'.format(
+        report['started'], report['elapsed'], report['saved'], report['errors'], report['events_per_s']))
+    lines.append('Live time: {:.2f} s, dead time between events: {:.2f} s, live fraction: {:.1%}'.format(
+        report['live_time'], report['dead_time'], report['live_fraction']))
+    lines.append('')
+    lines.append('{:<36} {:>6} {:>10} {:>10} {:>10} {:>10}'.format('phase (ms)', 'n', 'p50', 'p90', 'p99', 'max'))
+    for name, p in report['phases'].items():
+        lines.append('{:<36} {:>6} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+            name, p['n'], p['p50'], p['p90'], p['p99'], p['max']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eb-bench', description='Benchmark the event cycle against virtual cameras')
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--max-time', type=float, default=0.2, help='event max time in seconds')
+    parser.add_argument('--trig-enable-time', type=float, default=0.05)
+    parser.add_argument('--ready-delay', type=float, default=0.02, help='seconds the cameras take to get ready')
+    parser.add_argument('--save-time', type=float, default=0.2, help='seconds the cameras take to save')
+    parser.add_argument('--trigger-after', type=float, help='trigger this many seconds after trig_enable '
+                                                            '(default: events run to max time)')
+    parser.add_argument('--jitter', type=float, default=0.005, help='random spread added to every camera delay')
+    parser.add_argument('--end-event-width', type=float, help='override EndEventWidth (seconds)')
+    parser.add_argument('--frames', type=int, default=0, help='frames each camera writes per event')
+    parser.add_argument('--frame-size', type=int, default=1024000, help='bytes per frame')
+    parser.add_argument('--data-dir', help='where events are written (default: a new temporary directory)')
+    parser.add_argument('--timeout', type=float, default=60, help='give up if nothing happens for this long')
+    parser.add_argument('--json', metavar='FILE', help='also write the report as JSON')
+    engine = parser.add_argument_group('engine options (on the sim backend)')
+    add_engine_arguments(engine, gpio=False)
+    args = parser.parse_args(argv)
+
+    report = run(args.events, args.max_time, args.trig_enable_time, args.ready_delay, args.save_time,
+                 args.trigger_after, args.jitter, args.end_event_width, args.data_dir, args.timeout,
+                 args.frames, args.frame_size, engine_options(args))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['timed_out'] or report['errors'] or report['saved'] != report['started']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import json
+from collections import namedtuple
+from . import folders
+from .hal import BoardToBCM
+
+### Camera registry. Which cameras the EB runs, and how each is wired, comes from cameras.json in the
+### --- data directory (CamerasFile in folders.py), one entry per camera:
+###
+###     [{"name": "cam0", "state": 18, "state_com": 11, "trig_enable": 16, "heartbeat": 33,
+###       "config": "cam0-config.json", "enabled": true}, ...]
+###
+### state, state_com, trig_enable and heartbeat are BOARD pin numbers (heartbeat may be null if the
+### --- cameras run without heartbeats) and cannot be the EB's own pins (pins.Reserved). name is the
+### --- camera's cam_name, which its frame files start with; it has to be camN, N being the camera's
+### --- number, since that is how the packer, catalog and viewer tell the cameras apart. config is its config
+### --- file in the data directory. A camera's number is its position in the list; disabled cameras
+### --- keep their number but get no pins, no config file and are not waited for.
+### Without cameras.json the three cameras the EB was built with are used (Defaults).
+### load() is called by setup_gpio (pins.py) before anything else looks at the cameras.
+###
+###     python -m eventbuilder.cameras list
+###     python -m eventbuilder.cameras init    (writes Defaults to cameras.json to edit)
+
+Camera = namedtuple('Camera', ['number', 'name', 'state', 'state_com', 'trig_enable', 'heartbeat', 'config', 'enabled'])
+
+Defaults = [
+    Camera(0, 'cam0', 18, 11, 16, 33, 'cam0-config.json', True),
+    Camera(1, 'cam1', 36, 13, 32, 35, 'cam1-config.json', True),
+    Camera(2, 'cam2', 40, 15, 38, 12, 'cam2-config.json', True),
+]
+
+Registry = list(Defaults)
+
+
+# Reads the registry from path (CamerasFile by default), falling back on Defaults if there is none.
+# Raises ValueError for an entry without its pins, pins that are not GPIO pins, are the EB's own or are
+# --- used twice, or a name other than camN.
+def load(path=None):
+    from .pins import Reserved # pins.py imports this module
+    global Registry
+    path = path or folders.CamerasFile
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        Registry = list(Defaults)
+        return Registry
+    cameras = []
+    for number, e in enumerate(entries):
+        try:
+            cameras.append(Camera(number, e.get('name', 'cam'+str(number)), int(e['state']), int(e['state_com']),
+                                  int(e['trig_enable']), None if e.get('heartbeat') is None else int(e['heartbeat']),
+                                  e.get('config', 'cam'+str(number)+'-config.json'), bool(e.get('enabled', True))))
+        except (KeyError, TypeError, ValueError) as err:
+            raise ValueError('{}: camera {}: {!r}'.format(path, number, err))
+        if cameras[-1].name != 'cam' + str(number):
+            raise ValueError('{}: camera {} has to be named cam{} (its frame files are told apart by that)'.format(
+                path, number, number))
+    pins = [p for c in cameras if c.enabled for p in (c.state, c.state_com, c.trig_enable, c.heartbeat) if p is not None]
+    if len(set(pins)) != len(pins):
+        raise ValueError(path + ': a pin is used by more than one camera')
+    for p in pins:
+        if p not in BoardToBCM:
+            raise ValueError('{}: pin {} is not a GPIO pin'.format(path, p))
+        if p in Reserved:
+            raise ValueError('{}: pin {} is the EB\'s {} pin'.format(path, p, Reserved[p]))
+    Registry = cameras
+    return Registry
+
+def save(cameras, path=None):
+    with open(path or folders.CamerasFile, 'w') as f:
+        json.dump([{k: v for k, v in c._asdict().items() if k != 'number'} for c in cameras], f, indent=2)
+
+
+# The enabled cameras, in order. Per-camera lists in the EB (statuses, barrier pins) follow this order.
+def active():
+    return [c for c in Registry if c.enabled]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eb-cameras', description='Show or create the camera registry')
+    parser.add_argument('command', choices=['list', 'init'])
+    parser.add_argument('--file', help='registry file (default: {})'.format(folders.CamerasFile))
+    args = parser.parse_args(argv)
+    if args.command == 'init':
+        save(Defaults, args.file)
+        return
+    print('{:>3} {:<10} {:>5} {:>9} {:>11} {:>9}  {:<20} {}'.format('#', 'name', 'state', 'state_com', 'trig_enable',
+                                                                  'heartbeat', 'config', 'enabled'))
+    for c in load(args.file):
+        print('{:>3} {:<10} {:>5} {:>9} {:>11} {:>9}  {:<20} {}'.format(c.number, c.name, c.state, c.state_com,
+                                                                      c.trig_enable, '-' if c.heartbeat is None else c.heartbeat,
+                                                                      c.config, 'yes' if c.enabled else 'no'))
+
+
+if __name__ == '__main__':
+    main()
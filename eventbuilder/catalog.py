@@ -0,0 +1,402 @@
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import sqlite3
+import struct
+import threading
+import time
+from . import folders
+from .packer import PackName, Pack, camera_of, is_frame, frame_names as packer_frame_names
+
+### Catalog of the event data under DataDir: day -> event -> files, with the camera, size and mtime of
+### --- every file, kept in an SQLite file (CatalogDB in folders.py). Listing a day, opening an event or
+### --- adding up the disk usage is then a lookup instead of a walk over the image tree.
+### The Watcher thread keeps it up to date from inotify: it watches DataDir, the day directories and
+### --- the event directories of the latest day (and every new one), and updates a file when it is
+### --- closed after writing, moved or deleted. Every rescan_interval it also rescans, which only
+### --- lists the event directories whose mtime changed; that catches what inotify cannot see
+### --- (watch limits, queue overflows, older days changed by hand) and is all it does where inotify
+### --- is not available.
+###
+###     python -m eventbuilder.catalog days | events DATE | files DATE EVENT | usage | rescan
+
+# Bumped when the tables change; the catalog is rebuilt from the disk when it does not match
+SchemaVersion = 2
+
+Schema = '''
+CREATE TABLE IF NOT EXISTS dirs (
+    date     TEXT NOT NULL,
+    idx      INTEGER NOT NULL,
+    mtime_ns INTEGER,
+    PRIMARY KEY (date, idx)
+);
+CREATE TABLE IF NOT EXISTS files (
+    date     TEXT NOT NULL,
+    idx      INTEGER NOT NULL,
+    name     TEXT NOT NULL,
+    packed   INTEGER NOT NULL,
+    cam      INTEGER,
+    frame    INTEGER NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (date, idx, name, packed)
+);
+'''
+
+# A directory is only marked as scanned if its mtime is at least this old (seconds), so files added
+# --- within the filesystem's timestamp granularity of a scan are not missed by the next one
+SettleTime = 1
+
+
+def is_day(name):
+    return len(name) == 8 and name.isdigit()
+
+
+# Opened (and the connection kept) in the thread that uses it, like RunDB
+class Catalog:
+    def __init__(self, path=None, root=None):
+        self.path = path or folders.CatalogDB
+        self.root = root or folders.DataDir
+        self.db = None
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            if self.db.execute('PRAGMA user_version').fetchone()[0] != SchemaVersion:
+                self.db.executescript('DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS files;')
+                self.db.execute('PRAGMA user_version = {:d}'.format(SchemaVersion))
+            self.db.executescript(Schema)
+        return self.db
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def event_dir(self, date, idx):
+        return self.root + '/' + date + '/' + str(idx)
+
+    # (date, index) of an event directory (or a file in one) under root, None for anything else
+    def event_of(self, path):
+        rel = os.path.relpath(os.path.realpath(path), os.path.realpath(self.root))
+        parts = rel.split(os.sep)
+        if len(parts) >= 2 and is_day(parts[0]) and parts[1].isdigit():
+            return parts[0], int(parts[1])
+        return None
+
+
+    # Relists every event directory whose mtime changed since it was last listed and drops the ones
+    # --- that are gone. Returns the number of directories listed.
+    def rescan(self):
+        db = self.connect()
+        known = {(d, i): m for d, i, m in db.execute('SELECT date, idx, mtime_ns FROM dirs')}
+        seen = set()
+        scanned = 0
+        try:
+            days = [e.name for e in os.scandir(self.root) if e.is_dir(follow_symlinks=False) and is_day(e.name)]
+        except FileNotFoundError:
+            days = []
+        for date in days:
+            for e in os.scandir(self.root + '/' + date):
+                if not e.name.isdigit() or not e.is_dir(follow_symlinks=False):
+                    continue
+                key = (date, int(e.name))
+                seen.add(key)
+                if known.get(key) != e.stat(follow_symlinks=False).st_mtime_ns:
+                    self.scan_event(*key, commit=False)
+                    scanned += 1
+        for key in set(known) - seen:
+            self.forget_event(*key, commit=False)
+        db.commit()
+        return scanned
+
+    # Lists one event directory and replaces its entries. The frames in a pack (see packer.py) are
+    # --- entered with packed set and their size in the pack, the pack itself with what is left over.
+    def scan_event(self, date, idx, commit=True):
+        db = self.connect()
+        directory = self.event_dir(date, idx)
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+            entries = [(e.name, e.stat(follow_symlinks=False)) for e in os.scandir(directory) if e.is_file(follow_symlinks=False)]
+        except FileNotFoundError:
+            self.forget_event(date, idx, commit)
+            return
+        if time.time_ns() - mtime_ns < SettleTime*1e9:
+            mtime_ns = None
+        rows = [(date, idx, name, False, camera_of(name), is_frame(name), st.st_size, st.st_mtime_ns) for name, st in entries]
+        if PackName in [name for name, st in entries]:
+            try:
+                rows += self.pack_rows(date, idx, rows)
+            except (OSError, ValueError, KeyError) as e:
+                print('Could not read the pack in ' + directory + ': ', e)
+        db.execute('DELETE FROM files WHERE date = ? AND idx = ?', (date, idx))
+        db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)', (date, idx, mtime_ns))
+        if commit:
+            db.commit()
+
+    def pack_rows(self, date, idx, rows):
+        with Pack(self.event_dir(date, idx)) as pack:
+            sizes = {info.filename: info.compress_size for info in pack.zip.infolist()}
+            frames = pack.frames()
+        packed = [(date, idx, f['name'], True, f['cam'], True, sizes[f['name']], f['mtime_ns']) for f in frames]
+        for i, row in enumerate(rows):
+            if row[2] == PackName:
+                rows[i] = row[:6] + (row[6] - sum(r[6] for r in packed),) + row[7:]
+        return packed
+
+    def forget_event(self, date, idx, commit=True):
+        db = self.connect()
+        db.execute('DELETE FROM files WHERE date = ? AND idx = ?', (date, idx))
+        db.execute('DELETE FROM dirs WHERE date = ? AND idx = ?', (date, idx))
+        if commit:
+            db.commit()
+
+    # Updates a single file (written or moved in). The directory's mtime is left alone, so the
+    # --- next rescan still relists it. A new pack relists the whole event.
+    def update(self, path, commit=True):
+        event = self.event_of(os.path.dirname(path))
+        if event is None:
+            return
+        name = os.path.basename(path)
+        if name == PackName:
+            self.scan_event(*event, commit=commit)
+            return
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except FileNotFoundError:
+            self.remove(path, commit)
+            return
+        db = self.connect()
+        db.execute('INSERT OR IGNORE INTO dirs VALUES (?, ?, NULL)', event)
+        db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                   event + (name, False, camera_of(name), is_frame(name), st.st_size, st.st_mtime_ns))
+        if commit:
+            db.commit()
+
+    def remove(self, path, commit=True):
+        event = self.event_of(os.path.dirname(path))
+        if event is None:
+            return
+        db = self.connect()
+        name = os.path.basename(path)
+        if name == PackName:
+            db.execute('DELETE FROM files WHERE date = ? AND idx = ? AND packed', event)
+        db.execute('DELETE FROM files WHERE date = ? AND idx = ? AND name = ? AND NOT packed', event + (name,))
+        if commit:
+            db.commit()
+
+
+    # Lookups
+    # (date, events, files, bytes) for every day
+    def days(self):
+        return self.connect().execute(
+            'SELECT d.date, COUNT(DISTINCT d.idx), COUNT(f.name), COALESCE(SUM(f.size), 0) '
+            'FROM dirs d LEFT JOIN files f ON f.date = d.date AND f.idx = d.idx GROUP BY d.date ORDER BY d.date').fetchall()
+
+    # (index, frames, bytes) for every event of a day
+    def events(self, date):
+        return self.connect().execute(
+            'SELECT d.idx, COALESCE(SUM(f.frame), 0), COALESCE(SUM(f.size), 0) '
+            'FROM dirs d LEFT JOIN files f ON f.date = d.date AND f.idx = d.idx '
+            'WHERE d.date = ? GROUP BY d.idx ORDER BY d.idx', (date,)).fetchall()
+
+    # (name, camera, size, mtime_ns, packed) of the files of an event, by name; only camera cam's frames
+    # --- if given. While an event is being packed its frames are listed both loose and packed.
+    def files(self, date, idx, cam=None):
+        if cam is None:
+            return self.connect().execute('SELECT name, cam, size, mtime_ns, packed FROM files WHERE date = ? AND idx = ? '
+                                          'ORDER BY name', (date, idx)).fetchall()
+        return self.connect().execute('SELECT name, cam, size, mtime_ns, packed FROM files WHERE date = ? AND idx = ? '
+                                      'AND cam = ? AND frame ORDER BY name', (date, idx, cam)).fetchall()
+
+    # Number of frames of each camera in an event, {cam: frames}
+    def frames(self, date, idx):
+        return dict(self.connect().execute('SELECT cam, COUNT(DISTINCT name) FROM files WHERE date = ? AND idx = ? '
+                                           'AND frame AND cam IS NOT NULL GROUP BY cam', (date, idx)).fetchall())
+
+    # (files, bytes), for one day or everything
+    def usage(self, date=None):
+        if date is None:
+            return self.connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files').fetchone()
+        return self.connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files WHERE date = ?', (date,)).fetchone()
+
+    # Sorted frame names of camera cam in directory (open them with packer.open_frame). From the catalog
+    # --- for an event directory it knows about, otherwise (the dump folder, anything outside DataDir)
+    # --- from the directory itself.
+    def frame_names(self, directory, cam):
+        event = self.event_of(directory)
+        if event is not None:
+            if not self.connect().execute('SELECT 1 FROM dirs WHERE date = ? AND idx = ?', event).fetchone():
+                self.scan_event(*event)
+            return sorted(set(row[0] for row in self.files(event[0], event[1], cam)))
+        return packer_frame_names(directory, cam)
+
+
+# inotify through libc, as the standard library has no binding for it
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_ISDIR       = 0x40000000
+IN_CLOEXEC     = 0o2000000
+
+DirMask   = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+EventMask = IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.paths = {}
+
+    def add(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed', path)
+        self.paths[wd] = path
+
+    # Waits up to timeout seconds and returns the events as (directory, name, mask)
+    def read(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        i = 0
+        while i < len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data, i)
+            name = os.fsdecode(data[i+16:i+16+length].rstrip(b'\0'))
+            i += 16 + length
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+            elif wd in self.paths or mask & IN_Q_OVERFLOW:
+                events.append((self.paths.get(wd), name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher(threading.Thread):
+    def __init__(self, path=None, root=None, rescan_interval=60):
+        super().__init__(name='catalog-watcher', daemon=True)
+        self.path = path
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        catalog = Catalog(self.path, self.root)
+        root = catalog.root
+        catalog.rescan()
+        try:
+            inotify = Inotify()
+            inotify.add(root, DirMask)
+            days = sorted(name for name in os.listdir(root) if is_day(name))
+            for day in days:
+                inotify.add(root + '/' + day, DirMask)
+            if days:
+                for name in os.listdir(root + '/' + days[-1]):
+                    if name.isdigit():
+                        inotify.add(root + '/' + days[-1] + '/' + name, EventMask)
+        except (OSError, AttributeError) as e:
+            print('Catalog without inotify, rescanning every {} s: '.format(self.rescan_interval), e)
+            inotify = None
+        next_rescan = time.monotonic() + self.rescan_interval
+        while self.running:
+            timeout = max(next_rescan - time.monotonic(), 0)
+            if inotify is None:
+                time.sleep(min(timeout, 1))
+                events = []
+            else: events = inotify.read(min(timeout, 1))
+            try:
+                for directory, name, mask in events:
+                    self.handle(catalog, inotify, directory, name, mask)
+                if events:
+                    catalog.connect().commit()
+                if time.monotonic() >= next_rescan:
+                    catalog.rescan()
+                    next_rescan = time.monotonic() + self.rescan_interval
+            except (OSError, sqlite3.Error) as e:
+                print('Catalog update failed: ', e)
+        if inotify is not None:
+            inotify.close()
+        catalog.close()
+
+    def handle(self, catalog, inotify, directory, name, mask):
+        if mask & IN_Q_OVERFLOW:
+            catalog.rescan()
+            return
+        path = directory + '/' + name
+        level = len(os.path.relpath(path, catalog.root).split(os.sep))
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                if level == 1 and is_day(name):
+                    inotify.add(path, DirMask)
+                    for event in os.listdir(path):
+                        if event.isdigit():
+                            inotify.add(path + '/' + event, EventMask)
+                            catalog.scan_event(name, int(event), commit=False)
+                elif level == 2 and name.isdigit():
+                    inotify.add(path, EventMask)
+                    catalog.scan_event(os.path.basename(directory), int(name), commit=False)
+            elif level == 2 and name.isdigit():
+                catalog.forget_event(os.path.basename(directory), int(name), commit=False)
+        elif level == 3:
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                catalog.update(path, commit=False)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                catalog.remove(path, commit=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eb-catalog', description='Look up event data in the catalog')
+    parser.add_argument('--db', help='catalog file (default: {})'.format(folders.CatalogDB))
+    parser.add_argument('--root', help='data directory (default: {})'.format(folders.DataDir))
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('days', help='events, files and bytes per day')
+    events = commands.add_parser('events', help='frames and bytes per event of a day')
+    events.add_argument('date')
+    files = commands.add_parser('files', help='files of an event')
+    files.add_argument('date')
+    files.add_argument('event', type=int)
+    usage = commands.add_parser('usage', help='total files and bytes')
+    usage.add_argument('date', nargs='?')
+    commands.add_parser('rescan', help='bring the catalog up to date')
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.db, args.root)
+    if args.command == 'days':
+        for date, n, files, size in catalog.days():
+            print('{}  {:>6} events {:>9} files {:>10.1f} MB'.format(date, n, files, size/1e6))
+    elif args.command == 'events':
+        for idx, frames, size in catalog.events(args.date):
+            print('{:>6} {:>7} frames {:>10.1f} MB'.format(idx, frames, size/1e6))
+    elif args.command == 'files':
+        for name, cam, size, mtime_ns, packed in catalog.files(args.date, args.event):
+            print('{:<40} {:>4} {:>12}{}'.format(name, '-' if cam is None else cam, size, ' (packed)' if packed else ''))
+        print(', '.join('Cam_{}: {} frames'.format(cam, n) for cam, n in sorted(catalog.frames(args.date, args.event).items())))
+    elif args.command == 'usage':
+        files, size = catalog.usage(args.date)
+        print('{} files, {:.1f} MB'.format(files, size/1e6))
+    elif args.command == 'rescan':
+        tic = time.perf_counter()
+        n = catalog.rescan()
+        print('Listed {} event directories in {:.2f} s'.format(n, time.perf_counter()-tic))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import argparse
+from .control import IDLE
+from .options import add_engine_arguments, build_control
+from . import config, cameras
+
+### eb-run: runs events without the GUI (over ssh, from cron, or for profiling the control path).
+### --- Starts the event control thread in autorun mode and prints every state change, error and
+### --- the autorun summary. Ctrl-C ends the current event and exits.
+###
+###     eb-run --events 100 --max-time 10 --trig-enable-time 5
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eb-run', description='Run SBC events without the GUI')
+    parser.add_argument('--events', type=int, default=1, help='number of events, 0 to run until stopped')
+    parser.add_argument('--max-time', type=float, default=10, help='maximum event time in seconds')
+    parser.add_argument('--trig-enable-time', type=float, default=5, help='seconds before the trigger is enabled')
+    parser.add_argument('--keep-going', action='store_true', help='keep starting events after an error')
+    add_engine_arguments(parser)
+    parser.add_argument('--write-config', action='store_true',
+                        help='write the camera config files (with the settings below) before starting')
+    for name, default in config.DefaultSettings.items():
+        parser.add_argument('--'+name.replace('_', '-'), type=int, default=default)
+    args = parser.parse_args(argv)
+
+    if args.write_config:
+        settings = {name: getattr(args, name) for name in config.DefaultSettings}
+        try:
+            saved = config.save_config(settings)
+        except ValueError as e:
+            parser.error(str(e))
+        for cam in cameras.active():
+            version, digest, changed = saved[cam.name]
+            print('{}: config v{} {} ({})'.format(cam.name, version, digest, 'written' if changed else 'unchanged'))
+            print(cam.name + ': ' + config.format_estimate(config.estimate(config.make_config(cam, settings))))
+    control = build_control(args)
+    control.start()
+    control.start_autorun(args.events, args.max_time, args.trig_enable_time, not args.keep_going)
+
+    state = None
+    error = ''
+    snapshot = None
+    try:
+        while True:
+            snapshot = control.snapshots.get()
+            if snapshot.state != state:
+                state = snapshot.state
+                print('{:<18} {}'.format(state, snapshot.autorun))
+            if snapshot.error != error:
+                error = snapshot.error
+                if error:
+                    print(error.strip())
+            if snapshot.autorun_state == 'finished' and snapshot.state == IDLE:
+                break
+    except KeyboardInterrupt:
+        print('Stopping')
+    control.quit()
+    control.join()
+    while not control.snapshots.empty():
+        snapshot = control.snapshots.get()
+    if snapshot is not None:
+        print(snapshot.autorun)
+        print(snapshot.storage)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import bz2
+import io
+import lzma
+import os
+import time
+import zipfile
+import zlib
+
+### Lossless frame codecs for event packs (packer.py). Every codec gives back the frame bit for bit,
+### --- except png/webp, which keep every pixel but re-encode the image file (open it with PIL as usual).
+###   none            frames stored as they are
+###   deflate, bzip2, lzma
+###                   the zip archive's own methods, so any zip tool still extracts plain .bmp files
+###   zstd, lz4       need the zstandard / lz4 packages
+###   png, webp       need Pillow (webp is written in its lossless mode)
+### Adding +delta to a byte codec (e.g. zstd+delta) stores each frame XORed with the camera's previous
+### --- one, which is mostly zeros for a still chamber; every DeltaKeyframe-th frame is stored whole,
+### --- so reading a frame never decodes more than that many.
+### The optional codecs are imported when they are first used, like RPi.GPIO in hal.py.
+###
+###     python -m eventbuilder.compression /home/pi/camera-data/20261018/3 --codecs none zstd zstd+delta png
+
+DeltaKeyframe = 16
+ZstdLevel = 3
+PngLevel = 1
+
+ZipMethods = {'none': zipfile.ZIP_STORED, 'deflate': zipfile.ZIP_DEFLATED, 'bzip2': zipfile.ZIP_BZIP2,
+              'lzma': zipfile.ZIP_LZMA}
+
+
+# Byte codecs not built into zip, as (encode, decode)
+def zstd_codec():
+    import zstandard
+    return (zstandard.ZstdCompressor(level=ZstdLevel).compress, zstandard.ZstdDecompressor().decompress)
+
+def lz4_codec():
+    import lz4.frame
+    return (lz4.frame.compress, lz4.frame.decompress)
+
+ByteCodecs = {'zstd': zstd_codec, 'lz4': lz4_codec}
+ImageCodecs = {'png': ('PNG', {'compress_level': PngLevel}), 'webp': ('WEBP', {'lossless': True})}
+
+
+def xor(data, prev):
+    if prev is None or len(prev) != len(data):
+        return data
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(prev, 'little')).to_bytes(len(data), 'little')
+
+
+class Codec:
+    def __init__(self, name):
+        self.name = name
+        base, plus, delta = name.partition('+')
+        self.base = base
+        self.delta = delta == 'delta'
+        self.image = base in ImageCodecs
+        if plus and not self.delta or base not in list(ZipMethods) + list(ByteCodecs) + list(ImageCodecs):
+            raise ValueError('unknown codec ' + name)
+        if self.delta and base in ImageCodecs:
+            raise ValueError('delta only works with byte codecs, not ' + base)
+        # The zip method the members are written with; everything else is encoded here and stored
+        self.zip_method = ZipMethods.get(base, zipfile.ZIP_STORED)
+        self.encoder = None
+        self.decoder = None
+        if base in ByteCodecs:
+            self.encoder, self.decoder = ByteCodecs[base]()
+        elif base in ImageCodecs:
+            from PIL import Image
+            self.Image = Image
+
+    # Whether frame number n (of its camera) is stored whole
+    def keyframe(self, n):
+        return not self.delta or n % DeltaKeyframe == 0
+
+    # prev is the camera's previous frame (original bytes) for delta codecs, None for keyframes
+    def encode(self, data, prev=None):
+        if self.delta:
+            data = xor(data, prev)
+        if self.encoder is not None:
+            return self.encoder(data)
+        if self.image:
+            img = self.Image.open(io.BytesIO(data))
+            out = io.BytesIO()
+            fmt, options = ImageCodecs[self.base]
+            img.save(out, fmt, **options)
+            return out.getvalue()
+        return data
+
+    def decode(self, data, prev=None):
+        if self.decoder is not None:
+            data = self.decoder(data)
+        if self.delta:
+            data = xor(data, prev)
+        return data
+
+    # Checks that encoded decodes to the original frame (the same pixels for image codecs)
+    def check(self, original, decoded):
+        if not self.image:
+            return decoded == original
+        a = self.Image.open(io.BytesIO(original))
+        b = self.Image.open(io.BytesIO(decoded))
+        return a.size == b.size and a.convert(b.mode).tobytes() == b.tobytes()
+
+
+AllCodecs = ['none', 'deflate', 'bzip2', 'lzma', 'zstd', 'lz4', 'png', 'webp',
+             'deflate+delta', 'lzma+delta', 'zstd+delta', 'lz4+delta']
+
+
+# Encodes and decodes the frames of one camera with a codec the way a pack does.
+# Returns (bytes in, bytes out, encode seconds, decode seconds).
+def measure(codec, frames):
+    if codec.zip_method == zipfile.ZIP_STORED:
+        compress = decompress = None
+    else:
+        compress = {zipfile.ZIP_DEFLATED: zlib.compress, zipfile.ZIP_BZIP2: bz2.compress,
+                    zipfile.ZIP_LZMA: lzma.compress}[codec.zip_method]
+        decompress = {zipfile.ZIP_DEFLATED: zlib.decompress, zipfile.ZIP_BZIP2: bz2.decompress,
+                      zipfile.ZIP_LZMA: lzma.decompress}[codec.zip_method]
+    bytes_in = bytes_out = 0
+    encoded = []
+    tic = time.perf_counter()
+    prev = None
+    for n, data in enumerate(frames):
+        e = codec.encode(data, None if codec.keyframe(n) else prev)
+        if compress is not None:
+            e = compress(e)
+        encoded.append(e)
+        bytes_in += len(data)
+        bytes_out += len(e)
+        prev = data
+    encode_s = time.perf_counter() - tic
+    tic = time.perf_counter()
+    prev = None
+    for n, e in enumerate(encoded):
+        if decompress is not None:
+            e = decompress(e)
+        prev = codec.decode(e, None if codec.keyframe(n) else prev)
+    decode_s = time.perf_counter() - tic
+    return bytes_in, bytes_out, encode_s, decode_s
+
+
+def main(argv=None):
+    from .packer import Pack, PackName, is_frame, camera_of, frame_names, open_frame
+    parser = argparse.ArgumentParser(prog='eb-codecs', description='Compare the pack codecs on the frames of an event')
+    parser.add_argument('directory', help='event folder (packed or not)')
+    parser.add_argument('--codecs', nargs='+', default=AllCodecs)
+    parser.add_argument('--frames', type=int, default=30, help='frames per camera to use')
+    parser.add_argument('--events-per-hour', type=float,
+                        help='shows whether each codec keeps up with this event rate on one core')
+    args = parser.parse_args(argv)
+
+    names = [name for name in os.listdir(args.directory) if is_frame(name)]
+    if os.path.exists(args.directory + '/' + PackName):
+        with Pack(args.directory) as pack:
+            names += pack.names()
+    cams = sorted(set(camera_of(name) for name in names) - {None})
+    frames = {}
+    for cam in cams:
+        frames[cam] = [open_frame(args.directory, name).read() for name in frame_names(args.directory, cam)[:args.frames]]
+    # Bytes per event, from the average size of the frames read
+    n_read = sum(len(f) for f in frames.values())
+    event_bytes = len(set(names))*sum(len(d) for f in frames.values() for d in f)/n_read if n_read else 0
+    print('{} frames from {} camera(s), {:.1f} MB'.format(sum(len(f) for f in frames.values()), len(frames),
+                                                       sum(len(d) for f in frames.values() for d in f)/1e6))
+    print('{:<14} {:>7} {:>12} {:>12}{}'.format('codec', 'ratio', 'enc MB/s', 'dec MB/s',
+                                               '   keeps up' if args.events_per_hour else ''))
+    for name in args.codecs:
+        try:
+            codec = Codec(name)
+        except ImportError as e:
+            print('{:<14} not available ({})'.format(name, e))
+            continue
+        bytes_in = bytes_out = encode_s = decode_s = 0
+        for cam_frames in frames.values():
+            r = measure(codec, cam_frames)
+            bytes_in += r[0]
+            bytes_out += r[1]
+            encode_s += r[2]
+            decode_s += r[3]
+        line = '{:<14} {:>7.2f} {:>12.1f} {:>12.1f}'.format(name, bytes_in/bytes_out if bytes_out else 0,
+                                                           bytes_in/1e6/encode_s if encode_s else 0,
+                                                           bytes_in/1e6/decode_s if decode_s else 0)
+        if args.events_per_hour:
+            needed = event_bytes*args.events_per_hour/3600
+            rate = bytes_in/encode_s if encode_s else float('inf')
+            line += '   {} ({:.0f}% of one core)'.format('yes' if rate >= needed else 'no', 100*needed/rate)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import math
+import os
+from . import folders, cameras
+
+### Camera config files. The EB writes one config file per enabled camera (camN-config.json, see
+### --- cameras.py) into DataDir, which the cameras read over NFS as /mnt/event-builder/camN-config.json.
+### --- All config files have the same settings except for 'cam_name' and 'config_path'.
+### The frames are (width x height, from the sensor mode), cropped to the ROI (roi_* in those pixels, 0
+### --- for the whole frame) and binned. estimate() works out what a config costs before it is pushed:
+### --- the highest frame rate, bytes per frame, RAM for the camera's ring buffer and bytes saved per event.
+### Every config file carries a 'version' (bumped whenever its content changes) and a 'config_hash' of
+### --- its content; files are only rewritten when the content changed, through a temporary file and a
+### --- rename, so a camera never reads half a file. Once a camera has loaded its config it writes the
+### --- hash it applied to <config file>.applied next to it (JSON {"config_hash": ..., "version": ...}
+### --- or just the hash); the EB does not start an event while any camera reports a different hash
+### --- (see check_applied). Cameras that write no .applied file are not checked.
+### The report can also carry "mem_available": the bytes of RAM the camera can give its ring buffer
+### --- (MemAvailable plus the buffer it holds at the time). plan_buffer() works out from those the
+### --- longest buffer_len every camera can hold for a pre-trigger time, and how long the save takes.
+
+BytesPerPixel = 1     # 8 bit monochrome frames
+BMPHeader     = 1078  # BMP header plus the 256 entry grey palette
+MemoryReserve = 64e6  # bytes of a camera's reported free RAM that are not given to the ring buffer
+SaveBandwidth = 20e6  # bytes/s the cameras are assumed to save at together, until the EB has measured it
+SaveBudget    = 60    # seconds the save at the end of an event may take (0: no limit), checked before every
+                      # --- event (storage.py) and by plan_buffer
+
+# Nominal full frame size and frame rate of the sensor modes. A smaller ROI height reads fewer rows, which
+# --- raises the frame rate in proportion; the exposure caps it.
+SensorModes = {
+    11: {'resolution': (1280, 800), 'fps': 120},
+    5:  {'resolution': (640, 400), 'fps': 240},
+}
+Binnings = (1, 2, 4)
+
+# Settings that can be changed from the Camera Settings tab (or eb-run), with their defaults
+DefaultSettings = {
+    'exposure': 300,
+    'buffer_len': 100,
+    'frames_after': 50,
+    'adc_threshold': 10,
+    'pix_threshold': 300,
+    'mode': 11,
+    'width': 1280,
+    'height': 800,
+    'roi_x': 0,
+    'roi_y': 0,
+    'roi_width': 0,
+    'roi_height': 0,
+    'binning': 1,
+}
+
+
+# Checks the resolution, sensor mode, ROI and binning in settings, raises ValueError if they do not fit
+def check_settings(settings):
+    mode = int(settings['mode'])
+    if mode not in SensorModes:
+        raise ValueError('unknown sensor mode {} (known: {})'.format(mode, ', '.join(str(m) for m in SensorModes)))
+    width, height = int(settings['width']), int(settings['height'])
+    max_width, max_height = SensorModes[mode]['resolution']
+    if not (0 < width <= max_width and 0 < height <= max_height):
+        raise ValueError('resolution {}x{} does not fit sensor mode {} ({}x{})'.format(width, height, mode, max_width, max_height))
+    x, y, w, h = roi(settings)
+    if x < 0 or y < 0 or w <= 0 or h <= 0 or x + w > width or y + h > height:
+        raise ValueError('ROI {}x{} at ({}, {}) is not inside the {}x{} frame'.format(w, h, x, y, width, height))
+    binning = int(settings['binning'])
+    if binning not in Binnings:
+        raise ValueError('binning has to be one of ' + ', '.join(str(b) for b in Binnings))
+    if w % binning or h % binning:
+        raise ValueError('the ROI size has to be a multiple of the binning ({})'.format(binning))
+
+
+# The ROI as (x, y, width, height), a width or height of 0 meaning up to the edge of the frame
+def roi(settings):
+    x, y = int(settings['roi_x']), int(settings['roi_y'])
+    w = int(settings['roi_width']) or int(settings['width']) - x
+    h = int(settings['roi_height']) or int(settings['height']) - y
+    return x, y, w, h
+
+
+# Makes the config dictionary for camera cam (a cameras.Camera) from settings (see DefaultSettings).
+# Some values are set as their defaults and cannot be changed (yet) by the event builder.
+def make_config(cam, settings):
+    check_settings(settings)
+    config = {}
+    config['exposure'] = int(settings['exposure'])
+    config["resolution"] = [int(settings['width']), int(settings['height'])]
+    config["frame_sync"] = True
+    config["mode"] = int(settings['mode'])
+    config["roi"] = list(roi(settings))
+    config["binning"] = int(settings['binning'])
+    config["buffer_len"] = int(settings['buffer_len'])
+    config["frames_after"] = int(settings['frames_after'])
+    config["adc_threshold"] = int(settings['adc_threshold'])
+    config["pix_threshold"] = int(settings['pix_threshold'])
+    config["save_path"] = "/mnt/event-builder/Images/"
+    config["config_path"]= "/mnt/event-builder/"+cam.config
+    config["cam_name"] = cam.name
+    config["image_format"] = ".bmp"
+    config["date_format"] = "%Y-%m-%d_%H:%M:%S"
+    config["input_pins"] = {"state_com": 5,
+                            "trig_en": 6,
+                            "trig_latch": 13}
+    config["output_pins"] = {"state": 23,
+                            "trig": 24}
+    return config
+
+
+# What a camera config (make_config's dict or a camN-config.json) costs: frame size in pixels, highest
+# --- frame rate, bytes per frame in RAM, ring buffer RAM (buffer_len frames) and bytes saved per event
+# --- ((buffer_len + frames_after) BMP files). Configs from before ROI/binning count as the full frame.
+def estimate(config):
+    width, height = config.get('resolution', [0, 0])
+    x, y, w, h = config.get('roi', [0, 0, width, height])
+    binning = config.get('binning', 1)
+    frame = (w // binning, h // binning)
+    fps = None
+    mode = SensorModes.get(config.get('mode'))
+    if mode is not None and h:
+        fps = mode['fps'] * height / h
+        if config.get('exposure'): # in us
+            fps = min(fps, 1e6/config['exposure'])
+    frame_bytes = frame[0] * frame[1] * BytesPerPixel
+    buffer_len = int(config.get('buffer_len', 0))
+    return {'frame': frame, 'fps': fps, 'frame_bytes': frame_bytes, 'buffer_bytes': buffer_len * frame_bytes,
+            'event_bytes': (buffer_len + int(config.get('frames_after', 0))) * (frame_bytes + BMPHeader)}
+
+def format_estimate(e):
+    return '{}x{} px, {}, {:.0f} kB/frame, buffer {:.1f} MB, {:.1f} MB saved per event'.format(
+        e['frame'][0], e['frame'][1], 'up to {:.0f} fps'.format(e['fps']) if e['fps'] else 'fps unknown',
+        e['frame_bytes']/1e3, e['buffer_bytes']/1e6, e['event_bytes']/1e6)
+
+
+# Plans buffer_len for settings: pre_trigger seconds of frames before the trigger (None for as many as
+# --- fit), capped by the RAM each camera reports (less MemoryReserve). The save of buffer_len +
+# --- frames_after frames from every camera at bandwidth bytes/s is checked against dead_time seconds
+# --- (SaveBudget by default).
+# --- Returns a dict with buffer_len, the pre_trigger time that gives, the camera whose RAM limits it
+# --- (None), how many cameras report their RAM, save_seconds, max_frames_after (the most frames_after
+# --- that fit the budget) and warnings. Raises ValueError if there is nothing to plan from.
+def plan_buffer(settings, pre_trigger=None, dead_time=None, bandwidth=None, directory=None):
+    dead_time = SaveBudget if dead_time is None else dead_time
+    cams = cameras.active()
+    if not cams:
+        raise ValueError('no cameras are enabled')
+    e = estimate(make_config(cams[0], settings)) # all cameras get the same settings
+    buffer_len = None if pre_trigger is None else int(math.ceil(pre_trigger * e['fps']))
+    limit = None
+    reported = 0
+    for cam in cams:
+        free = reported_memory(cam, directory)
+        if free is None:
+            continue
+        reported += 1
+        fits = int(max(free - MemoryReserve, 0) // e['frame_bytes'])
+        if buffer_len is None or fits < buffer_len:
+            buffer_len, limit = fits, cam.name
+    if buffer_len is None:
+        raise ValueError('no camera reports its free RAM, set a pre-trigger time')
+    warnings = []
+    if pre_trigger is not None and limit is not None:
+        warnings.append('{} only has RAM for {} frames: {:.0f} ms before the trigger instead of {:.0f} ms'.format(
+            limit, buffer_len, 1e3*buffer_len/e['fps'], 1e3*pre_trigger))
+    bandwidth = bandwidth or SaveBandwidth
+    file_bytes = e['frame_bytes'] + BMPHeader
+    save_seconds = len(cams) * (buffer_len + int(settings['frames_after'])) * file_bytes / bandwidth
+    max_frames_after = max(int(dead_time * bandwidth / len(cams) // file_bytes) - buffer_len, 0) if dead_time else None
+    if dead_time and save_seconds > dead_time:
+        warnings.append('saving takes ~{:.1f} s at {:.0f} MB/s, over the {} s dead-time budget: '
+                        'at most {} frames after the trigger fit'.format(save_seconds, bandwidth/1e6, dead_time, max_frames_after))
+    return {'buffer_len': buffer_len, 'pre_trigger': buffer_len/e['fps'], 'limit': limit, 'reported': reported,
+            'save_seconds': save_seconds, 'max_frames_after': max_frames_after, 'warnings': warnings}
+
+def format_plan(plan):
+    lines = ['buffer_len {}: {:.0f} ms before the trigger ({}), save ~{:.1f} s'.format(
+        plan['buffer_len'], 1e3*plan['pre_trigger'],
+        'limited by the RAM of ' + plan['limit'] if plan['limit'] else
+        '{} camera(s) report their RAM'.format(plan['reported']), plan['save_seconds'])]
+    return '\n'.join(lines + ['Warning: ' + w for w in plan['warnings']])
+
+
+# Hash of a config's content (everything but version and config_hash)
+def content_hash(config):
+    content = {k: v for k, v in config.items() if k not in ('version', 'config_hash')}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+
+def read_config(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+# Writes the config files (in DataDir unless directory is given) whose content changed, with the next
+# --- version. Returns {camera name: (version, config_hash, changed)}.
+def save_config(settings, directory=None):
+    directory = directory or folders.DataDir
+    cams = cameras.active()
+    configs = [make_config(cam, settings) for cam in cams] # raises before any file is touched
+    saved = {}
+    for cam, c in zip(cams, configs):
+        path = directory+'/'+cam.config
+        old = read_config(path) or {}
+        c['config_hash'] = content_hash(c)
+        changed = old.get('config_hash') != c['config_hash'] or content_hash(old) != c['config_hash']
+        c['version'] = int(old.get('version', 0)) + 1 if changed else old['version']
+        if changed:
+            with open(path+'.tmp', 'w') as f:
+                json.dump(c, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path+'.tmp', path)
+        saved[cam.name] = (c['version'], c['config_hash'], changed)
+    return saved
+
+
+# What camera cam reported when it applied its config, as a dict (just {'config_hash': ...} for a bare
+# --- hash), None if it reports nothing
+def applied_report(cam, directory=None):
+    directory = directory or folders.DataDir
+    try:
+        with open(directory+'/'+cam.config+'.applied') as f:
+            text = f.read().strip()
+    except FileNotFoundError:
+        return None
+    try:
+        applied = json.loads(text)
+    except ValueError:
+        return {'config_hash': text}
+    return applied if isinstance(applied, dict) else {'config_hash': str(applied)}
+
+# The hash camera cam reports it applied, None if it reports nothing
+def applied_hash(cam, directory=None):
+    report = applied_report(cam, directory)
+    return None if report is None else report.get('config_hash')
+
+# Bytes of RAM camera cam reports it has for its ring buffer, None if it does not report it
+def reported_memory(cam, directory=None):
+    report = applied_report(cam, directory) or {}
+    return None if report.get('mem_available') is None else float(report['mem_available'])
+
+# Cameras that report a different config than their file holds, as (camera, expected, applied) hashes
+def check_applied(directory=None):
+    mismatched = []
+    for cam in cameras.active():
+        applied = applied_hash(cam, directory)
+        if applied is None:
+            continue
+        expected = (read_config((directory or folders.DataDir)+'/'+cam.config) or {}).get('config_hash')
+        if applied != expected:
+            mismatched.append((cam, expected, applied))
+    return mismatched
+
+
+# The config files of the enabled cameras
+def config_paths(directory=None):
+    directory = directory or folders.DataDir
+    return [directory+'/'+cam.config for cam in cameras.active()]
+
+
+# Short hash of the configs the cameras are running with (None if there are none), recorded with every
+# --- event so events taken with the same settings can be found. Made from each file's content_hash (the
+# --- config_hash the files carry and the cameras report), so it does not change with the version stamp.
+def config_hash(directory=None):
+    hashes = []
+    for path in config_paths(directory):
+        c = read_config(path)
+        hashes.append('-' if c is None else content_hash(c))
+    if hashes.count('-') == len(hashes):
+        return None
+    return hashlib.sha256(' '.join(hashes).encode()).hexdigest()[:16]
@@ -0,0 +1,797 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime
+from .hal import RISING
+from .pins import TriggerReset, TriggerLatch, EndEvent
+from . import folders, pins, cameras
+from .folders import stage_folder, unstage_folder, point_images_at
+from .latency import LatencyHistogram
+from .pulses import PulseScheduler
+from .barrier import ReadinessBarrier
+from .timeline import Timeline
+from .heartbeat import HeartbeatMonitor
+from .rundb import RunDB, EndMaxTime, EndManual, EndInactive, EndHeartbeat, EndLatch, mask
+from .config import config_hash, check_applied
+from .packer import Packer
+from .offload import Offloader, Streams
+from .staging import Staging, HighWater
+from .storage import StorageMonitor
+
+### Event control state machine. Runs in its own thread so that the timing of the event never depends on
+### --- the Tk mainloop (and sleeping in the control path never freezes the GUI). An event goes through
+### ---     idle -> arming -> live -> ending -> waiting-for-save -> idle
+### --- The GUI (or any other front end) only sends commands (start_event, stop_event, take_image, quit)
+### --- and reads Snapshots from the snapshots queue. Only the live state is checked every tick (10 ms);
+### --- everything else happens as soon as a command, trigger latch edge, camera state edge (through the
+### --- ReadinessBarrier) or finished pulse wakes the thread up. Output pulses go through the
+### --- PulseScheduler, so nothing in the control path sleeps.
+### In autorun mode the next event is started by the control thread itself as soon as the cameras are
+### --- done saving the previous one, so the dead time between events is just the cameras' save time.
+
+IDLE    = 'idle'
+ARMING  = 'arming'
+LIVE    = 'live'
+ENDING  = 'ending'
+WAITING = 'waiting-for-save'
+
+ArmTimeout    = 1    # seconds the RPis get to respond when starting an event
+PulseWidth    = 0.01 # seconds, width of the TriggerReset, trig_enable and repeated EndEvent pulses
+EndEventWidth = 1    # seconds EndEvent is held at the end of an event
+SaveTimeout   = None # seconds the RPis get to finish saving, None to wait for as long as it takes
+FallbackPoll  = 0.1  # seconds between pin checks while waiting on the cameras, in case an edge is missed
+HeartbeatMissed = 3  # heartbeat periods without a toggle before a camera is declared dead
+AdmissionRetry = 5   # seconds autorun waits before trying again when the next event cannot start
+
+# What a front end gets to see of the controller. statuses has one entry per camera:
+# --- None (neutral), True (active) or False (inactive). autorun is the autorun status line and
+# --- autorun_state one of 'running', 'paused', 'finished' ('' for both if autorun was never used).
+# --- storage is the disk status line (free space, write bandwidth, size of the next event).
+# --- refused is why the last start was held back (see EventControl.admit, '' once one starts) and
+# --- refusals counts those, so every refused start gives a new snapshot even for the same reason.
+# --- heartbeats is each camera's measured heartbeat toggle rate in Hz (None before two toggles, an
+# --- empty list without heartbeats).
+Snapshot = namedtuple('Snapshot', ['state', 'event_time', 'statuses', 'error', 'directory', 'autorun', 'autorun_state',
+                                   'storage', 'refused', 'refusals', 'heartbeats'])
+
+
+# Back-to-back event cycling. Runs events (0 = until stopped) with the same max time and trigger
+# --- enable time. With stop_on_error, an event that fails to start or ends with an error stops the run.
+# Paused time does not count towards the live time fraction or the event rate. Only events run while
+# --- it is not finished count, so events started by hand afterwards leave its report as it was.
+class Autorun:
+    def __init__(self, events, max_time, trig_enable_time, stop_on_error):
+        self.events = events
+        self.max_time = max_time
+        self.trig_enable_time = trig_enable_time
+        self.stop_on_error = stop_on_error
+        self.started = 0
+        self.saved = 0
+        self.errors = 0
+        self.live_time = 0
+        self.start_time = time.perf_counter()
+        self.paused_at = None
+        self.paused_time = 0
+        self.finished = ''
+        self.stopping = False # finished once the current event is done, see EventControl.next_event
+        self.waiting = False # held back, see EventControl.admit
+
+    def pause(self):
+        if self.paused_at is None:
+            self.paused_at = time.perf_counter()
+
+    def resume(self):
+        if self.paused_at is not None:
+            self.paused_time += time.perf_counter() - self.paused_at
+            self.paused_at = None
+
+    def finish(self, reason):
+        self.resume()
+        self.end_time = time.perf_counter()
+        self.finished = reason
+
+    def elapsed(self):
+        end = self.end_time if self.finished else self.paused_at or time.perf_counter()
+        return end - self.start_time - self.paused_time
+
+    def state(self):
+        if self.finished:
+            return 'finished'
+        return 'running' if self.paused_at is None else 'paused'
+
+    def format(self):
+        elapsed = self.elapsed()
+        text = 'Autorun: {}{} events, {} errors'.format(self.started, '/'+str(self.events) if self.events else '', self.errors)
+        if elapsed > 0:
+            text += ', live {:.1%}, {:.0f} events/h'.format(self.live_time/elapsed, self.saved/elapsed*3600)
+        if self.finished:
+            text += ' ('+self.finished+')'
+        elif self.stopping:
+            text += ' (stopping)'
+        elif self.paused_at is not None:
+            text += ' (paused)'
+        elif self.waiting:
+            text += ' (waiting to start)'
+        return text
+
+
+# Asks the kernel to schedule the calling thread with real-time (SCHED_FIFO) priority.
+# Needs root or CAP_SYS_NICE, otherwise the thread keeps its normal priority.
+def set_realtime_priority(priority=50):
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except (AttributeError, OSError) as e:
+        print('Event control running without real-time priority: ', e)
+
+
+class EventControl(threading.Thread):
+    # heartbeat is the cameras' heartbeat period in seconds, or None to run without heartbeats.
+    # With pack set to a codec name, every saved event's frames are packed into one file in the
+    # --- background (see packer.py and compression.py) by pack_workers processes.
+    # With offload set to an archive directory, saved (and packed) events are copied there in the
+    # --- background by offload_streams threads sharing offload_bandwidth bytes/s (see offload.py).
+    # With staging set to a directory on a tmpfs, the cameras save there and the frames are moved to
+    # --- the event folder in the background, holding up to staging_high_water bytes (see staging.py).
+    def __init__(self, gpio, tick=0.01, heartbeat=None, pack=None, pack_workers=1, offload=None,
+                 offload_streams=Streams, offload_bandwidth=None, staging=None, staging_high_water=HighWater):
+        super().__init__(name='event-control', daemon=True)
+        self.gpio = gpio
+        self.tick = tick
+        # The enabled cameras (see cameras.py). Per-camera lists (statuses, barrier, heartbeats) are in
+        # --- this order; info.txt and the run database use the cameras' numbers.
+        self.cams = cameras.active()
+        self.in_pins = list(pins.InPins)
+        self.in_mask = gpio.mask(pins.InPins)
+        self.state_com_mask = gpio.mask(pins.StateCom)
+        self.trig_enable_mask = gpio.mask(pins.TriggerEnable)
+        self.latch_mask = gpio.mask(TriggerLatch)
+        self.pulses = PulseScheduler(gpio)
+        self.pulses.start()
+        self.cameras = ReadinessBarrier(gpio, self.in_pins, self.wake, [c.name for c in self.cams])
+        self.timeline = Timeline()
+        self.rundb = RunDB()
+        self.offloader = None
+        if offload:
+            self.offloader = Offloader(offload, offload_streams, offload_bandwidth)
+        self.packer = None
+        if pack:
+            self.packer = Packer(pack, pack_workers, self.offloader.submit if self.offloader is not None else None)
+        self.storage = StorageMonitor()
+        self.storage.start()
+        self.staging = None
+        if staging:
+            self.staging = Staging(staging, staging_high_water, self.retry)
+            recovered = self.staging.recover(folders.DataDir, self.flushed)
+            self.staging.start()
+        if self.offloader is not None:
+            # Events still in RAM are offloaded once they are flushed
+            self.offloader.submit_pending(recovered if self.staging is not None else ())
+        self.retry_at = None
+        self.heartbeat = None
+        if heartbeat:
+            if len(pins.HeartbeatPins) != len(self.cams):
+                raise ValueError('heartbeat mode needs a heartbeat pin for every camera (see cameras.py)')
+            self.heartbeat = HeartbeatMonitor(gpio, pins.HeartbeatPins, heartbeat, HeartbeatMissed)
+        self.commands = queue.Queue()
+        self.snapshots = queue.Queue()
+        self.running = True
+
+        self.state = IDLE
+        self.statuses = [None]*len(self.cams)
+        self.error = ''
+        self.refused = '' # kept apart from error, so a held back start is not an error for stop_on_error
+        self.refusals = 0
+        self.directory = folders.DumpDir
+        self.today = ''
+        self.index = 0
+        self.staged = None # (date, index, directory) of the next event's folder, see stage_next
+
+        self.run_state = False
+        self.trig_0_state = False
+        self.latch_status = False
+        self.trig_enabled = False
+        self.max_time = 0
+        self.trig_enable_time = 0
+        self.event_time = 0
+        self.tic = 0
+        self.deadline = None
+        self.reset_pulse = None
+        self.end_pulse = None
+        self.end_pulses = []
+        self.end_requested = False
+        self.edge_latched = False
+        self.autorun = None
+
+        # The trigger latch is handled by an edge callback (runs in the GPIO backend's thread), see on_latch
+        self.live = False
+        self.latch_edge = None # (latch_ns, EndEvent pulse) of the edge that ended the live event
+        self.latency = LatencyHistogram()
+        gpio.add_edge_callback(TriggerLatch, RISING, self.on_latch)
+
+
+    # Commands, called from the front end's thread
+    def start_event(self, max_time, trig_enable_time):
+        self.commands.put(('start', max_time, trig_enable_time))
+
+    def stop_event(self):
+        self.commands.put(('stop',))
+
+    def take_image(self):
+        self.commands.put(('take_image',))
+
+    def quit(self):
+        self.commands.put(('quit',))
+
+    # Starts autorun, see Autorun. Pausing lets the current event finish but does not start the next.
+    def start_autorun(self, events, max_time, trig_enable_time, stop_on_error=True):
+        self.commands.put(('autorun', events, max_time, trig_enable_time, stop_on_error))
+
+    def pause_autorun(self):
+        self.commands.put(('pause',))
+
+    def resume_autorun(self):
+        self.commands.put(('resume',))
+
+    # Ends autorun once the current event is done
+    def stop_autorun(self):
+        self.commands.put(('stop_autorun',))
+
+    # Wakes up the control thread to check on the cameras/pulses it is waiting for
+    def wake(self, *args):
+        self.commands.put(('wake',))
+
+    # Tries an event autorun is holding back (see admit) now rather than at its next retry
+    def retry(self):
+        self.commands.put(('retry',))
+
+
+    def publish(self):
+        autorun, autorun_state = '', ''
+        if self.autorun is not None:
+            autorun, autorun_state = self.autorun.format(), self.autorun.state()
+        self.snapshots.put(Snapshot(self.state, self.event_time, list(self.statuses), self.error, self.directory,
+                                    autorun, autorun_state, self.storage.format(), self.refused, self.refusals,
+                                    self.heartbeat.frequencies() if self.heartbeat is not None else []))
+
+
+    def run(self):
+        set_realtime_priority()
+        self.publish()
+        while self.running:
+            try:
+                command = self.commands.get(timeout=self.timeout())
+            except queue.Empty:
+                command = None
+            try:
+                if command is not None:
+                    self.handle(command)
+                self.check_heartbeats()
+                if self.state == IDLE and self.retry_at is not None and time.perf_counter() >= self.retry_at:
+                    self.retry_at = None
+                    self.next_event()
+                if self.state == ARMING:
+                    self.fifo_signal()
+                elif self.state == LIVE:
+                    self.iterate()
+                elif self.state == WAITING:
+                    self.wait_for_end()
+            except Exception as e:
+                self.fail(e)
+
+
+    # Called when a step of the event failed (a folder, info.txt or the Images link could not be made,
+    # --- ...): lowers the outputs so the cameras stop, shows the error and goes back to idle, so the
+    # --- control thread lives on and the next event can be tried.
+    def fail(self, e):
+        traceback.print_exc()
+        self.live = False
+        self.gpio.low(self.state_com_mask | self.trig_enable_mask)
+        self.cameras.start(False)
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        try:
+            point_images_at(folders.DumpDir)
+        except OSError:
+            pass
+        self.directory = folders.DumpDir
+        self.run_state = False
+        self.deadline = None
+        self.retry_at = None
+        self.error += 'Error: {}\n'.format(e)
+        if self.autorun is not None and not self.autorun.finished:
+            self.autorun.errors += 1
+            if self.autorun.stop_on_error:
+                self.autorun.finish('stopped on error')
+            elif self.running:
+                # The next event after AdmissionRetry rather than straight into the same failure
+                self.retry_at = time.perf_counter() + AdmissionRetry
+        self.state = IDLE
+        self.publish()
+        # The failed event's transitions are written out now, so they do not wait for the next event's
+        self.timeline.record('fail')
+        try:
+            self.timeline.flush()
+        except OSError as e:
+            print('Could not write the timeline: ', e)
+
+
+    # How long the control thread can sleep if nothing wakes it up
+    def timeout(self):
+        if self.state == LIVE:
+            return self.tick
+        if self.state in (ARMING, WAITING):
+            timeout = FallbackPoll
+            if self.heartbeat is not None:
+                timeout = min(timeout, self.heartbeat.period_ns/1e9)
+            if self.deadline is not None:
+                timeout = min(timeout, max(self.deadline - time.perf_counter(), 0))
+            return timeout
+        if self.retry_at is not None:
+            return max(self.retry_at - time.perf_counter(), 0)
+        return None
+
+
+    def handle(self, command):
+        name = command[0]
+        if name == 'start' and self.state == IDLE:
+            if self.admit():
+                self.run_event(*command[1:])
+        elif name == 'stop':
+            self.trig_0_state = True
+        elif name == 'retry' and self.retry_at is not None:
+            self.retry_at = time.perf_counter()
+        elif name == 'latch' and self.state == LIVE:
+            self.latched()
+        elif name == 'take_image' and self.state == IDLE:
+            self.trig_enable_pulse()
+        elif name == 'autorun' and self.state == IDLE:
+            self.autorun = Autorun(*command[1:])
+            self.next_event()
+        elif name == 'pause' and self.autorun is not None:
+            self.autorun.pause()
+            self.publish()
+        elif name == 'resume' and self.autorun is not None and not self.autorun.finished:
+            self.autorun.resume()
+            if self.state == IDLE:
+                self.next_event()
+            else: self.publish()
+        elif name == 'stop_autorun' and self.autorun is not None and not self.autorun.finished:
+            if self.state == IDLE:
+                self.autorun.finish('stopped')
+            else: self.autorun.stopping = True
+            self.publish()
+        elif name == 'quit':
+            self.leave()
+
+
+    # In heartbeat mode, marks the cameras that stopped toggling their heartbeat line as inactive
+    def check_heartbeats(self):
+        if self.heartbeat is None:
+            return
+        for cam in self.heartbeat.check():
+            print(self.cams[cam].name+' stopped sending heartbeats')
+            self.timeline.record('cam_dead', cam=cam)
+            self.statuses[cam] = False
+
+    def dead_cameras(self):
+        if self.heartbeat is None:
+            return []
+        return self.heartbeat.dead_cameras()
+
+
+    def send_trig_enable(self):
+        self.gpio.high(self.trig_enable_mask)
+
+    def disable_trig_enable(self):
+        self.gpio.low(self.trig_enable_mask)
+
+    def trig_enable_pulse(self):
+        return self.pulses.pulse(pins.TriggerEnable, PulseWidth)
+
+
+    # Send 10 millisecond trigger_reset signal.
+    def send_trig_reset(self):
+        return self.pulses.pulse(TriggerReset, PulseWidth)
+
+
+    # Edge callback for TriggerLatch. Timestamps the edge, turns off trig_enable and raises EndEvent
+    # --- for EndEventWidth straight away, then wakes up the control thread to save the event.
+    # Edges outside of a live event (e.g. the latch being reset) are ignored.
+    # The control thread's tick takes live going False as the latch and reads latch_edge straight away,
+    # --- so latch_edge is set (in one assignment) before live is cleared.
+    def on_latch(self, pin, level, latch_ns):
+        if not self.live:
+            return
+        self.disable_trig_enable()
+        end_pulse = self.pulses.pulse(EndEvent, EndEventWidth)
+        self.latch_edge = (latch_ns, end_pulse)
+        self.live = False
+        self.latency.add(end_pulse.rise_ns - latch_ns)
+        self.commands.put(('latch',))
+
+
+    # In autorun, starts the next event (called once the previous one is done) unless autorun is
+    # --- paused, finished, has run all its events or has to stop on an error.
+    def next_event(self):
+        a = self.autorun
+        if a is None or a.finished:
+            return
+        if a.stopping:
+            a.finish('stopped')
+        elif a.paused_at is not None:
+            return
+        elif self.error and a.stop_on_error and a.started:
+            a.finish('stopped on error')
+        elif a.events and a.started >= a.events:
+            a.finish('done')
+        elif not self.admit():
+            a.waiting = True
+            self.retry_at = time.perf_counter() + AdmissionRetry
+        else:
+            a.waiting = False
+            a.started += 1
+            self.run_event(a.max_time, a.trig_enable_time)
+            return
+        self.publish()
+
+
+    # Checks that the disk can take the next event (see storage.py) and that no camera reports another
+    # --- config than its file holds (config.py). If not, sets refused to the reason and returns False: a
+    # --- start from the front end is refused, autorun tries again later.
+    def admit(self):
+        reason = self.storage.admit()
+        if reason is None and self.staging is not None and self.staging.full(self.storage.expected):
+            reason = 'Staging area full: waiting for the frames of earlier events to be written to disk'
+        if reason is None:
+            mismatched = check_applied()
+            if mismatched:
+                reason = 'Camera config not applied: ' + ', '.join(
+                    '{} runs {} instead of {}'.format(cam.name, applied, expected) for cam, expected, applied in mismatched)
+        if reason is None:
+            self.refused = ''
+            return True
+        if reason != self.refused:
+            print(reason)
+        self.refused = reason
+        self.refusals += 1
+        self.publish()
+        return False
+
+
+    # Starts an event: raise state_com and reset the trigger. fifo_signal takes it from there.
+    def run_event(self, max_time, trig_enable_time):
+        self.error = ''
+        self.max_time = max_time
+        self.trig_enable_time = trig_enable_time
+
+        # Output signal sent to RPis (state_com)
+        self.timeline.begin()
+        self.gpio.high(self.state_com_mask)
+        self.timeline.record('state_com')
+        self.cameras.start(True)
+        if self.heartbeat is not None:
+            self.heartbeat.start()
+        self.disable_trig_enable()
+        self.reset_pulse = self.pulses.pulse(TriggerReset, PulseWidth, on_fall=self.wake)
+        self.deadline = None
+        self.state = ARMING
+        self.publish()
+        self.stage_next()
+
+
+    # Called whenever the control thread wakes up while arming. Once the trigger reset is done, checks
+    # --- that the trigger latch is off, then waits (for up to ArmTimeout) for the camera barrier, i.e.
+    # --- for all RPis to respond and be ready. If both pass the event goes live, otherwise it is
+    # --- cleaned up with an error message.
+    # Sets trig_0_state to false if all RPis are ready (event can keep running)
+    def fifo_signal(self):
+        if not self.reset_pulse.done.is_set():
+            return
+        if self.deadline is None:
+            self.timeline.record('trig_reset', self.reset_pulse.rise_ns)
+            self.deadline = time.perf_counter() + ArmTimeout
+            self.latch_status = bool(self.gpio.snapshot() & self.latch_mask)
+            if self.latch_status:
+                self.abort_event(True)
+                return
+        if self.dead_cameras():
+            self.trig_0_state = True
+            self.abort_event(True)
+        elif self.cameras.reached():
+            print('Cameras ready: ' + self.cameras.format())
+            self.timeline.record_cameras('cam_ready', self.cameras.reached_ns)
+            self.statuses = [True]*len(self.cams)
+            self.today, self.index, self.directory = self.use_staged_folder()
+            self.trig_0_state = False
+            self.run_state = True
+            self.trig_enabled = False
+            self.end_requested = False
+            self.edge_latched = False
+            self.event_time = 0
+            self.end_pulse = None
+            self.latch_edge = None
+            self.send_trig_reset()
+            if self.offloader is not None:
+                self.offloader.pause()
+            self.live = True
+            self.tic = time.perf_counter()
+            self.timeline.record('live')
+            self.state = LIVE
+            self.publish()
+        elif time.perf_counter() > self.deadline:
+            print('Cameras not ready: ' + self.cameras.format())
+            self.trig_0_state = True
+            self.abort_event(True)
+
+
+    # Makes the next event's folder ahead of time, while the cameras are saving (or getting ready, for
+    # --- the first event), so that going live only has to swap the Images link
+    def stage_next(self):
+        if self.staged is not None:
+            return
+        self.timeline.record('stage')
+        try:
+            self.staged = stage_folder()
+            if self.staging is not None:
+                self.staging.make(self.staged[2])
+        except OSError as e:
+            print('Could not make the next event folder: ', e)
+            return
+        self.timeline.record('staged')
+
+    # Points the Images link at the staged folder. Falls back on making one now if staging failed or
+    # --- the date changed since.
+    def use_staged_folder(self):
+        staged, self.staged = self.staged, None
+        if staged is not None and staged[0] != folders.today():
+            self.release_staged(staged)
+            staged = None
+        if staged is None:
+            staged = stage_folder()
+            point_images_at(self.staging.make(staged[2]) if self.staging is not None else staged[2])
+            self.timeline.record('folder')
+            print('Made directory: ', staged[2])
+            return staged
+        self.timeline.record('swap')
+        point_images_at(self.staging.path(staged[2]) if self.staging is not None else staged[2])
+        self.timeline.record('folder')
+        print('Made directory: ', staged[2])
+        return staged
+
+    def release_staged(self, staged):
+        if self.staging is not None:
+            self.staging.remove(staged[2])
+        try:
+            unstage_folder(staged)
+        except OSError as e:
+            print('Could not remove unused event folder: ', e)
+
+
+    # If the trig_latch is enabled or one of the RPi pins is inactive when starting an event, point
+    # --- the Images link back at the dump folder, set the error message and call cleanup. The user
+    # --- can then re-run the event.
+    def abort_event(self, fifo_status):
+        self.timeline.record('abort')
+        if self.autorun is not None and not self.autorun.finished:
+            self.autorun.errors += 1
+        point_images_at(folders.DumpDir)
+        self.directory = folders.DumpDir
+        if self.latch_status:
+            self.error += 'Trigger Latch enabled,\nTrigger Reset signal sent.\nPlease try again.\n'
+        if fifo_status:
+            self.error += 'Error: Inactive RPi!\n'
+        self.run_state = False
+        self.cleanup()
+
+
+    # Called every tick while live. Sends trig_enable once trig_enable_time has passed. Once the timer
+    # --- exceeds max time, Stop Event is pressed or one of the RPi pins becomes inactive (or stops
+    # --- sending heartbeats), keeps pulsing EndEvent until the cameras latch the trigger.
+    def iterate(self):
+        self.event_time = time.perf_counter() - self.tic
+        if not self.trig_enabled and self.event_time >= self.trig_enable_time:
+            self.send_trig_enable()
+            self.trig_enabled = True
+            self.timeline.record('trig_enable')
+        # Falls back on reading the pin in case the edge was missed
+        levels = self.gpio.snapshot()
+        if not self.live or levels & self.latch_mask:
+            self.latched()
+            return
+        elif (self.event_time > self.max_time or self.trig_0_state or levels & self.in_mask != self.in_mask
+              or self.dead_cameras()):
+            if not self.end_requested:
+                self.end_requested = True
+                self.timeline.record('end_request')
+            if self.end_pulse is None or time.monotonic_ns() - self.end_pulse.rise_ns >= 2e9*PulseWidth:
+                self.end_pulse = self.pulses.pulse(EndEvent, PulseWidth)
+        self.publish()
+
+
+    def latched(self):
+        self.latch_status = True
+        if self.latch_edge is not None:
+            latch_ns, end_pulse = self.latch_edge
+            self.edge_latched = True
+            self.timeline.record('latch', latch_ns)
+            self.timeline.record('end_event', end_pulse.rise_ns)
+            print('trigger latched, EndEvent after {:.1f} us'.format((end_pulse.rise_ns-latch_ns)/1000))
+        else:
+            self.timeline.record('latch')
+            print('trigger latched')
+        self.save_event()
+
+
+    # Create a text file with info on Max Time, run time, and what
+    # --- caused the event to end, and add the same to the run database. Call cleanup.
+    def save_event(self):
+        self.state = ENDING
+        self.publish()
+        levels = self.gpio.levels(self.in_pins)
+        inactive = [i for i in range(len(self.cams)) if not levels[i]]
+        dead = self.dead_cameras()
+        time_saved = datetime.now().strftime('%H:%M:%S')
+        # The EndEvent pulses make the cameras latch at the end of every event, so the latch only counts
+        # --- as a trigger if it came before the EB asked the event to end
+        triggered = self.latch_status and not self.end_requested
+        f = open(self.directory+'/info.txt', 'x+')
+        f.write('Date: '+self.today+'\n')
+        f.write('Event: '+str(self.index)+'\n')
+        f.write('Time Saved: '+time_saved+'\n')
+        f.write('Trigger Enable Time: '+str(self.trig_enable_time)+'\n')
+        f.write('Max Time: '+str(self.max_time)+'\n')
+        f.write('Event Time: '+str(round(self.event_time, 4))+'\n')
+        f.write('End condition: ')
+        if self.event_time > self.max_time:
+            f.write('Exceeded max time; ')
+        if self.trig_0_state:
+            f.write('Man_Trigger button pressed; ')
+        if inactive:
+            f.write('Camera(s) ')
+            for i in inactive:
+                f.write(str(self.cams[i].number+1)+' ')
+            f.write('were inactive; ')
+        if dead:
+            f.write('Camera(s) ')
+            for i in dead:
+                f.write(str(self.cams[i].number+1)+' ')
+            f.write('stopped sending heartbeats; ')
+        if triggered:
+            f.write('Trigger_latch was enabled')
+        f.close()
+        self.timeline.record('info_saved')
+        end_condition = ((EndMaxTime if self.event_time > self.max_time else 0) |
+                         (EndManual if self.trig_0_state else 0) |
+                         (EndInactive if inactive else 0) |
+                         (EndHeartbeat if dead else 0) |
+                         (EndLatch if triggered else 0))
+        try:
+            self.rundb.add({'date': self.today, 'idx': self.index, 'time_saved': time_saved,
+                            'trig_enable_time': self.trig_enable_time, 'max_time': self.max_time,
+                            'event_time': round(self.event_time, 4), 'end_condition': end_condition,
+                            'inactive': mask(self.cams[i].number for i in inactive), 'dead': mask(self.cams[i].number for i in dead), 'config_hash': config_hash(),
+                            'directory': self.directory})
+        except (sqlite3.Error, OSError) as e:
+            print('Could not add the event to the run database: ', e)
+        self.timeline.record('db_saved')
+        if self.autorun is not None and not self.autorun.finished:
+            self.autorun.saved += 1
+            self.autorun.live_time += self.event_time
+        print('Saved!')
+        self.cleanup()
+
+
+    # Set the status of all the RPi pins before turning off the state_com (useful for determining
+    # --- which RPi(s) failed, if any, before some other method for ending the event). Set state_com
+    # --- to inactive. Turn off trig_enable signal. Send an EndEvent and then a trig_reset signal in the
+    # --- background and wait for them and for the RPis to finish saving.
+    def cleanup(self):
+        self.live = False
+        if self.offloader is not None:
+            self.offloader.resume()
+        self.state = ENDING
+        levels = self.gpio.levels(self.in_pins)
+        for i in range(len(self.cams)):
+            if not levels[i]:
+                self.statuses[i] = False
+            else: self.statuses[i] = None
+        for i in self.dead_cameras():
+            self.statuses[i] = False
+        self.gpio.low(self.state_com_mask | self.trig_enable_mask)
+        self.cameras.start(False)
+        self.end_pulses = self.pulses.sequence([(EndEvent, EndEventWidth), (TriggerReset, PulseWidth)], on_fall=self.wake)
+        if not self.edge_latched:
+            self.timeline.record('end_event', self.end_pulses[0].rise_ns)
+        self.edge_latched = False
+        self.deadline = None if SaveTimeout is None else time.perf_counter() + SaveTimeout
+        self.state = WAITING
+        self.publish()
+        if self.running:
+            self.stage_next()
+
+
+    # Waits until all RPis are inactive. This prevents starting a new event before
+    # --- camera's are done saving their images (and before the EndEvent/trig_reset pulses are done).
+    # If SaveTimeout is set and passes first, or the cameras that are still saving stopped sending
+    # --- heartbeats, gives up on them.
+    def wait_for_end(self):
+        if not self.end_pulses[-1].done.is_set():
+            return
+        if self.cameras.reached():
+            print('Cameras done saving: ' + self.cameras.format())
+        elif set(self.cameras.missing()) <= set(self.dead_cameras()):
+            print('Cameras stopped sending heartbeats: ' + self.cameras.format())
+            self.error += 'Error: Camera(s) ' + ' '.join(str(self.cams[i].number+1) for i in self.cameras.missing()) + ' stopped sending heartbeats!\n'
+            if self.autorun is not None and not self.autorun.finished and self.run_state:
+                self.autorun.errors += 1
+        elif self.deadline is not None and time.perf_counter() > self.deadline:
+            print('Cameras did not finish saving: ' + self.cameras.format())
+            self.error += 'Error: Camera(s) ' + ' '.join(str(self.cams[i].number+1) for i in self.cameras.missing()) + ' did not finish saving!\n'
+            if self.autorun is not None and not self.autorun.finished and self.run_state:
+                self.autorun.errors += 1
+        else: return
+        self.timeline.record_cameras('cam_saved', self.cameras.reached_ns)
+        self.timeline.record('ready')
+        if self.run_state and self.directory != folders.DumpDir:
+            # Nothing may write into the event (or staging) folder once the cameras are done: it is flushed,
+            # --- packed and offloaded from here on, and Take Image shots belong in the dump folder
+            point_images_at(folders.DumpDir)
+            if self.staging is not None:
+                self.staging.flush(self.directory, self.flushed)
+            elif self.running:
+                # Measured before the packer gets to it
+                self.storage.event_saved(self.directory, max([t for t in self.cameras.latencies() if t is not None], default=0),
+                                         on_done=self.event_done)
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        self.deadline = None
+        self.state = IDLE
+        self.publish()
+        self.timeline.flush()
+        if self.running:
+            self.next_event()
+
+
+    # With staging, called from the staging thread once the frames of an event are on disk: the flush is
+    # --- what the disk bandwidth is measured on
+    def flushed(self, directory, size, seconds):
+        self.storage.event_saved(directory, seconds, size, self.event_done)
+
+    # Hands a saved event (with its frames on disk) to the packer or offloader. Called from the storage
+    # --- monitor's thread once the event is measured.
+    def event_done(self, directory):
+        if self.packer is not None:
+            self.packer.submit(directory)
+        elif self.offloader is not None:
+            self.offloader.submit(directory)
+
+
+    # Resets the Images link and GPIO pins and stops the control thread
+    def leave(self):
+        if self.autorun is not None and not self.autorun.finished:
+            self.autorun.finish('stopped')
+        self.running = False
+        point_images_at(folders.DumpDir)
+        self.cleanup()
+        for p in self.end_pulses:
+            p.done.wait()
+        self.pulses.stop()
+        if self.staged is not None:
+            self.release_staged(self.staged)
+            self.staged = None
+        self.timeline.flush()
+        self.rundb.close()
+        if self.staging is not None:
+            self.staging.stop()
+        self.storage.stop()
+        if self.packer is not None:
+            self.packer.stop()
+        if self.offloader is not None:
+            self.offloader.stop()
+        if self.latency.samples:
+            self.latency.save(folders.LatencyFile)
+        self.gpio.cleanup()
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from . import folders
+from .catalog import Inotify, IN_CLOSE_WRITE, IN_MOVED_TO
+
+### Dump folder retention. Whenever no event is live the Images link points at the dump folder, so
+### --- Take Image shots, aborted events and anything the cameras write between events end up there.
+### The DumpRing thread keeps it a ring: once it holds more than max_bytes or max_files, the oldest
+### --- files (by mtime) are removed until it fits again. It trims as soon as inotify reports a new
+### --- file (and every TrimInterval seconds without inotify), in its own thread, so the control thread
+### --- never waits on it.
+### In-memory mode moves the dump folder to a tmpfs, for focus/alignment shots that should never cost disk
+### --- bandwidth; it gets a smaller size limit. The cameras resolve the Images link on their side of the
+### --- NFS mount (like the staging directory, see staging.py), so a local tmpfs like /dev/shm is out of
+### --- their reach: the tmpfs has to be mounted inside the data directory (MemoryDumpName by default,
+### --- with nohide or crossmnt on the export), and use_memory warns about a directory outside it or
+### --- one that is not a mount of its own.
+
+DumpMaxBytes   = 2e9
+DumpMaxFiles   = 2000
+MemoryDumpName = 'dump-tmpfs' # tmpfs mount in the data directory, see use_memory
+MemoryMaxBytes = 200e6
+TrimInterval   = 2   # seconds between checks without inotify
+TrimDelay      = 0.2 # seconds to wait after a new file, so a burst of frames is trimmed once
+
+
+# Removes the oldest files in directory until it holds at most max_bytes and max_files.
+# Returns (files removed, bytes freed).
+def trim(directory, max_bytes=DumpMaxBytes, max_files=DumpMaxFiles):
+    files = []
+    for e in os.scandir(directory):
+        try:
+            if e.is_file(follow_symlinks=False):
+                st = e.stat(follow_symlinks=False)
+                files.append((st.st_mtime_ns, e.name, st.st_size))
+        except FileNotFoundError:
+            pass
+    files.sort()
+    total = sum(size for mtime, name, size in files)
+    count = len(files)
+    removed = freed = 0
+    for mtime, name, size in files:
+        if total <= max_bytes and count <= max_files:
+            break
+        try:
+            os.remove(directory + '/' + name)
+        except FileNotFoundError:
+            pass
+        total -= size
+        count -= 1
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+# Moves the dump folder to the tmpfs mounted at directory (relative to the data directory). Call before
+# --- anything points the Images link at it.
+def use_memory(directory=MemoryDumpName):
+    directory = os.path.join(folders.DataDir, directory)
+    os.makedirs(directory, exist_ok=True)
+    if not folders.in_data_dir(directory):
+        print('Warning: dump folder ' + directory + ' is not inside the data directory ' + folders.DataDir +
+              ', the cameras can only save into it if it is exported and mounted at the same path on them')
+    elif not os.path.ismount(directory):
+        print('Warning: dump folder ' + directory + ' is not a mount point, it stays on the disk until a tmpfs is '
+              'mounted on it')
+    folders.set_dump_dir(directory)
+
+
+class DumpRing(threading.Thread):
+    def __init__(self, max_bytes=DumpMaxBytes, max_files=DumpMaxFiles):
+        super().__init__(name='dump-ring', daemon=True)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def trim(self):
+        try:
+            removed, freed = trim(folders.DumpDir, self.max_bytes, self.max_files)
+        except OSError as e:
+            print('Could not trim the dump folder: ', e)
+            return
+        if removed:
+            print('Dump folder: removed the {} oldest files ({:.1f} MB)'.format(removed, freed/1e6))
+
+    def run(self):
+        self.trim()
+        try:
+            inotify = Inotify()
+            inotify.add(folders.DumpDir, IN_CLOSE_WRITE | IN_MOVED_TO)
+        except (OSError, AttributeError) as e:
+            print('Dump folder without inotify, trimming every {} s: '.format(TrimInterval), e)
+            inotify = None
+        while self.running:
+            if inotify is None:
+                time.sleep(TrimInterval)
+            elif not inotify.read(1):
+                continue
+            else:
+                time.sleep(TrimDelay)
+                inotify.read(0)
+            self.trim()
+        if inotify is not None:
+            inotify.close()
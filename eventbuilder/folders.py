@@ -0,0 +1,120 @@
+import os
+from datetime import datetime
+
+### Locations on the EB's disk. The cameras save to /mnt/event-builder/Images/, which is the
+### --- 'Images' soft link below, so pointing that link somewhere else redirects all camera saves.
+
+DataDir     = '/home/pi/camera-data'
+DumpDir     = DataDir + '/dump'
+ImagesLink  = DataDir + '/Images'
+LatencyFile = DataDir + '/latch_latency.txt'
+TimelineFile = DataDir + '/timeline.jsonl'
+RunDB        = DataDir + '/runs.sqlite' # see rundb.py
+CatalogDB    = DataDir + '/catalog.sqlite' # see catalog.py
+CamerasFile  = DataDir + '/cameras.json' # see cameras.py
+TuningFile   = DataDir + '/trigger-tuning.json' # see tuner.py
+CounterFile  = 'next_event' # in each day directory, see allocate_event
+
+
+# Moves everything above under another directory (the simulation and benchmarks run in a temporary
+# --- one). Modules look these up through folders.<name> when they need them, so call this first.
+def set_data_dir(directory):
+    global DataDir, DumpDir, ImagesLink, LatencyFile, TimelineFile, RunDB, CatalogDB, CamerasFile, TuningFile
+    DataDir      = directory
+    DumpDir      = DataDir + '/dump'
+    ImagesLink   = DataDir + '/Images'
+    LatencyFile  = DataDir + '/latch_latency.txt'
+    TimelineFile = DataDir + '/timeline.jsonl'
+    RunDB        = DataDir + '/runs.sqlite'
+    CatalogDB    = DataDir + '/catalog.sqlite'
+    CamerasFile  = DataDir + '/cameras.json'
+    TuningFile   = DataDir + '/trigger-tuning.json'
+
+
+# Moves the dump folder somewhere else (e.g. a tmpfs, see dump.py)
+def set_dump_dir(directory):
+    global DumpDir
+    DumpDir = directory
+
+
+# Whether directory is in the data directory (symlinks resolved), i.e. reachable by the cameras through
+# --- their NFS mount of it
+def in_data_dir(directory):
+    data_dir = os.path.realpath(DataDir)
+    return os.path.commonpath([os.path.realpath(directory), data_dir]) == data_dir
+
+
+# Initializing the dump folder as the default save path
+def make_dump():
+    if not os.path.isdir(DumpDir):
+        os.mkdir(DumpDir)
+
+
+# Atomically repoints the Images soft link (new link is made next to it, then renamed over it)
+def point_images_at(directory):
+    os.symlink(directory, ImagesLink + '.tmp')
+    os.rename(ImagesLink + '.tmp', ImagesLink)
+
+
+# Makes the directory for the next event in day_dir and returns its index. The next index is kept in
+# --- a small counter file in the day directory, so this takes the same time however many events
+# --- the day holds. mkdir fails if the directory exists (it is atomic, like O_EXCL), so an index is
+# --- never reused: if it was taken anyway (counter file lost or edited), the next free one is used.
+# Without a counter file (first event of the day, or a day from before the counter), numbering
+# --- carries on after the highest numbered event directory.
+def allocate_event(day_dir):
+    counter = day_dir + '/' + CounterFile
+    try:
+        with open(counter) as f:
+            index = int(f.read())
+    except (FileNotFoundError, ValueError):
+        index = max([int(d) for d in os.listdir(day_dir) if d.isdigit()], default=-1) + 1
+    while True:
+        try:
+            os.mkdir(day_dir + '/' + str(index))
+            break
+        except FileExistsError:
+            index += 1
+    with open(counter + '.tmp', 'w') as f:
+        f.write(str(index + 1))
+    os.replace(counter + '.tmp', counter)
+    return index
+
+
+# Gives an allocated event directory back if it was never used (the counter is rewound when it is
+# --- still the last index handed out, so numbering stays contiguous)
+def release_event(day_dir, index):
+    os.rmdir(day_dir + '/' + str(index))
+    counter = day_dir + '/' + CounterFile
+    try:
+        with open(counter) as f:
+            last = int(f.read()) == index + 1
+    except (FileNotFoundError, ValueError):
+        last = False
+    if last:
+        with open(counter + '.tmp', 'w') as f:
+            f.write(str(index))
+        os.replace(counter + '.tmp', counter)
+
+
+def today():
+    now = datetime.now()
+    return now.strftime('%Y') + now.strftime('%m') + now.strftime('%d')
+
+
+# Makes the folder for the next event without pointing the Images link at it, so it can be done ahead
+# --- of time (during the previous event's save). Returns the date string, event index and path.
+def stage_folder():
+    day = today()
+    try:
+        os.mkdir(DataDir + '/' + day)
+    except FileExistsError:
+        pass
+    index = allocate_event(DataDir + '/' + day)
+    return day, index, DataDir + '/' + day + '/' + str(index)
+
+
+# Removes a staged folder that was not used
+def unstage_folder(staged):
+    day, index, directory = staged
+    release_event(DataDir + '/' + day, index)
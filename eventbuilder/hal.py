@@ -0,0 +1,246 @@
+import mmap
+import os
+import threading
+import time
+
+### GPIO backends. Pins are given as physical (BOARD) numbers like everywhere else in the EB, but pin
+### --- levels are passed around as bit masks with one bit per BCM line (the layout of the SoC's GPIO
+### --- registers). That way all input pins are read in one snapshot() and a group of outputs such as
+### --- StateCom or TriggerEnable is set in one masked write:
+###
+###     in_mask = gpio.mask(InPins)
+###     all_ready = gpio.snapshot() & in_mask == in_mask
+###     gpio.high(gpio.mask(StateCom))
+###
+### Edge callbacks are called as callback(pin, level, t_ns) with t_ns the time.monotonic_ns()
+### --- taken as soon as the edge is seen. A pin can have several callbacks (for different edges);
+### --- the backend watches both edges once and dispatches to them.
+### Backends:
+###   'rpi'  - RPi.GPIO, one GPIO.input/GPIO.output call per pin
+###   'mmap' - reads and writes the GPIO registers directly through /dev/gpiomem (edge detection
+###            still goes through RPi.GPIO)
+###   'sim'  - pure Python, no hardware. Inputs are driven with set_input()
+
+RISING  = 'rising'
+FALLING = 'falling'
+BOTH    = 'both'
+
+# Physical header pin -> BCM GPIO line for the 40 pin header
+BoardToBCM = {3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, 15: 22, 16: 23, 18: 24,
+              19: 10, 21: 9, 22: 25, 23: 11, 24: 8, 26: 7, 27: 0, 28: 1, 29: 5, 31: 6, 32: 12,
+              33: 13, 35: 19, 36: 16, 37: 26, 38: 20, 40: 21}
+
+
+# Bit of a single pin in snapshot() and write() masks
+def bit(pin):
+    return 1 << BoardToBCM[pin]
+
+
+class Backend:
+    def __init__(self):
+        self.inputs = []
+        self.outputs = []
+        self.callbacks = {}
+
+    # Bit mask for a pin or list of pins
+    def mask(self, pins):
+        if isinstance(pins, int):
+            return bit(pins)
+        m = 0
+        for pin in pins:
+            m |= bit(pin)
+        return m
+
+    # Sets the pin directions and drives all outputs low
+    def setup(self, inputs, outputs):
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    # Levels of all input pins, one bit per pin (see mask)
+    def snapshot(self):
+        raise NotImplementedError
+
+    # Masked write: every output pin in mask is set to its bit in levels
+    def write(self, mask, levels):
+        raise NotImplementedError
+
+    # Starts/stops edge detection on a pin, calling dispatch for every edge
+    def watch(self, pin):
+        raise NotImplementedError
+
+    def unwatch(self, pin):
+        raise NotImplementedError
+
+    def cleanup(self):
+        pass
+
+    def add_edge_callback(self, pin, edge, callback):
+        if pin not in self.callbacks:
+            self.callbacks[pin] = []
+            self.watch(pin)
+        self.callbacks[pin].append((edge, callback))
+
+    # Removes one callback from a pin, or all of them if callback is None
+    def remove_edge_callback(self, pin, callback=None):
+        callbacks = [c for c in self.callbacks.get(pin, []) if callback is not None and c[1] != callback]
+        if callbacks:
+            self.callbacks[pin] = callbacks
+        elif pin in self.callbacks:
+            del self.callbacks[pin]
+            self.unwatch(pin)
+
+    def dispatch(self, pin, level, t_ns):
+        for edge, callback in self.callbacks.get(pin, ()):
+            if edge == BOTH or (edge == RISING) == level:
+                callback(pin, level, t_ns)
+
+    def high(self, mask):
+        self.write(mask, mask)
+
+    def low(self, mask):
+        self.write(mask, 0)
+
+    def input(self, pin):
+        return bool(self.snapshot() & bit(pin))
+
+    # Levels of the given pins as a list of bools, all from the same snapshot
+    def levels(self, pins):
+        levels = self.snapshot()
+        return [bool(levels & bit(pin)) for pin in pins]
+
+
+class RPiGPIOBackend(Backend):
+    def __init__(self):
+        super().__init__()
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+
+    def setup(self, inputs, outputs):
+        super().setup(inputs, outputs)
+        GPIO = self.GPIO
+        GPIO.setmode(GPIO.BOARD) # use Physical GPIO Numbering
+        GPIO.setup(self.inputs, GPIO.IN)
+        GPIO.setup(self.outputs, GPIO.OUT)
+        GPIO.output(self.outputs, GPIO.LOW)
+        self.input_bits = [(pin, bit(pin)) for pin in self.inputs]
+        self.output_bits = [(pin, bit(pin)) for pin in self.outputs]
+
+    def snapshot(self):
+        levels = 0
+        for pin, b in self.input_bits:
+            if self.GPIO.input(pin):
+                levels |= b
+        return levels
+
+    def write(self, mask, levels):
+        high = [pin for pin, b in self.output_bits if mask & levels & b]
+        low = [pin for pin, b in self.output_bits if mask & ~levels & b]
+        if high:
+            self.GPIO.output(high, self.GPIO.HIGH)
+        if low:
+            self.GPIO.output(low, self.GPIO.LOW)
+
+    def watch(self, pin):
+        def on_edge(channel):
+            t_ns = time.monotonic_ns()
+            self.dispatch(pin, bool(self.GPIO.input(pin)), t_ns)
+        self.GPIO.add_event_detect(pin, self.GPIO.BOTH, callback=on_edge)
+
+    def unwatch(self, pin):
+        self.GPIO.remove_event_detect(pin)
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+
+# Register offsets (in 32 bit words) of the BCM2835/2711 GPIO block
+GPSET0 = 0x1c // 4
+GPCLR0 = 0x28 // 4
+GPLEV0 = 0x34 // 4
+
+class MmapBackend(RPiGPIOBackend):
+    def __init__(self, device='/dev/gpiomem'):
+        super().__init__()
+        fd = os.open(device, os.O_RDWR | os.O_SYNC)
+        try:
+            self.mem = mmap.mmap(fd, 4096, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self.regs = memoryview(self.mem).cast('I')
+
+    # The pin directions (and edge detection) are still set up through RPi.GPIO
+    def setup(self, inputs, outputs):
+        super().setup(inputs, outputs)
+        self.input_mask = self.mask(self.inputs)
+        self.output_mask = self.mask(self.outputs)
+
+    def snapshot(self):
+        return self.regs[GPLEV0] & self.input_mask
+
+    # GPSET0/GPCLR0 only change the lines whose bits are written, so the write is masked by the hardware
+    def write(self, mask, levels):
+        mask &= self.output_mask
+        if mask & levels:
+            self.regs[GPSET0] = mask & levels
+        if mask & ~levels:
+            self.regs[GPCLR0] = mask & ~levels
+
+    def cleanup(self):
+        self.regs.release()
+        self.mem.close()
+        super().cleanup()
+
+
+class SimBackend(Backend):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.levels_now = 0
+        # Called as listener(mask, levels, t_ns) after every write, for simulated devices on the outputs
+        self.listeners = []
+
+    def setup(self, inputs, outputs):
+        super().setup(inputs, outputs)
+        self.input_mask = self.mask(self.inputs)
+        self.output_mask = self.mask(self.outputs)
+        with self.lock:
+            self.levels_now &= ~self.output_mask
+
+    def snapshot(self):
+        return self.levels_now & self.input_mask
+
+    def write(self, mask, levels):
+        mask &= self.output_mask
+        with self.lock:
+            self.levels_now = (self.levels_now & ~mask) | (levels & mask)
+        t_ns = time.monotonic_ns()
+        for listener in self.listeners:
+            listener(mask, levels, t_ns)
+
+    # Level of an output pin (inputs are read with input/snapshot)
+    def output_level(self, pin):
+        return bool(self.levels_now & bit(pin))
+
+    # Drives a simulated input and calls its edge callbacks, if the level changed, in the calling thread
+    def set_input(self, pin, level):
+        b = bit(pin)
+        with self.lock:
+            changed = bool(self.levels_now & b) != bool(level)
+            if level:
+                self.levels_now |= b
+            else: self.levels_now &= ~b
+        t_ns = time.monotonic_ns()
+        if changed:
+            self.dispatch(pin, bool(level), t_ns)
+
+    def watch(self, pin):
+        pass
+
+    def unwatch(self, pin):
+        pass
+
+
+Backends = {'rpi': RPiGPIOBackend, 'mmap': MmapBackend, 'sim': SimBackend}
+
+def open_backend(name):
+    return Backends[name]()
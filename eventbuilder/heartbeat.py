@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import deque
+from .hal import BOTH
+
+### Camera liveness from heartbeats. In heartbeat mode every camera toggles a line (HeartbeatPins in
+### --- pins.py, one per camera) every period seconds while its event loop is running. A frozen camera
+### --- keeps its state pin high and looks healthy, but it stops toggling: once a camera has not
+### --- toggled for missed periods it is declared dead. The edges are timestamped in the GPIO
+### --- backend's callback and check() is called from the control thread's tick, so a dead camera is
+### --- noticed within (missed + 1 tick) instead of only once wait_for_end never finishes.
+### The toggle rate of each camera is measured over its last edges (frequencies) and shown next to its
+### --- status, so a camera whose event loop is slowing down shows before it is declared dead.
+
+class HeartbeatMonitor:
+    def __init__(self, gpio, pins, period, missed=3):
+        self.pins = list(pins)
+        self.period_ns = int(period*1e9)
+        self.missed = missed
+        self.lock = threading.Lock()
+        self.active = False
+        self.start_ns = 0
+        self.last_ns = [None]*len(self.pins)
+        self.intervals = [deque(maxlen=16) for pin in self.pins]
+        self.dead = [False]*len(self.pins)
+        for pin in self.pins:
+            gpio.add_edge_callback(pin, BOTH, self.on_edge)
+
+
+    # Starts watching: every camera gets missed periods from now to show a toggle. The rate is measured
+    # --- from the first toggle on (the time up to it is not a toggle interval).
+    def start(self):
+        with self.lock:
+            self.start_ns = time.monotonic_ns()
+            self.last_ns = [None]*len(self.pins)
+            for intervals in self.intervals:
+                intervals.clear()
+            self.dead = [False]*len(self.pins)
+            self.active = True
+
+    def stop(self):
+        self.active = False
+
+
+    def on_edge(self, pin, level, t_ns):
+        i = self.pins.index(pin)
+        with self.lock:
+            if self.last_ns[i] is not None:
+                self.intervals[i].append(t_ns - self.last_ns[i])
+            self.last_ns[i] = t_ns
+
+
+    # Returns the cameras that were declared dead by this call
+    def check(self):
+        if not self.active:
+            return []
+        now = time.monotonic_ns()
+        newly_dead = []
+        with self.lock:
+            for i in range(len(self.pins)):
+                last_ns = self.start_ns if self.last_ns[i] is None else self.last_ns[i]
+                if not self.dead[i] and now - last_ns > self.missed*self.period_ns:
+                    self.dead[i] = True
+                    newly_dead.append(i)
+        return newly_dead
+
+    # Cameras currently declared dead
+    def dead_cameras(self):
+        return [i for i in range(len(self.pins)) if self.dead[i]]
+
+    # Measured toggle rate of each camera in Hz over the recent edges (None before two edges)
+    def frequencies(self):
+        with self.lock:
+            return [None if not intervals else 1e9*len(intervals)/sum(intervals) for intervals in self.intervals]
@@ -0,0 +1,33 @@
+# Histogram of latencies with power-of-two bins in microseconds (<1us, 1-2us, 2-4us, ... up to ~0.5s).
+# Used to record the time from the trigger latch edge to the EndEvent signal being raised.
+class LatencyHistogram:
+    def __init__(self, n_bins=20):
+        self.counts = [0]*n_bins
+        self.samples = 0
+        self.total_ns = 0
+        self.worst_ns = 0
+
+    def add(self, latency_ns):
+        us = max(int(latency_ns) // 1000, 0)
+        self.counts[min(us.bit_length(), len(self.counts)-1)] += 1
+        self.samples += 1
+        self.total_ns += latency_ns
+        self.worst_ns = max(self.worst_ns, latency_ns)
+
+    # One line per non-empty bin with its range, count and a bar, followed by the mean and worst case
+    def format(self):
+        lines = []
+        for i, count in enumerate(self.counts):
+            if not count:
+                continue
+            low = 0 if i == 0 else 2**(i-1)
+            high = '' if i == len(self.counts)-1 else str(2**i)
+            lines.append('{:>7}-{:<7} us: {:6d} {}'.format(low, high, count, '#'*max(1, 50*count//self.samples)))
+        if self.samples:
+            lines.append('Samples: {}, mean: {:.1f} us, worst: {:.1f} us'.format(
+                self.samples, self.total_ns/self.samples/1000, self.worst_ns/1000))
+        return '\n'.join(lines)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write(self.format()+'\n')
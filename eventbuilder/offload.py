@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import os
+import queue
+import threading
+import time
+from . import folders
+
+### Offload to archive storage. Once an event is saved (and packed, with --pack), its folder is copied
+### --- to the same <day>/<index> path under an archive directory: a mounted NAS share, or any local
+### --- directory for testing. Several events are copied at once (Streams threads), all sharing one
+### --- bandwidth cap so the copies never starve the cameras writing the next event over NFS, and the
+### --- copies stop at the next chunk while an event is live (EventControl pauses the Offloader).
+### Every file is copied to <name>.part, fsynced, read back and checked against the SHA-256 of what was
+### --- read from the source before it is renamed into place. Its checksum is appended to
+### --- SHA256SUMS.part in the archive folder, so an interrupted offload skips the files already done;
+### --- once all files are copied that becomes SHA256SUMS (sha256sum -c format) and the local folder
+### --- gets an .offloaded marker. Local folders are never removed here.
+###
+###     python -m eventbuilder.offload copy /mnt/archive --bandwidth 50
+###     python -m eventbuilder.offload verify /mnt/archive/20261018/3
+
+Streams    = 2       # events copied at the same time
+Bandwidth  = None    # bytes/s shared by all streams (reads and read-backs), None for no cap
+ChunkSize  = 1 << 20
+SumsName   = 'SHA256SUMS'
+MarkerName = '.offloaded' # in the local event folder once it is in the archive
+
+
+# Shared token bucket for the bandwidth cap, which also holds the copies while paused
+class Throttle:
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.allowance = 0
+        self.last = time.monotonic()
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.stopped = False
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    def stop(self):
+        self.stopped = True
+        self.resumed.set()
+
+    # Called before moving n bytes: waits while paused and for the bandwidth cap (bursts up to one
+    # --- second's worth). Raises InterruptedError once stopped.
+    def take(self, n):
+        self.resumed.wait()
+        if self.stopped:
+            raise InterruptedError('offload stopped')
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.allowance + (now - self.last)*self.rate, self.rate) - n
+            self.last = now
+            wait = -self.allowance/self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def file_hash(path, throttle):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            throttle.take(ChunkSize)
+            chunk = f.read(ChunkSize)
+            if not chunk:
+                return h.hexdigest()
+            h.update(chunk)
+
+
+# Copies src to dst through dst.part and checks the copy. Returns the SHA-256 of the file.
+def copy_file(src, dst, throttle):
+    h = hashlib.sha256()
+    part = dst + '.part'
+    with open(src, 'rb') as fin, open(part, 'wb') as fout:
+        while True:
+            throttle.take(ChunkSize)
+            chunk = fin.read(ChunkSize)
+            if not chunk:
+                break
+            h.update(chunk)
+            fout.write(chunk)
+        fout.flush()
+        os.fsync(fout.fileno())
+        st = os.fstat(fin.fileno())
+    digest = h.hexdigest()
+    if file_hash(part, throttle) != digest:
+        os.remove(part)
+        raise ValueError(dst + ' does not match ' + src + ' after copying')
+    os.utime(part, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(part, dst)
+    return digest
+
+
+def read_sums(path):
+    sums = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                digest, sep, name = line.rstrip('\n').partition('  ')
+                if sep:
+                    sums[name] = digest
+    except FileNotFoundError:
+        pass
+    return sums
+
+
+def event_files(directory):
+    return sorted(e.name for e in os.scandir(directory) if e.is_file(follow_symlinks=False)
+                  and e.name != MarkerName and not e.name.endswith(('.part', '.tmp')))
+
+
+# Archive folder of a local event folder: <archive>/<day>/<index>
+def archive_folder(directory, archive):
+    day, index = os.path.normpath(os.path.abspath(directory)).split(os.sep)[-2:]
+    return os.path.join(archive, day, index)
+
+
+# Copies an event folder to the archive, skipping files an interrupted offload already copied.
+# Returns a dict with the number of files, bytes copied and seconds taken.
+def offload_event(directory, archive, throttle=None):
+    throttle = throttle or Throttle()
+    tic = time.perf_counter()
+    dest = archive_folder(directory, archive)
+    os.makedirs(dest, exist_ok=True)
+    done = read_sums(dest + '/' + SumsName + '.part')
+    names = event_files(directory)
+    copied = 0
+    with open(dest + '/' + SumsName + '.part', 'a') as sums:
+        for name in names:
+            src = directory + '/' + name
+            if name in done and os.path.exists(dest + '/' + name) and \
+                    os.path.getsize(dest + '/' + name) == os.path.getsize(src):
+                continue
+            done[name] = copy_file(src, dest + '/' + name, throttle)
+            copied += os.path.getsize(src)
+            sums.write(done[name] + '  ' + name + '\n')
+            sums.flush()
+    with open(dest + '/' + SumsName + '.tmp', 'w') as f:
+        for name in names:
+            f.write(done[name] + '  ' + name + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(dest + '/' + SumsName + '.tmp', dest + '/' + SumsName)
+    os.remove(dest + '/' + SumsName + '.part')
+    with open(directory + '/' + MarkerName, 'w') as f:
+        f.write(dest + '\n')
+    return {'directory': directory, 'dest': dest, 'files': len(names), 'bytes': copied,
+            'seconds': time.perf_counter() - tic}
+
+
+# Checks the files of an archive folder against its SHA256SUMS. Returns the names that do not match.
+def verify(dest):
+    throttle = Throttle()
+    bad = []
+    for name, digest in read_sums(dest + '/' + SumsName).items():
+        try:
+            ok = file_hash(dest + '/' + name, throttle) == digest
+        except FileNotFoundError:
+            ok = False
+        if not ok:
+            bad.append(name)
+    return bad
+
+
+# Saved events (folders with an info.txt) under DataDir that are not in the archive yet, oldest first
+def pending_events(root=None):
+    root = root or folders.DataDir
+    events = []
+    for day in sorted(os.listdir(root)):
+        if not day.isdigit() or not os.path.isdir(root + '/' + day):
+            continue
+        for index in sorted((i for i in os.listdir(root + '/' + day) if i.isdigit()), key=int):
+            directory = root + '/' + day + '/' + index
+            if os.path.exists(directory + '/info.txt') and not os.path.exists(directory + '/' + MarkerName):
+                events.append(directory)
+    return events
+
+
+# Copies submitted events to the archive in streams threads
+class Offloader:
+    def __init__(self, archive, streams=Streams, bandwidth=Bandwidth):
+        self.archive = archive
+        self.throttle = Throttle(bandwidth)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.workers = [threading.Thread(target=self.work, name='offload-' + str(i), daemon=True)
+                        for i in range(streams)]
+        for w in self.workers:
+            w.start()
+
+    def submit(self, directory):
+        with self.lock:
+            if directory in self.pending:
+                return
+            self.pending.add(directory)
+        self.queue.put(directory)
+
+    # Submits the saved events an earlier run did not get to, except those in skip
+    def submit_pending(self, skip=()):
+        for directory in pending_events():
+            if directory not in skip:
+                self.submit(directory)
+
+    def pause(self):
+        self.throttle.pause()
+
+    def resume(self):
+        self.throttle.resume()
+
+    def work(self):
+        while True:
+            directory = self.queue.get()
+            if directory is None:
+                return
+            try:
+                result = offload_event(directory, self.archive, self.throttle)
+                print('Offloaded {directory}: {files} files, {bytes} bytes in {seconds:.2f} s'.format(**result))
+            except InterruptedError:
+                print('Offload of ' + directory + ' stopped, it resumes next time')
+            except (OSError, ValueError) as e:
+                print('Offload of ' + directory + ' failed: ', e)
+            with self.lock:
+                self.pending.discard(directory)
+
+    # Stops the copies in progress (at the next chunk, they pick up from there next time)
+    def stop(self):
+        self.throttle.stop()
+        for w in self.workers:
+            self.queue.put(None)
+        for w in self.workers:
+            w.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eb-offload', description='Copy saved events to archive storage')
+    commands = parser.add_subparsers(dest='command', required=True)
+    copy = commands.add_parser('copy', help='copy events to the archive')
+    copy.add_argument('archive')
+    copy.add_argument('directories', nargs='*', help='event folders (default: all saved events not offloaded yet)')
+    copy.add_argument('--data-dir', help='data directory (default: {})'.format(folders.DataDir))
+    copy.add_argument('--streams', type=int, default=Streams, help='events copied at the same time')
+    copy.add_argument('--bandwidth', type=float, help='MB/s cap for all streams together')
+    check = commands.add_parser('verify', help='check archive folders against their SHA256SUMS')
+    check.add_argument('directories', nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.command == 'copy':
+        if args.data_dir:
+            folders.set_data_dir(os.path.abspath(args.data_dir))
+        offloader = Offloader(args.archive, args.streams, args.bandwidth*1e6 if args.bandwidth else None)
+        for directory in args.directories or pending_events():
+            offloader.submit(os.path.abspath(directory))
+        try:
+            while offloader.pending:
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            print('Stopping')
+        offloader.stop()
+    elif args.command == 'verify':
+        failed = False
+        for directory in args.directories:
+            if not os.path.exists(directory + '/' + SumsName):
+                print(directory + ': no ' + SumsName + ', not (completely) offloaded')
+                failed = True
+                continue
+            bad = verify(directory)
+            print('{}: {}'.format(directory, 'ok' if not bad else 'does not match: ' + ' '.join(bad)))
+            failed = failed or bool(bad)
+        if failed:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
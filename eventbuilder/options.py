@@ -0,0 +1,79 @@
+import argparse
+from .pins import setup_gpio
+from .folders import make_dump
+from .dump import DumpRing, use_memory, MemoryDumpName, DumpMaxBytes, MemoryMaxBytes, DumpMaxFiles
+from .control import EventControl
+from .compression import Codec
+from . import config
+
+### Command line options of the engine, shared by the front ends (eb.py, eb-run, eb-bench): GPIO backend,
+### --- heartbeats, packing, offloading, staging, the save budget and the dump folder.
+###
+###     parser = argparse.ArgumentParser()
+###     add_engine_arguments(parser)
+###     control = build_control(parser.parse_args())
+
+
+# argparse type of --pack: the codec is checked when the arguments are parsed, so a missing optional
+# --- module is an argument error rather than a traceback from the packer process
+def codec(name):
+    try:
+        Codec(name)
+    except (ImportError, ValueError) as e:
+        raise argparse.ArgumentTypeError('codec {}: {}'.format(name, e))
+    return name
+
+
+# With gpio False the front end picks the backend itself and passes it to build_control (eb-bench runs
+# --- on the sim backend only)
+def add_engine_arguments(parser, gpio=True):
+    if gpio:
+        parser.add_argument('--gpio', choices=['rpi', 'mmap', 'sim'], default='rpi', help='GPIO backend')
+    parser.add_argument('--heartbeat', type=float, metavar='PERIOD',
+                        help='watch the cameras\' heartbeat lines, toggled every PERIOD seconds')
+    parser.add_argument('--pack', nargs='?', const='none', type=codec, metavar='CODEC',
+                        help='pack each event\'s frames into one file once it is saved, compressed with CODEC')
+    parser.add_argument('--pack-workers', type=int, default=1, help='processes packing events')
+    parser.add_argument('--offload', metavar='ARCHIVE', help='copy each saved event to this directory')
+    parser.add_argument('--offload-streams', type=int, default=2, help='events copied at the same time')
+    parser.add_argument('--offload-bandwidth', type=float, metavar='MB/S', help='cap for all offload streams together')
+    parser.add_argument('--staging', metavar='DIR', help='directory on a tmpfs the cameras save into first (exported to them, see staging.py)')
+    parser.add_argument('--staging-high-water', type=float, default=1000, metavar='MB',
+                        help='frames held in the staging directory before events wait for the disk')
+    parser.add_argument('--save-budget', type=float, default=config.SaveBudget, metavar='S',
+                        help='seconds the save of an event may be expected to take before events wait (0: no limit)')
+    parser.add_argument('--dump-in-memory', nargs='?', const=MemoryDumpName, metavar='DIR',
+                        help='keep the dump folder (Take Image, idle captures) on the tmpfs mounted at DIR in the '
+                        'data directory (default: {}, see dump.py)'.format(MemoryDumpName))
+    parser.add_argument('--dump-max-mb', type=float, help='size the dump folder is trimmed to (default: {:g} MB, {:g} MB '
+                        'in memory)'.format(DumpMaxBytes/1e6, MemoryMaxBytes/1e6))
+    parser.add_argument('--dump-max-files', type=int, default=DumpMaxFiles, help='files the dump folder is trimmed to')
+
+
+# The engine options of parsed arguments (their defaults for those args does not have), for running the
+# --- engine from code
+def engine_options(args=None):
+    parser = argparse.ArgumentParser()
+    add_engine_arguments(parser, gpio=False)
+    options = parser.parse_args([])
+    for name in vars(options):
+        if hasattr(args, name):
+            setattr(options, name, getattr(args, name))
+    return options
+
+
+# Sets up the dump folder (and its DumpRing) and the GPIO backend and returns the EventControl for the
+# --- parsed engine options. The control thread is not started yet.
+def build_control(args, gpio=None):
+    config.SaveBudget = args.save_budget
+    if args.dump_in_memory:
+        use_memory(args.dump_in_memory)
+    make_dump()
+    DumpRing(args.dump_max_mb*1e6 if args.dump_max_mb else MemoryMaxBytes if args.dump_in_memory else DumpMaxBytes,
+             args.dump_max_files).start()
+    if gpio is None:
+        gpio = setup_gpio(args.gpio)
+    return EventControl(gpio, heartbeat=args.heartbeat, pack=args.pack, pack_workers=args.pack_workers,
+                        offload=args.offload, offload_streams=args.offload_streams,
+                        offload_bandwidth=args.offload_bandwidth*1e6 if args.offload_bandwidth else None,
+                        staging=args.staging, staging_high_water=args.staging_high_water*1e6)
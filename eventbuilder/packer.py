@@ -0,0 +1,266 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from .compression import Codec
+
+### Event packs. The cameras write every frame as its own file (camN_<time>... .bmp), a few hundred per
+### --- event. Once an event is saved, the packer moves its frames into one file in the event folder,
+### --- frames.zip: a zip archive holding the frames, encoded with one of the lossless codecs in
+### --- compression.py ('none' by default, which any zip tool can extract), plus index.json with the
+### --- codec and the camera, size and timestamp (the original file's mtime) of each frame.
+### The pack is written next to the frames, read back and checked against the CRC of every original
+### --- before it is renamed into place, and only then are the originals removed. Packing an event
+### --- that was interrupted half way picks up where it stopped.
+### Packing runs in a pool of worker processes (at a lower priority), so it never holds up the control
+### --- thread, and events are packed in parallel when one worker cannot keep up.
+### Readers should use frame_names/open_frame (or Pack), which find a frame whether it is packed or not.
+###
+###     python -m eventbuilder.packer pack /home/pi/camera-data/20261018/*
+###     python -m eventbuilder.packer list /home/pi/camera-data/20261018/3
+
+PackName  = 'frames.zip'
+IndexName = 'index.json'
+ImageExtensions = ('.bmp', '.png', '.jpg', '.tiff')
+
+PackerNice = 10 # niceness of the packer process
+
+
+# Camera number of a file from its name (the cameras save as camN_<date>...), None for other files
+def camera_of(name):
+    number = name[3:].partition('_')[0]
+    if name.startswith('cam') and number.isdigit():
+        return int(number)
+    return None
+
+def is_frame(name):
+    return name.lower().endswith(ImageExtensions)
+
+
+class Pack:
+    def __init__(self, directory, name=PackName):
+        self.zip = zipfile.ZipFile(directory + '/' + name)
+        self.index = json.loads(self.zip.read(IndexName))
+        self.codec = Codec(self.index.get('codec', 'none'))
+        self.entries = {f['name']: f for f in self.index['frames']}
+        self.last = {} # cam -> (name, decoded) of the last frame read, for delta codecs
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Index entries ({'name', 'cam', 'size', 'mtime_ns'}) of all frames, or of camera cam's
+    def frames(self, cam=None):
+        return [f for f in self.index['frames'] if cam is None or f['cam'] == cam]
+
+    def names(self, cam=None):
+        return [f['name'] for f in self.frames(cam)]
+
+    # Frame timestamps in ns (time.time_ns() clock)
+    def timestamps(self, cam=None):
+        return [f['mtime_ns'] for f in self.frames(cam)]
+
+    # The frame as an image file: the original bytes, or a PNG/WebP with the same pixels for those codecs
+    def read(self, name):
+        f = self.entries[name]
+        prev = None
+        if f.get('prev'):
+            last = self.last.get(f['cam'])
+            prev = last[1] if last is not None and last[0] == f['prev'] else self.read(f['prev'])
+        data = self.codec.decode(self.zip.read(name), prev)
+        if self.codec.delta:
+            self.last[f['cam']] = (name, data)
+        return data
+
+
+# Sorted names of camera cam's frames in an event folder, packed or not
+def frame_names(directory, cam):
+    names = set(name for name in os.listdir(directory) if is_frame(name) and camera_of(name) == cam)
+    if os.path.exists(directory + '/' + PackName):
+        with Pack(directory) as pack:
+            names.update(pack.names(cam))
+    return sorted(names)
+
+# The pack open_frame last read from, as (directory, mtime_ns, Pack), kept open so reading an event's
+# --- frames one by one opens the zip and parses its index once (and delta codecs decode each frame once)
+LastPack = None
+LastPackLock = threading.Lock()
+
+# Opens a frame (as a binary file object), from the folder if it is there, otherwise from the pack
+def open_frame(directory, name):
+    global LastPack
+    try:
+        return open(directory + '/' + name, 'rb')
+    except FileNotFoundError:
+        pass
+    mtime_ns = os.stat(directory + '/' + PackName).st_mtime_ns
+    with LastPackLock:
+        if LastPack is None or LastPack[:2] != (directory, mtime_ns):
+            if LastPack is not None:
+                LastPack[2].close()
+                LastPack = None
+            LastPack = (directory, mtime_ns, Pack(directory))
+        return io.BytesIO(LastPack[2].read(name))
+
+
+# Packs the frames in an event folder into frames.zip with a codec (see compression.py) and removes
+# --- them. Returns a dict with the number of frames, bytes before/after and seconds taken, or None
+# --- if there was nothing to pack.
+def pack_event(directory, codec='none'):
+    tic = time.perf_counter()
+    pack = directory + '/' + PackName
+    names = sorted(name for name in os.listdir(directory) if is_frame(name))
+    if not names:
+        return None
+    bytes_in = 0
+    if os.path.exists(pack):
+        # Already packed, the originals were not all removed yet
+        with Pack(directory) as p:
+            if not set(names) <= set(p.entries):
+                raise ValueError(directory + ' has frames that are not in its pack')
+            for name in names:
+                with open(directory + '/' + name, 'rb') as f:
+                    data = f.read()
+                if not p.codec.check(data, p.read(name)):
+                    raise ValueError(directory + '/' + name + ' does not match its packed copy')
+                bytes_in += len(data)
+    else:
+        codec = Codec(codec)
+        tmp = pack + '.tmp'
+        frames = []
+        crcs = {}
+        prev = {} # cam -> (name, bytes) of its previous frame
+        counts = {}
+        with zipfile.ZipFile(tmp, 'w', codec.zip_method) as z:
+            for name in names:
+                path = directory + '/' + name
+                st = os.stat(path)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                crcs[name] = zlib.crc32(data)
+                bytes_in += len(data)
+                cam = camera_of(name)
+                entry = {'name': name, 'cam': cam, 'size': len(data), 'mtime_ns': st.st_mtime_ns}
+                counts[cam] = counts.get(cam, -1) + 1
+                before = None
+                if not codec.keyframe(counts[cam]) and cam in prev:
+                    entry['prev'], before = prev[cam]
+                info = zipfile.ZipInfo(name, time.localtime(st.st_mtime)[:6])
+                info.compress_type = codec.zip_method
+                z.writestr(info, codec.encode(data, before))
+                frames.append(entry)
+                prev[cam] = (name, data)
+            z.writestr(IndexName, json.dumps({'codec': codec.name, 'frames': frames}))
+        verify(directory, PackName + '.tmp', crcs)
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, pack)
+    for name in names:
+        os.remove(directory + '/' + name)
+    return {'directory': directory, 'frames': len(names), 'bytes_in': bytes_in,
+            'bytes_out': os.path.getsize(pack), 'seconds': time.perf_counter() - tic}
+
+# Decodes every frame of a pack and checks it against its original (by CRC, or pixel by pixel for
+# --- the image codecs)
+def verify(directory, name, crcs):
+    with Pack(directory, name) as p:
+        for frame, crc in crcs.items():
+            decoded = p.read(frame)
+            if p.codec.image:
+                with open(directory + '/' + frame, 'rb') as f:
+                    ok = p.codec.check(f.read(), decoded)
+            else: ok = zlib.crc32(decoded) == crc
+            if not ok:
+                raise ValueError(directory + '/' + name + ': ' + frame + ' does not match the original')
+
+
+def lower_priority():
+    try:
+        os.nice(PackerNice)
+    except OSError:
+        pass
+
+
+# Packs events in a pool of worker processes, one event per worker. on_done(directory) is called
+# --- (in a thread of the pool) once an event is done, whether it could be packed or not.
+class Packer:
+    def __init__(self, codec='none', workers=1, on_done=None):
+        Codec(codec) # fails here rather than in the workers if the codec is unknown or not installed
+        self.codec = codec
+        self.on_done = on_done
+        # spawn rather than fork: the EB has threads (GPIO callbacks, control) that a fork would copy mid-state
+        self.pool = ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'), initializer=lower_priority)
+
+    def submit(self, directory):
+        future = self.pool.submit(pack_event, directory, self.codec)
+        future.add_done_callback(lambda future: self.done(future, directory))
+        return future
+
+    def done(self, future, directory):
+        try:
+            result = future.result()
+        except Exception as e:
+            print('Packing failed: ', e)
+            result = None
+        if result is not None:
+            print('Packed {directory}: {frames} frames, {bytes_in} -> {bytes_out} bytes in {seconds:.2f} s'.format(**result))
+        if self.on_done is not None:
+            self.on_done(directory)
+
+    # Waits for the events already submitted
+    def stop(self, wait=True):
+        self.pool.shutdown(wait)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eb-pack', description='Pack event frames into one file per event')
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help='pack event folders')
+    pack.add_argument('directories', nargs='+')
+    pack.add_argument('--codec', default='none', help='see compression.py')
+    ls = commands.add_parser('list', help='list the frames in an event pack')
+    ls.add_argument('directory')
+    unpack = commands.add_parser('unpack', help='extract the frames of an event pack into its folder')
+    unpack.add_argument('directory')
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        try:
+            Codec(args.codec)
+        except (ImportError, ValueError) as e:
+            parser.error('codec ' + args.codec + ': ' + str(e))
+        for directory in args.directories:
+            try:
+                result = pack_event(directory, args.codec)
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                print('Could not pack ' + directory + ': ', e)
+                continue
+            if result is not None:
+                print('{directory}: {frames} frames, {bytes_in} -> {bytes_out} bytes in {seconds:.2f} s'.format(**result))
+    elif args.command == 'list':
+        with Pack(args.directory) as p:
+            for f in p.frames():
+                print('{:<40} {:>4} {:>10} {}'.format(f['name'], '-' if f['cam'] is None else f['cam'], f['size'], f['mtime_ns']))
+    elif args.command == 'unpack':
+        with Pack(args.directory) as p:
+            for f in p.frames():
+                path = args.directory + '/' + f['name']
+                with open(path, 'wb') as out:
+                    out.write(p.read(f['name']))
+                os.utime(path, ns=(f['mtime_ns'], f['mtime_ns']))
+        os.remove(args.directory + '/' + PackName)
+
+
+if __name__ == '__main__':
+    main()
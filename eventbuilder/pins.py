@@ -0,0 +1,40 @@
+from .hal import open_backend
+from . import cameras
+
+### Physical (BOARD) pin numbers of the event builder's GPIO connections.
+### The per-camera pins come from the camera registry (cameras.py): one entry per enabled camera, in
+### --- the registry's order. use_cameras sets them, so read them as pins.<name> when they are needed
+### --- rather than importing them.
+
+TriggerReset  = 22
+TriggerLatch  = 29
+EndEvent      = 31
+Error_LED     = 38
+Trig_0_LED    = 37
+
+# Fixed pins no camera in the registry may use (cameras.load checks). Error_LED is not one of them: it
+# --- has always shared pin 38 with the third camera's trig_enable (see eb-archive) and is never driven.
+Reserved = {TriggerReset: 'TriggerReset', TriggerLatch: 'TriggerLatch', EndEvent: 'EndEvent', Trig_0_LED: 'Trig_0_LED'}
+
+
+# Sets the per-camera pin lists (and Inputs/Outputs) from a list of cameras
+def use_cameras(cams):
+    global StateCom, InPins, TriggerEnable, HeartbeatPins, Inputs, Outputs
+    StateCom      = [c.state_com for c in cams]   # Output signal to RPis
+    InPins        = [c.state for c in cams]
+    TriggerEnable = [c.trig_enable for c in cams]
+    HeartbeatPins = [c.heartbeat for c in cams if c.heartbeat is not None] # only used in heartbeat mode
+    Inputs  = InPins + [TriggerLatch] + HeartbeatPins
+    Outputs = StateCom + TriggerEnable + [TriggerReset, EndEvent, Error_LED, Trig_0_LED]
+
+use_cameras(cameras.active())
+
+
+# Loads the camera registry, opens the GPIO backend ('rpi', 'mmap' or 'sim', see hal.py), sets the
+# --- pin directions and drives all outputs low. Called once at startup.
+def setup_gpio(backend='rpi'):
+    cameras.load()
+    use_cameras(cameras.active())
+    gpio = open_backend(backend)
+    gpio.setup(Inputs, Outputs)
+    return gpio
@@ -0,0 +1,134 @@
+import heapq
+import itertools
+import threading
+import time
+
+### Non-blocking output pulses (EndEvent, TriggerReset, trig_enable). pulse() raises the pins straight
+### --- away in the calling thread and returns; a timer thread lowers them again once the width has
+### --- passed. The timer sleeps until just before the edge is due and spins for the last bit (spin),
+### --- so the width is accurate to a few microseconds instead of the sleep granularity. None of the
+### --- GPIO backends expose waveform hardware, so everything is timed here.
+### Every Pulse records the actual rise and fall times (time.monotonic_ns) and sets done once it
+### --- has fallen. Starting a pulse on pins that are already being pulsed takes them over: the earlier
+### --- pulse no longer lowers those pins (and is marked superseded if it has none left), so a later,
+### --- longer pulse is never cut short by an earlier one.
+
+RISE = 0
+FALL = 1
+
+
+class Pulse:
+    def __init__(self, mask, width):
+        self.mask = mask
+        self.width = width
+        self.rise_ns = None
+        self.fall_ns = None
+        self.superseded = False
+        self.then = None # (next pulse, gap in ns) for sequences
+        self.on_fall = None
+        self.done = threading.Event()
+
+    # Width the pins were actually held high, in seconds
+    def measured_width(self):
+        if self.rise_ns is None or self.fall_ns is None:
+            return None
+        return (self.fall_ns - self.rise_ns)/1e9
+
+
+class PulseScheduler(threading.Thread):
+    def __init__(self, gpio, spin=0.0005):
+        super().__init__(name='pulse-scheduler', daemon=True)
+        self.gpio = gpio
+        self.spin_ns = int(spin*1e9)
+        self.cond = threading.Condition(threading.RLock())
+        self.queue = [] # heap of (due_ns, n, RISE/FALL, pulse)
+        self.count = itertools.count()
+        self.active = []
+        self.running = True
+
+
+    # Pulses a pin (or list of pins) high for width seconds, starting after delay seconds.
+    # on_fall, if given, is called with the pulse from the timer thread once it has fallen.
+    def pulse(self, pins, width, delay=0, on_fall=None):
+        p = Pulse(self.gpio.mask(pins), width)
+        p.on_fall = on_fall
+        if delay > 0:
+            self.schedule(time.monotonic_ns() + int(delay*1e9), RISE, p)
+        else: self.rise(p)
+        return p
+
+    # Runs pulses one after the other. Each step is (pins, width) or (pins, width, gap), where gap is the
+    # --- time in seconds between the previous pulse falling and this one rising. on_fall is called
+    # --- once the last pulse has fallen.
+    def sequence(self, steps, on_fall=None):
+        pulses = []
+        for step in steps:
+            p = Pulse(self.gpio.mask(step[0]), step[1])
+            if pulses:
+                gap = step[2] if len(step) > 2 else 0
+                pulses[-1].then = (p, int(gap*1e9))
+            pulses.append(p)
+        pulses[-1].on_fall = on_fall
+        self.rise(pulses[0])
+        return pulses
+
+
+    def schedule(self, due_ns, action, p):
+        with self.cond:
+            heapq.heappush(self.queue, (due_ns, next(self.count), action, p))
+            self.cond.notify()
+
+    def rise(self, p):
+        with self.cond:
+            for q in list(self.active):
+                if q.mask & p.mask:
+                    q.mask &= ~p.mask
+                    if not q.mask:
+                        q.superseded = True
+                        self.active.remove(q)
+                        q.done.set()
+            self.gpio.high(p.mask)
+            p.rise_ns = time.monotonic_ns()
+            self.active.append(p)
+            self.schedule(p.rise_ns + int(p.width*1e9), FALL, p)
+
+    def fall(self, p):
+        with self.cond:
+            if p not in self.active:
+                return
+            self.active.remove(p)
+            self.gpio.low(p.mask)
+            p.fall_ns = time.monotonic_ns()
+            p.done.set()
+            if p.then is not None:
+                nxt, gap_ns = p.then
+                if gap_ns > 0:
+                    self.schedule(p.fall_ns + gap_ns, RISE, nxt)
+                else: self.rise(nxt)
+        if p.on_fall is not None:
+            p.on_fall(p)
+
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                due_ns = self.queue[0][0]
+                wait_ns = due_ns - time.monotonic_ns() - self.spin_ns
+                if wait_ns > 0:
+                    self.cond.wait(wait_ns/1e9)
+                    continue
+                due_ns, n, action, p = heapq.heappop(self.queue)
+            while time.monotonic_ns() < due_ns:
+                pass
+            if action == RISE:
+                self.rise(p)
+            else: self.fall(p)
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
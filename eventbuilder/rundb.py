@@ -0,0 +1,216 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from . import folders
+
+### Run database: one row per saved event in an SQLite file (RunDB in folders.py, WAL mode so reading it
+### --- never blocks the EB writing the next event). Next to the free-form info.txt in each event folder,
+### --- which stays with the images when they are archived, the EB adds the same record here, so
+### --- questions like 'which events ended on a latch last week' are one indexed query:
+###
+###     python -m eventbuilder.rundb query --since 20261011 --end latch
+###     python -m eventbuilder.rundb import /home/pi/camera-data   (reads existing info.txt files)
+###
+### end_condition is a bit mask of the End* flags below; inactive and dead have bit i set for camera i
+### --- (inactive state pin / stopped sending heartbeats). EndLatch means a camera triggered: the latch
+### --- went up before the EB asked the event to end (it also goes up after the EndEvent pulse that ends
+### --- every other event, which does not count). info.txt files from before this distinction have
+### --- 'Trigger_latch was enabled' on every event, so imported ones may have EndLatch with other flags.
+
+EndMaxTime   = 1
+EndManual    = 2
+EndInactive  = 4
+EndHeartbeat = 8
+EndLatch     = 16
+
+EndNames = {'max-time': EndMaxTime, 'manual': EndManual, 'inactive': EndInactive,
+            'heartbeat': EndHeartbeat, 'latch': EndLatch}
+
+Schema = '''
+CREATE TABLE IF NOT EXISTS events (
+    date             TEXT NOT NULL,
+    idx              INTEGER NOT NULL,
+    time_saved       TEXT,
+    trig_enable_time REAL,
+    max_time         REAL,
+    event_time       REAL,
+    end_condition    INTEGER NOT NULL DEFAULT 0,
+    inactive         INTEGER NOT NULL DEFAULT 0,
+    dead             INTEGER NOT NULL DEFAULT 0,
+    config_hash      TEXT,
+    directory        TEXT,
+    PRIMARY KEY (date, idx)
+);
+CREATE INDEX IF NOT EXISTS events_end ON events (end_condition, date);
+'''
+
+Columns = ['date', 'idx', 'time_saved', 'trig_enable_time', 'max_time', 'event_time', 'end_condition',
+           'inactive', 'dead', 'config_hash', 'directory']
+
+
+def mask(cameras):
+    m = 0
+    for cam in cameras:
+        m |= 1 << cam
+    return m
+
+def cameras(m):
+    return [cam for cam in range(m.bit_length()) if m >> cam & 1]
+
+
+def end_names(end_condition):
+    return [name for name, flag in EndNames.items() if end_condition & flag]
+
+
+# The connection is opened on first use, so a RunDB can be made in one thread and used from another
+# --- (sqlite3 connections stay in the thread that opened them)
+class RunDB:
+    def __init__(self, path=None):
+        self.path = path or folders.RunDB
+        self.db = None
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.executescript(Schema)
+        return self.db
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    # Adds (or replaces) one event record, given as a dict with the Columns as keys
+    def add(self, record):
+        self.add_many([record])
+
+    def add_many(self, records):
+        db = self.connect()
+        with db:
+            db.executemany('INSERT OR REPLACE INTO events ({}) VALUES ({})'.format(
+                ', '.join(Columns), ', '.join('?'*len(Columns))), [[r.get(c) for c in Columns] for r in records])
+
+    # Events with date in [since, until], any of the end flags in end (0: any end) and, if given, camera
+    # --- cam inactive or dead. Returns a list of dicts, oldest first.
+    def query(self, since=None, until=None, end=0, cam=None, limit=None):
+        where = []
+        args = []
+        if since:
+            where.append('date >= ?')
+            args.append(since)
+        if until:
+            where.append('date <= ?')
+            args.append(until)
+        if end:
+            where.append('end_condition & ? != 0')
+            args.append(end)
+        if cam is not None:
+            where.append('(inactive | dead) & ? != 0')
+            args.append(1 << cam)
+        sql = 'SELECT {} FROM events'.format(', '.join(Columns))
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY date, idx'
+        if limit:
+            sql += ' LIMIT {:d}'.format(limit)
+        return [dict(zip(Columns, row)) for row in self.connect().execute(sql, args)]
+
+
+# Reads an info.txt written by the EB (this one or the older ones in eb-archive) into a record.
+# Date and event index fall back on the folder's path (<day>/<index>/info.txt).
+def parse_info(path):
+    fields = {}
+    with open(path) as f:
+        for line in f:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                fields[key.strip()] = value.strip()
+    directory = os.path.dirname(os.path.abspath(path))
+    record = {'date': fields.get('Date') or os.path.basename(os.path.dirname(directory)),
+              'idx': int(fields.get('Event') or os.path.basename(directory)),
+              'time_saved': fields.get('Time Saved'),
+              'trig_enable_time': number(fields.get('Trigger Enable Time')),
+              'max_time': number(fields.get('Max Time')),
+              'event_time': number(fields.get('Event Time')),
+              'directory': directory}
+    end = fields.get('End condition', '')
+    record['end_condition'] = ((EndMaxTime if 'Exceeded max time' in end else 0) |
+                               (EndManual if 'Man_Trigger' in end else 0) |
+                               (EndInactive if 'were inactive' in end else 0) |
+                               (EndHeartbeat if 'stopped sending heartbeats' in end else 0) |
+                               (EndLatch if 'Trigger_latch' in end else 0))
+    record['inactive'] = mask(int(c)-1 for c in re.findall(r'\d+', (re.findall(r'Camera\(s\) ([\d ]*)were inactive', end) or [''])[0]))
+    record['dead'] = mask(int(c)-1 for c in re.findall(r'\d+', (re.findall(r'Camera\(s\) ([\d ]*)stopped', end) or [''])[0]))
+    return record
+
+def number(text):
+    m = re.search(r'[-+]?\d*\.?\d+', text or '')
+    return float(m.group()) if m else None
+
+
+# Adds every info.txt under the given directories to the database. Returns the number of events.
+def import_info(db, paths):
+    records = []
+    for top in paths:
+        for root, dirs, files in os.walk(top):
+            dirs[:] = [d for d in dirs if not os.path.islink(os.path.join(root, d))]
+            if 'info.txt' in files:
+                try:
+                    records.append(parse_info(os.path.join(root, 'info.txt')))
+                except (OSError, ValueError) as e:
+                    print('Skipping ' + os.path.join(root, 'info.txt') + ': ', e)
+    db.add_many(records)
+    return len(records)
+
+
+def format_row(r):
+    return '{:<8} {:>5} {:>8} {:>6} {:>6} {:>8} {:<24} {}'.format(
+        r['date'], r['idx'], r['time_saved'] or '-', fmt(r['trig_enable_time']), fmt(r['max_time']),
+        fmt(r['event_time']), ','.join(end_names(r['end_condition'])) or '-',
+        ' '.join('Cam_'+str(c) for c in cameras(r['inactive'] | r['dead'])))
+
+def fmt(x):
+    return '-' if x is None else '{:g}'.format(x)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eb-runs', description='Query the run database')
+    parser.add_argument('--db', help='database file (default: {})'.format(folders.RunDB))
+    commands = parser.add_subparsers(dest='command', required=True)
+    q = commands.add_parser('query', help='list events')
+    q.add_argument('--since', help='first date, YYYYMMDD')
+    q.add_argument('--until', help='last date, YYYYMMDD')
+    q.add_argument('--end', action='append', choices=list(EndNames), help='end condition (repeat for any of several)')
+    q.add_argument('--cam', type=int, help='only events where this camera was inactive or dead')
+    q.add_argument('--limit', type=int)
+    q.add_argument('--count', action='store_true', help='only print the number of events')
+    i = commands.add_parser('import', help='import info.txt files')
+    i.add_argument('paths', nargs='*', default=[folders.DataDir])
+    args = parser.parse_args(argv)
+
+    db = RunDB(args.db)
+    if args.command == 'import':
+        tic = time.perf_counter()
+        n = import_info(db, args.paths)
+        print('Imported {} events in {:.2f} s'.format(n, time.perf_counter()-tic))
+        return
+    end = 0
+    for name in args.end or []:
+        end |= EndNames[name]
+    tic = time.perf_counter()
+    rows = db.query(args.since, args.until, end, args.cam, args.limit)
+    toc = time.perf_counter()
+    if not args.count:
+        print('{:<8} {:>5} {:>8} {:>6} {:>6} {:>8} {:<24} {}'.format(
+            'date', 'event', 'saved', 'trig', 'max', 'time', 'end', 'cameras'))
+        for r in rows:
+            print(format_row(r))
+    print('{} events ({:.1f} ms)'.format(len(rows), (toc-tic)*1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import json
+import os
+import random
+import threading
+from . import folders
+from . import pins, cameras, config
+from .pins import TriggerReset, TriggerLatch, EndEvent
+
+### Virtual cameras for the 'sim' GPIO backend. They follow the outputs of a SimBackend the way the
+### --- RPis and the trigger latch do on the chamber:
+###   state_com rises   -> each camera raises its state pin after ready_delay (it is armed)
+###   trig_enable rises -> after trigger_after (None: never) a camera triggers and the latch goes high
+###   EndEvent rises    -> the cameras latch the trigger (as they do at the end of every event)
+###   TriggerReset      -> the latch is cleared
+###   state_com falls   -> each camera lowers its state pin after save_time (it is done saving)
+### With frames set, each camera writes that many frame files of frame_size bytes through the Images link
+### --- when it saves, named like the real ones (<camera name>_<n>.bmp).
+### Like the real cameras, each camera reports the config it applied (<config file>.applied, see
+### --- config.py) at start and whenever it is done saving, if there is a config file, with memory
+### --- bytes of free RAM if that is set.
+### Every delay gets up to +jitter seconds of random spread (seeded, so runs are repeatable). Cameras
+### --- listed in dead never raise their state pin; with heartbeat set the live cameras toggle their
+### --- heartbeat line every heartbeat seconds.
+###
+###     gpio = setup_gpio('sim')
+###     cameras = VirtualCameras(gpio, ready_delay=0.02, save_time=0.5)
+
+class VirtualCameras:
+    def __init__(self, gpio, ready_delay=0.02, save_time=0.5, trigger_after=None, latch_delay=0.0005,
+                 jitter=0.0, dead=(), heartbeat=None, seed=0, frames=0, frame_size=1024000, memory=None):
+        self.gpio = gpio
+        self.ready_delay = ready_delay
+        self.save_time = save_time
+        self.trigger_after = trigger_after
+        self.latch_delay = latch_delay
+        self.jitter = jitter
+        self.dead = set(dead)
+        self.frames = frames
+        self.frame_size = frame_size
+        self.memory = memory
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # Bumped on every state_com/trig_enable edge, so timers from an earlier edge do nothing
+        self.generation = 0
+        self.trigger_generation = 0
+        self.cams = cameras.active()
+        self.in_pins = list(pins.InPins)
+        self.heartbeat_pins = list(pins.HeartbeatPins)
+        self.state_com_mask = gpio.mask(pins.StateCom)
+        self.trig_enable_mask = gpio.mask(pins.TriggerEnable)
+        self.trig_reset_mask = gpio.mask(TriggerReset)
+        self.end_event_mask = gpio.mask(EndEvent)
+        self.heartbeat_timer = None
+        self.running = True
+        gpio.listeners.append(self.on_write)
+        for cam in range(len(self.cams)):
+            self.apply_config(cam)
+        if heartbeat:
+            self.heartbeat = heartbeat
+            self.beat()
+
+    def later(self, delay, function, *args):
+        delay += self.random.uniform(0, self.jitter) if self.jitter else 0
+        timer = threading.Timer(delay, function, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+    # SimBackend listener, called after every write to the outputs
+    def on_write(self, mask, levels, t_ns):
+        with self.lock:
+            if mask & self.state_com_mask:
+                self.generation += 1
+                level = bool(levels & self.state_com_mask)
+                for cam, pin in enumerate(self.in_pins):
+                    if cam not in self.dead:
+                        self.later(self.ready_delay if level else self.save_time, self.set_state, self.generation, pin, level)
+            if mask & self.trig_enable_mask:
+                self.trigger_generation += 1
+                if levels & self.trig_enable_mask and self.trigger_after is not None:
+                    self.later(self.trigger_after, self.trigger, self.trigger_generation)
+            if mask & levels & self.end_event_mask:
+                self.later(self.latch_delay, self.gpio.set_input, TriggerLatch, True)
+        # Straight away, but outside the lock: set_input calls the edge callbacks, which may write again
+        if mask & levels & self.trig_reset_mask:
+            self.gpio.set_input(TriggerLatch, False)
+
+    def set_state(self, generation, pin, level):
+        if generation != self.generation:
+            return
+        if not level and self.frames:
+            self.save_frames(self.in_pins.index(pin))
+        if not level:
+            self.apply_config(self.in_pins.index(pin))
+        self.gpio.set_input(pin, level)
+
+    def apply_config(self, cam):
+        path = folders.DataDir + '/' + self.cams[cam].config
+        c = config.read_config(path)
+        if c is None or 'config_hash' not in c:
+            return
+        with open(path + '.applied.tmp', 'w') as f:
+            json.dump({'config_hash': c['config_hash'], 'version': c.get('version'), 'mem_available': self.memory}, f)
+        os.replace(path + '.applied.tmp', path + '.applied')
+
+    def save_frames(self, cam):
+        directory = os.path.realpath(folders.ImagesLink)
+        data = os.urandom(min(self.frame_size, 4096))
+        data = (data * (self.frame_size//len(data) + 1))[:self.frame_size]
+        for n in range(self.frames):
+            with open(directory + '/' + self.cams[cam].name + '_' + '{:04d}'.format(n) + '.bmp', 'wb') as f:
+                f.write(data)
+
+    # A camera saw something while the trigger was enabled
+    def trigger(self, generation):
+        if generation == self.trigger_generation:
+            self.gpio.set_input(TriggerLatch, True)
+
+
+    def beat(self):
+        if not self.running:
+            return
+        for cam, pin in enumerate(self.heartbeat_pins):
+            if cam not in self.dead:
+                self.gpio.set_input(pin, not self.gpio.input(pin))
+        self.heartbeat_timer = threading.Timer(self.heartbeat, self.beat)
+        self.heartbeat_timer.daemon = True
+        self.heartbeat_timer.start()
+
+    def stop(self):
+        self.running = False
+        if self.heartbeat_timer is not None:
+            self.heartbeat_timer.cancel()
+        if self.on_write in self.gpio.listeners:
+            self.gpio.listeners.remove(self.on_write)
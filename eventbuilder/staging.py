@@ -0,0 +1,133 @@
+import os
+import queue
+import shutil
+import threading
+import time
+from . import folders
+
+### RAM staging tier. The cameras save over NFS into whatever the Images link points at, and the next
+### --- event cannot start before they are done, so with the event folders on the SD card or a
+### --- hard disk the disk's write speed is dead time. With a staging directory on a tmpfs, the Images
+### --- link points at <staging>/<day>/<index> instead of the event
+### --- folder, and once the cameras are done the Staging thread moves the frames into the event
+### --- folder on disk while the next event runs. The event folder itself (info.txt, run database,
+### --- catalog) is made on disk as before; only the frames take the detour.
+### Back-pressure: while the frames still in RAM plus the next event would go over high_water bytes,
+### --- EventControl does not start the next event (autorun waits and goes on as soon as a flush makes
+### --- room). Frames left in the staging directory by a crash are flushed at start.
+### The cameras resolve the Images link on their side of the NFS mount, so like the data directory the
+### --- staging directory has to be exported and mounted at the same path on the cameras: a local tmpfs
+### --- like /dev/shm is out of their reach. The simplest is a tmpfs mounted inside the data directory
+### --- (e.g. <data dir>/staging, with nohide or crossmnt on the export so NFS goes into it); Staging
+### --- warns about a directory outside the data directory.
+
+HighWater = 1e9 # bytes of frames that may be held in RAM
+
+
+def tree_bytes(root):
+    total = 0
+    for dirpath, dirs, files in os.walk(root):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+# Moves the files of src into dst (on another file system): copied with their timestamps, fsynced and
+# --- renamed into place before the original is removed. Returns (files, bytes).
+def move_files(src, dst):
+    files = size = 0
+    for e in sorted(os.scandir(src), key=lambda e: e.name):
+        if not e.is_file(follow_symlinks=False):
+            continue
+        tmp = dst + '/' + e.name + '.tmp'
+        shutil.copy2(e.path, tmp)
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, dst + '/' + e.name)
+        size += e.stat(follow_symlinks=False).st_size
+        os.remove(e.path)
+        files += 1
+    return files, size
+
+
+class Staging(threading.Thread):
+    # on_space() is called (in this thread) once the queued flushes are done, to retry a held back event
+    def __init__(self, root, high_water=HighWater, on_space=None):
+        super().__init__(name='staging-flusher', daemon=True)
+        self.root = root
+        self.high_water = high_water
+        self.on_space = on_space
+        self.queue = queue.Queue()
+        os.makedirs(root, exist_ok=True)
+        if not folders.in_data_dir(root):
+            print('Warning: staging directory ' + root + ' is not inside the data directory ' + folders.DataDir +
+                  ', the cameras can only save into it if it is exported and mounted at the same path on them')
+
+    # Staging folder of an event folder (<data dir>/<day>/<index>)
+    def path(self, directory):
+        day, index = os.path.normpath(directory).split(os.sep)[-2:]
+        return self.root + '/' + day + '/' + index
+
+    def make(self, directory):
+        os.makedirs(self.path(directory), exist_ok=True)
+        return self.path(directory)
+
+    # Removes the staging folder of an event folder that was not used
+    def remove(self, directory):
+        try:
+            os.rmdir(self.path(directory))
+        except OSError:
+            pass
+
+    def used(self):
+        return tree_bytes(self.root)
+
+    # Whether an event of expected bytes would go over the high-water mark
+    def full(self, expected=0):
+        return self.used() + expected > self.high_water
+
+    # Moves the frames of an event into its folder on disk in the background, then calls
+    # --- on_done(directory, bytes moved, seconds that took)
+    def flush(self, directory, on_done=None):
+        self.queue.put((directory, on_done))
+
+    # Queues the events a previous run left in RAM. Their folders on disk are under data_dir.
+    # --- Returns those folders.
+    def recover(self, data_dir, on_done=None):
+        recovered = []
+        for day in sorted(os.listdir(self.root)):
+            if not os.path.isdir(self.root + '/' + day):
+                continue
+            for index in sorted(os.listdir(self.root + '/' + day)):
+                if os.listdir(self.root + '/' + day + '/' + index):
+                    recovered.append(data_dir + '/' + day + '/' + index)
+                    self.flush(recovered[-1], on_done)
+                else: self.remove(data_dir + '/' + day + '/' + index)
+        return recovered
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            directory, on_done = item
+            tic = time.perf_counter()
+            try:
+                os.makedirs(directory, exist_ok=True)
+                files, size = move_files(self.path(directory), directory)
+                os.rmdir(self.path(directory))
+            except OSError as e:
+                print('Could not flush ' + self.path(directory) + ': ', e)
+                continue
+            print('Flushed {}: {} files, {} bytes in {:.2f} s'.format(directory, files, size, time.perf_counter() - tic))
+            if on_done is not None:
+                on_done(directory, size, time.perf_counter() - tic)
+            if self.on_space is not None and self.queue.empty():
+                self.on_space()
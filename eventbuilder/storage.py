@@ -0,0 +1,148 @@
+import json
+import os
+import queue
+import threading
+from collections import deque
+from . import folders, config
+
+### Storage admission control. Before an event starts, the EB checks that the disk behind DataDir (which
+### --- the cameras write to over NFS) can take it:
+###   - expected bytes per event, from each camera's config file (see config.estimate)
+###   - free space, which has to stay above MinFreeBytes once the event is saved
+###   - write bandwidth, measured from the last events: bytes written to disk / time that took (the
+###     cameras' save, or with staging the flush from RAM). An event whose save is expected to take
+###     longer than config.SaveBudget is refused too.
+### The StorageMonitor thread does the slow parts (reading the config files, adding up the size of the
+### --- last event folder) in the background, so admit() is one statvfs call.
+
+MinFreeBytes  = 500e6 # bytes that have to be left free after the next event
+BandwidthEvents = 10  # number of recent events the bandwidth is measured over
+MonitorInterval = 1   # seconds between free space updates
+
+
+# Expected bytes per event from the camera config files in directory (0 if there are none)
+def expected_event_bytes(directory=None):
+    directory = directory or folders.DataDir
+    total = 0
+    for path in config.config_paths(directory):
+        try:
+            with open(path) as f:
+                c = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        total += config.estimate(c)['event_bytes']
+    return total
+
+
+def free_bytes(directory=None):
+    st = os.statvfs(directory or folders.DataDir)
+    return st.f_bavail * st.f_frsize
+
+
+# Bytes of the files in a folder (not recursive)
+def folder_bytes(directory):
+    total = 0
+    for e in os.scandir(directory):
+        if e.is_file(follow_symlinks=False):
+            total += e.stat(follow_symlinks=False).st_size
+    return total
+
+
+def mb(n):
+    return '{:.0f} MB'.format(n/1e6) if n < 10e9 else '{:.1f} GB'.format(n/1e9)
+
+
+class StorageMonitor(threading.Thread):
+    def __init__(self, directory=None):
+        super().__init__(name='storage-monitor', daemon=True)
+        self.directory = directory or folders.DataDir
+        self.saved = queue.Queue()
+        self.recent = deque(maxlen=BandwidthEvents) # (bytes, seconds) of the last saves
+        self.expected = expected_event_bytes(self.directory)
+        self.config_mtimes = None
+        self.free = None
+        self.running = True
+
+    # Called once size bytes of an event were written into directory, which took seconds. Without size
+    # --- the folder is measured here, so call this before anything changes it (packing): on_done(directory)
+    # --- is called (in this thread) once it has been measured.
+    def event_saved(self, directory, seconds, size=None, on_done=None):
+        self.saved.put((directory, seconds, size, on_done))
+
+    # Stops once the events already handed in are measured
+    def stop(self):
+        self.running = False
+        self.saved.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            try:
+                item = self.saved.get(timeout=MonitorInterval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                return
+            if item:
+                directory, seconds, size, on_done = item
+                try:
+                    self.recent.append((folder_bytes(directory) if size is None else size, seconds))
+                except OSError:
+                    pass
+                if on_done is not None:
+                    on_done(directory)
+            self.update()
+
+    def update(self):
+        try:
+            self.free = free_bytes(self.directory)
+        except OSError:
+            self.free = None
+        mtimes = []
+        for path in config.config_paths(self.directory):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        if mtimes != self.config_mtimes:
+            self.config_mtimes = mtimes
+            self.expected = expected_event_bytes(self.directory)
+
+    # Write bandwidth in bytes/s over the recent saves, None before the first
+    def bandwidth(self):
+        recent = list(self.recent)
+        seconds = sum(s for b, s in recent)
+        if not recent or seconds <= 0:
+            return None
+        return sum(b for b, s in recent)/seconds
+
+    # None if the next event can start, otherwise the reason it cannot
+    def admit(self):
+        try:
+            free = free_bytes(self.directory)
+        except OSError:
+            return None
+        if free - self.expected < MinFreeBytes:
+            return 'Not enough disk space: the next event needs {}, {} free (keeping {} spare)'.format(
+                mb(self.expected), mb(free), mb(MinFreeBytes))
+        bandwidth = self.bandwidth()
+        if config.SaveBudget and bandwidth and self.expected/bandwidth > config.SaveBudget:
+            return 'Disk too slow: the next event would take {:.1f} s to save at {}/s (budget {:g} s)'.format(
+                self.expected/bandwidth, mb(bandwidth), config.SaveBudget)
+        return None
+
+    # One line status like 'Disk: 12.3 GB free (41 events), 85 MB/s, next event 300 MB in ~3.5 s'
+    def format(self):
+        if self.free is None:
+            return 'Disk: -'
+        text = 'Disk: {} free'.format(mb(self.free))
+        if self.expected:
+            text += ' ({:d} events)'.format(int(max(self.free - MinFreeBytes, 0)//self.expected))
+        bandwidth = self.bandwidth()
+        if bandwidth:
+            text += ', {}/s'.format(mb(bandwidth))
+        if self.expected:
+            text += ', next event ' + mb(self.expected)
+            if bandwidth:
+                text += ' in ~{:.1f} s'.format(self.expected/bandwidth)
+        return text
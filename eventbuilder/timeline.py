@@ -0,0 +1,168 @@
+import argparse
+import json
+import math
+import threading
+import time
+from datetime import datetime
+from . import folders
+
+### Event timeline. Every state transition of an event is timestamped with time.monotonic_ns() (the
+### --- same clock as the GPIO edge and pulse timestamps) and appended to a JSON-lines file, one line
+### --- per transition:
+###
+###     {"event": "20261018-143501.123456", "t": 81234567890123, "what": "cam_ready", "cam": 2}
+###
+### Transitions, in the order they normally happen:
+###   state_com, trig_reset, cam_ready (per camera), swap, folder, live, trig_enable, end_request, latch,
+###   end_event, info_saved, db_saved, stage, staged, cam_saved (per camera), ready
+### --- plus abort for events that never went live, fail for events a step failed in (see
+### --- EventControl.fail) and cam_dead (per camera) in heartbeat mode.
+### stage/staged bracket making the next event's folder during the save (or, for the first event, while
+### --- the cameras get ready) and swap/folder pointing the Images link at it. Entries are kept in memory during the event and
+### --- written out once it is over, so the file is never touched in the middle of an event.
+### Run 'python -m eventbuilder.timeline [file]' for a summary of live time, dead time and per-phase
+### --- latency percentiles.
+
+class Timeline:
+    def __init__(self, path=None):
+        self.path = path or folders.TimelineFile
+        self.lock = threading.Lock()
+        self.pending = []
+        self.event = None
+
+    # Starts a new event. The event id is the wall clock time it started.
+    def begin(self):
+        self.event = datetime.now().strftime('%Y%m%d-%H%M%S.%f')
+
+    def record(self, what, t_ns=None, cam=None):
+        entry = {'event': self.event, 't': time.monotonic_ns() if t_ns is None else t_ns, 'what': what}
+        if cam is not None:
+            entry['cam'] = cam
+        with self.lock:
+            self.pending.append(entry)
+
+    # One entry per camera from a list of per-camera timestamps (None entries are skipped)
+    def record_cameras(self, what, times_ns):
+        for cam, t_ns in enumerate(times_ns):
+            if t_ns is not None:
+                self.record(what, t_ns, cam)
+
+    def flush(self):
+        with self.lock:
+            entries, self.pending = self.pending, []
+        if entries:
+            with open(self.path, 'a') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, separators=(',', ':'))+'\n')
+
+
+# Reads a timeline file into a list of events, each a dict of transition -> timestamp, in the order
+# --- they were written (events are flushed whole, so that is the order they happened in).
+# Per camera transitions become lists indexed by camera.
+def load(path):
+    events = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            event = events.setdefault(entry['event'], {'event': entry['event']})
+            if 'cam' in entry:
+                cams = event.setdefault(entry['what'], [])
+                cams.extend([None]*(entry['cam']+1-len(cams)))
+                cams[entry['cam']] = entry['t']
+            else: event.setdefault(entry['what'], entry['t'])
+    return list(events.values())
+
+
+# Nearest-rank percentile of a sorted list
+def percentile(values, p):
+    return values[min(len(values), max(1, math.ceil(p/100*len(values))))-1]
+
+
+def last(times):
+    if not times or None in times:
+        return None
+    return max(times)
+
+
+# Phases reported by summary as (name, start, end), where start and end are transition names or
+# --- functions of the event (for per camera transitions). Only events that went live are counted.
+Phases = [
+    ('start (state_com -> live)',        'state_com', 'live'),
+    ('cameras ready (state_com -> last)', 'state_com', lambda e: last(e.get('cam_ready'))),
+    ('folder (last ready -> folder)',     lambda e: last(e.get('cam_ready')), 'folder'),
+    ('link swap (swap -> folder)',        'swap', 'folder'),
+    ('stage next folder',                'stage', 'staged'),
+    ('end request -> latch',             'end_request', 'latch'),
+    ('latch -> end_event',               'latch', 'end_event'),
+    ('save (end_event -> last saved)',   'end_event', lambda e: last(e.get('cam_saved'))),
+    ('last saved -> ready',              lambda e: last(e.get('cam_saved')), 'ready'),
+    ('ready -> next state_com',          'ready', 'next_state_com'),
+]
+
+def get(event, key):
+    if callable(key):
+        return key(event)
+    return event.get(key)
+
+
+# Live time and dead time (seconds, one entry per event that went live) and the latency of every
+# --- phase (ms, sorted) over the events that went live
+def stats(events):
+    next_live = None
+    for a, b in zip(events[::-1][1:], events[::-1]):
+        a['next_state_com'] = b.get('state_com')
+        next_live = b.get('live', next_live)
+        if next_live is not None:
+            a['next_live'] = next_live
+
+    live = []
+    dead = []
+    for event in events:
+        if 'live' in event:
+            end = event.get('end_event', event.get('latch'))
+            if end is not None:
+                live.append((end - event['live'])/1e9)
+            if end is not None and 'next_live' in event:
+                dead.append((event['next_live'] - end)/1e9)
+
+    phases = []
+    for name, start, end in Phases:
+        values = []
+        for event in events:
+            if 'live' not in event:
+                continue
+            t0, t1 = get(event, start), get(event, end)
+            if t0 is not None and t1 is not None:
+                values.append((t1 - t0)/1e6)
+        values.sort()
+        phases.append((name, values))
+    return {'events': len(events), 'went_live': len([e for e in events if 'live' in e]),
+            'aborted': len([e for e in events if 'abort' in e]), 'failed': len([e for e in events if 'fail' in e]),
+            'live': live, 'dead': dead, 'phases': phases}
+
+
+def summary(events):
+    s = stats(events)
+    live, dead = s['live'], s['dead']
+    lines = []
+    lines.append('Events: {} ({} went live, {} aborted, {} failed)'.format(s['events'], s['went_live'], s['aborted'], s['failed']))
+    if live:
+        total = sum(live) + sum(dead)
+        lines.append('Live time: {:.1f} s, dead time between events: {:.1f} s, live fraction: {:.1%}'.format(
+            sum(live), sum(dead), sum(live)/total if total else 0))
+    lines.append('')
+    lines.append('{:<36} {:>6} {:>10} {:>10} {:>10} {:>10}'.format('phase (ms)', 'n', 'p50', 'p90', 'p99', 'max'))
+    for name, values in s['phases']:
+        if values:
+            lines.append('{:<36} {:>6} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                name, len(values), percentile(values, 50), percentile(values, 90), percentile(values, 99), values[-1]))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize the event timeline')
+    parser.add_argument('file', nargs='?', default=folders.TimelineFile)
+    args = parser.parse_args()
+    print(summary(load(args.file)))
@@ -0,0 +1,231 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import warnings
+from . import folders, config, cameras
+from .packer import Pack, PackName, is_frame, camera_of, frame_names
+from .rundb import parse_info, EndLatch
+
+### Offline trigger tuner. The cameras' motion trigger compares every frame with the one before it and
+### --- fires on the first frame where more than pix_threshold pixels changed by more than adc_threshold
+### --- ADC counts. This replays recorded events through that trigger for a grid of (adc_threshold,
+### --- pix_threshold) pairs at once: the histogram of pixel changes of every frame is taken once (in
+### --- NumPy, ChunkFrames frames at a time), the changed-pixel count for any adc_threshold is the tail
+### --- of that histogram, so the whole grid costs one pass over the frames.
+### The true trigger frame of an event that ended on the latch alone (end_condition EndLatch, see rundb.py)
+### --- is the one the camera triggered on, frames_after before its last frame (a pair firing up to
+### --- Tolerance frames earlier still counts); an event that ended otherwise holds nothing, so any trigger
+### --- in it is false. For each pair:
+###   trigger frame  median frame it fires on
+###   false rate     fraction of the recordings (one per camera and event) it fires in too early, or at all
+###                  without an event
+###   missed rate    fraction of the events it does not fire on
+###   latency        mean frames it fires after the true trigger frame
+### The results are written to TuningFile in the data directory, where the Camera Settings tab picks up
+### --- the best pair (see best). NumPy (and Pillow, for frames that are not 8 bit BMPs) are imported
+### --- when first used, like the optional codecs in compression.py.
+###
+###     python -m eventbuilder.tuner /home/pi/camera-data/20261018/* --adc 5:50:5 --pix 50:1000:50
+
+ChunkFrames = 32 # frames whose changes are counted at once
+Tolerance   = 2  # frames before the true trigger frame that a trigger still counts as the event
+
+
+# A frame (image file bytes) as a 2d uint8 array
+def frame_array(data):
+    import numpy as np
+    if data[:2] == b'BM' and int.from_bytes(data[28:30], 'little') == 8 and int.from_bytes(data[30:34], 'little') == 0:
+        offset = int.from_bytes(data[10:14], 'little')
+        width = int.from_bytes(data[18:22], 'little', signed=True)
+        height = abs(int.from_bytes(data[22:26], 'little', signed=True))
+        stride = (width + 3) & ~3 # rows are padded to 4 bytes
+        return np.frombuffer(data, np.uint8, stride*height, offset).reshape(height, stride)[:, :width]
+    from PIL import Image
+    return np.asarray(Image.open(io.BytesIO(data)).convert('L'))
+
+
+# The bytes of frames in an event folder, in order, from the folder or the pack (opened once, so delta
+# --- codecs decode each frame once)
+def read_frames(directory, names):
+    pack = None
+    try:
+        for name in names:
+            try:
+                with open(directory + '/' + name, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                if pack is None:
+                    pack = Pack(directory)
+                data = pack.read(name)
+            yield data
+    finally:
+        if pack is not None:
+            pack.close()
+
+
+# Pixels that changed by more than each ADC value from one frame to the next: an array of
+# --- (frames - 1, 256) with row t for frame t+1 against frame t
+def change_counts(frames):
+    import numpy as np
+    frames = iter(frames)
+    counts = []
+    prev = None
+    while True:
+        block = [frame_array(data).astype(np.int16) for data in itertools.islice(frames, ChunkFrames)]
+        if not block:
+            break
+        if prev is not None:
+            block.insert(0, prev)
+        prev = block[-1]
+        if len(block) < 2:
+            continue
+        diff = np.abs(np.diff(np.stack(block), axis=0)).reshape(len(block) - 1, -1)
+        hist = np.stack([np.bincount(d, minlength=256) for d in diff])
+        counts.append(hist[:, ::-1].cumsum(axis=1)[:, ::-1] - hist) # the tail above each value
+    return np.concatenate(counts) if counts else np.zeros((0, 256), np.int64)
+
+
+# The frame every (adc, pix) pair first fires on for a recording's change counts, as an array of
+# --- (len(adc), len(pix)), -1 where it never fires
+def first_triggers(counts, adc, pix):
+    import numpy as np
+    fired = counts[:, np.minimum(adc, 255)][:, :, None] > np.asarray(pix)[None, None, :]
+    return np.where(fired.any(axis=0), fired.argmax(axis=0) + 1, -1)
+
+
+# Cameras with frames in an event folder
+def cameras_in(directory):
+    names = [name for name in os.listdir(directory) if is_frame(name)]
+    if os.path.exists(directory + '/' + PackName):
+        with Pack(directory) as pack:
+            names += pack.names()
+    return sorted(set(camera_of(name) for name in names) - {None})
+
+
+# Whether an event folder holds a real trigger: its info.txt has the latch and no other end condition
+# --- (older info.txt files have the latch on every event). Raises FileNotFoundError without info.txt.
+def triggered(directory):
+    return parse_info(directory + '/info.txt')['end_condition'] == EndLatch
+
+
+# frames_after of the current config files (DefaultSettings without any)
+def current_frames_after():
+    for cam in cameras.active():
+        c = config.read_config(folders.DataDir + '/' + cam.config)
+        if c is not None and 'frames_after' in c:
+            return int(c['frames_after'])
+    return config.DefaultSettings['frames_after']
+
+
+# Replays the event folders (those with an info.txt) through the trigger for every pair of the adc and
+# --- pix grids. Returns a list of dicts, one per pair (see the top of this file).
+def tune(directories, adc, pix, frames_after=None, cams=None, tolerance=Tolerance):
+    import numpy as np
+    adc, pix = np.asarray(adc), np.asarray(pix)
+    frames_after = current_frames_after() if frames_after is None else frames_after
+    firsts, truths = [], []
+    for directory in directories:
+        try:
+            event = triggered(directory)
+        except FileNotFoundError:
+            print(directory + ': no info.txt, skipped')
+            continue
+        for cam in cams if cams is not None else cameras_in(directory):
+            names = frame_names(directory, cam)
+            if len(names) < 2:
+                continue
+            counts = change_counts(read_frames(directory, names))
+            firsts.append(first_triggers(counts, adc, pix))
+            truths.append(len(names) - frames_after if event and len(names) > frames_after else -1)
+    if not firsts:
+        return []
+    firsts = np.stack(firsts)
+    truth = np.array(truths)[:, None, None]
+    event = truth >= 0
+    fired = firsts >= 0
+    hit = fired & event & (firsts >= truth - tolerance)
+    false = fired & ~hit
+    latency = np.where(hit, firsts - truth, 0).sum(axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # pairs that never fire
+        median = np.nanmedian(np.where(fired, firsts, np.nan), axis=0)
+    n_events = int(event.sum())
+    results = []
+    for i, a in enumerate(adc):
+        for j, p in enumerate(pix):
+            hits = int(hit[:, i, j].sum())
+            results.append({'adc_threshold': int(a), 'pix_threshold': int(p),
+                            'trigger_frame': None if np.isnan(median[i, j]) else float(median[i, j]),
+                            'false_rate': float(false[:, i, j].mean()),
+                            'missed_rate': (n_events - hits)/n_events if n_events else 0.0,
+                            'latency': float(latency[i, j])/hits if hits else None,
+                            'recordings': len(firsts), 'events': n_events})
+    return results
+
+
+# Orders the pairs: fewest false and missed triggers, then the shortest latency, then the lowest (most
+# --- sensitive) thresholds
+def rank(r):
+    return (r['false_rate'] + r['missed_rate'], r['latency'] or 0, r['adc_threshold'], r['pix_threshold'])
+
+def best(results):
+    return min(results, key=rank) if results else None
+
+def format_result(r):
+    return 'adc_threshold {adc_threshold}, pix_threshold {pix_threshold}: false {f:.0f}%, missed {m:.0f}%, ' \
+           'trigger frame {t}, latency {l} frames ({recordings} recordings, {events} events)'.format(
+               f=100*r['false_rate'], m=100*r['missed_rate'],
+               t='-' if r['trigger_frame'] is None else '{:.0f}'.format(r['trigger_frame']),
+               l='-' if r['latency'] is None else '{:.1f}'.format(r['latency']), **r)
+
+
+def save_results(results, path=None):
+    with open((path or folders.TuningFile) + '.tmp', 'w') as f:
+        json.dump(results, f, indent=1)
+    os.replace((path or folders.TuningFile) + '.tmp', path or folders.TuningFile)
+
+def load_results(path=None):
+    with open(path or folders.TuningFile) as f:
+        return json.load(f)
+
+
+# 'start:stop:step' (stop included) or 'a,b,c'
+def grid(text):
+    if ':' in text:
+        start, stop, step = (int(x) for x in text.split(':'))
+        return list(range(start, stop + 1, step))
+    return [int(x) for x in text.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eb-tune', description='Replay recorded events through the motion trigger '
+                                                                 'for a grid of thresholds')
+    parser.add_argument('directories', nargs='+', help='event folders (packed or not)')
+    parser.add_argument('--adc', type=grid, default=grid('5:50:5'), help='adc_threshold values, start:stop:step or a,b,c')
+    parser.add_argument('--pix', type=grid, default=grid('50:1000:50'), help='pix_threshold values')
+    parser.add_argument('--frames-after', type=int, help='frames saved after the trigger (default: from the config files)')
+    parser.add_argument('--cam', type=int, action='append', help='camera number (default: all)')
+    parser.add_argument('--tolerance', type=int, default=Tolerance,
+                        help='frames before the recorded trigger that still count as the event')
+    parser.add_argument('--data-dir', help='data directory (default: {})'.format(folders.DataDir))
+    parser.add_argument('--out', help='results file (default: {})'.format(folders.TuningFile))
+    parser.add_argument('--top', type=int, default=10, help='pairs to show')
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        folders.set_data_dir(os.path.abspath(args.data_dir))
+    cameras.load()
+    results = tune([os.path.abspath(d) for d in args.directories], args.adc, args.pix, args.frames_after,
+                   args.cam, args.tolerance)
+    if not results:
+        raise SystemExit('No recordings to replay')
+    save_results(results, args.out)
+    for r in sorted(results, key=rank)[:args.top]:
+        print(format_result(r))
+    print('Results of {} pairs written to {}'.format(len(results), args.out or folders.TuningFile))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import os
+import json
+from eventbuilder import folders, config, control, storage
+from eventbuilder.pins import setup_gpio
+from eventbuilder.control import EventControl, IDLE
+from eventbuilder.sim import VirtualCameras
+
+
+def wait_for(ctl, condition, timeout=10):
+    while True:
+        snapshot = ctl.snapshots.get(timeout=timeout)
+        if condition(snapshot):
+            return snapshot
+
+
+# A camera reporting a stale config holds autorun back (stop_on_error or not) until it applies it
+def test_autorun_waits_for_admission(tmp_path, monkeypatch):
+    monkeypatch.setattr(control, 'EndEventWidth', 0.05)
+    monkeypatch.setattr(storage, 'MinFreeBytes', 0)
+    folders.set_data_dir(str(tmp_path))
+    folders.make_dump()
+    gpio = setup_gpio('sim')
+    config.save_config(dict(config.DefaultSettings))
+    cams = VirtualCameras(gpio, ready_delay=0.01, save_time=0.05)
+    cam = cams.cams[0]
+    with open(str(tmp_path) + '/' + cam.config + '.applied', 'w') as f:
+        json.dump({'config_hash': 'stale'}, f)
+
+    ctl = EventControl(gpio)
+    ctl.start()
+    try:
+        ctl.start_autorun(2, 0.1, 0.02, stop_on_error=True)
+        snapshot = wait_for(ctl, lambda s: s.refused)
+        assert cam.name in snapshot.refused
+        assert not snapshot.error
+        cams.apply_config(0)
+        ctl.retry()
+        snapshot = wait_for(ctl, lambda s: s.autorun_state == 'finished' and s.state == IDLE)
+        assert ctl.autorun.finished == 'done'
+        assert ctl.autorun.saved == 2
+        assert snapshot.refused == ''
+    finally:
+        ctl.quit()
+        ctl.join()
+        cams.stop()
+
+
+# Without staging, the Images link goes back to the dump folder once the cameras are done saving, so
+# --- Take Image shots after an event stay out of the saved event's folder
+def test_images_back_to_dump_after_event(tmp_path, monkeypatch):
+    monkeypatch.setattr(control, 'EndEventWidth', 0.05)
+    monkeypatch.setattr(storage, 'MinFreeBytes', 0)
+    folders.set_data_dir(str(tmp_path))
+    folders.make_dump()
+    gpio = setup_gpio('sim')
+    cams = VirtualCameras(gpio, ready_delay=0.01, save_time=0.05, frames=1, frame_size=16)
+
+    ctl = EventControl(gpio)
+    ctl.start()
+    try:
+        ctl.start_event(0.1, 0.02)
+        wait_for(ctl, lambda s: s.state == control.WAITING)
+        snapshot = wait_for(ctl, lambda s: s.state == IDLE)
+        assert not snapshot.error
+        event = snapshot.directory
+        assert event != folders.DumpDir
+        assert os.readlink(folders.ImagesLink) == folders.DumpDir
+        cams.save_frames(0)
+        assert os.listdir(folders.DumpDir) == [cams.cams[0].name + '_0000.bmp']
+        assert sorted(os.listdir(event)) == [name + '_0000.bmp' for name in sorted(c.name for c in cams.cams)] + ['info.txt']
+    finally:
+        ctl.quit()
+        ctl.join()
+        cams.stop()
+
+
+# Events started by hand once autorun is finished leave its report as it was
+def test_finished_autorun_report_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(control, 'EndEventWidth', 0.05)
+    monkeypatch.setattr(storage, 'MinFreeBytes', 0)
+    folders.set_data_dir(str(tmp_path))
+    folders.make_dump()
+    gpio = setup_gpio('sim')
+    cams = VirtualCameras(gpio, ready_delay=0.01, save_time=0.05)
+
+    ctl = EventControl(gpio)
+    ctl.start()
+    try:
+        ctl.start_autorun(1, 0.1, 0.02)
+        snapshot = wait_for(ctl, lambda s: s.autorun_state == 'finished' and s.state == IDLE)
+        report = snapshot.autorun
+        assert ctl.autorun.saved == 1
+        ctl.start_event(0.1, 0.02)
+        wait_for(ctl, lambda s: s.state == control.WAITING)
+        snapshot = wait_for(ctl, lambda s: s.state == IDLE)
+        assert snapshot.directory != folders.DumpDir
+        assert ctl.autorun.saved == 1 and ctl.autorun.errors == 0
+        assert snapshot.autorun == report
+    finally:
+        ctl.quit()
+        ctl.join()
+        cams.stop()
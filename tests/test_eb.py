@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import pytest
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packs an event with eb.py as the main script and eb.py --pack on the command line, like the GUI does:
+# --- the packer's spawned workers import eb.py again, and have to pack rather than run the GUI
+Driver = '''
+import sys
+import __main__
+from eventbuilder.packer import Packer
+__main__.__file__ = {eb!r}
+sys.argv = [{eb!r}, '--gpio', 'sim', '--pack']
+packer = Packer('none', 1)
+packer.submit({event!r}).result(timeout=60)
+packer.stop()
+'''
+
+
+def test_pack_from_eb(tmp_path):
+    pytest.importorskip('tkinter')
+    pytest.importorskip('typing_extensions')
+    pytest.importorskip('PIL')
+    event = tmp_path/'20261018'/'0'
+    event.mkdir(parents=True)
+    for n in range(3):
+        (event/'cam0_{:04d}.bmp'.format(n)).write_bytes(bytes([n])*100)
+    driver = tmp_path/'driver.py'
+    driver.write_text(Driver.format(eb=os.path.join(Root, 'eb.py'), event=str(event)))
+    env = dict(os.environ, PYTHONPATH=Root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    env.pop('DISPLAY', None)
+    subprocess.run([sys.executable, str(driver)], cwd=str(tmp_path), env=env, timeout=120, check=True)
+    assert sorted(os.listdir(str(event))) == ['frames.zip']
@@ -0,0 +1,45 @@
+import os
+import pytest
+from eventbuilder import tuner
+
+
+def write_event(directory, end_condition, frames=()):
+    os.makedirs(directory)
+    with open(directory + '/info.txt', 'w') as f:
+        f.write('Date: 20261018\nEvent: ' + os.path.basename(directory) + '\nEnd condition: ' + end_condition + '\n')
+    for n, pixels in enumerate(frames):
+        with open(directory + '/cam0_{:04d}.bmp'.format(n), 'wb') as f:
+            f.write(bmp(pixels))
+
+
+# An 8 bit grey BMP of a 4x4 frame with every pixel at value
+def bmp(value, size=4):
+    palette = b''.join(bytes((i, i, i, 0)) for i in range(256))
+    offset = 14 + 40 + len(palette)
+    header = b'BM' + (offset + size*size).to_bytes(4, 'little') + bytes(4) + offset.to_bytes(4, 'little')
+    info = (40).to_bytes(4, 'little') + size.to_bytes(4, 'little') + size.to_bytes(4, 'little') + \
+           (1).to_bytes(2, 'little') + (8).to_bytes(2, 'little') + bytes(24)
+    return header + info + palette + bytes([value])*(size*size)
+
+
+# A max-time event also has the latch in its info.txt (the EndEvent pulse latches the cameras): no trigger
+def test_max_time_event_is_not_a_trigger(tmp_path):
+    write_event(str(tmp_path/'1'), 'Exceeded max time; Trigger_latch was enabled')
+    write_event(str(tmp_path/'2'), 'Trigger_latch was enabled')
+    assert not tuner.triggered(str(tmp_path/'1'))
+    assert tuner.triggered(str(tmp_path/'2'))
+
+
+def test_tune(tmp_path):
+    pytest.importorskip('numpy')
+    # 6 frames, the scene changes at frame 4, 2 frames saved after the trigger
+    write_event(str(tmp_path/'1'), 'Trigger_latch was enabled', [0, 0, 0, 0, 100, 100])
+    write_event(str(tmp_path/'2'), 'Exceeded max time; Trigger_latch was enabled', [0, 0, 0, 100, 100, 100])
+    results = {(r['adc_threshold'], r['pix_threshold']): r
+               for r in tuner.tune([str(tmp_path/'1'), str(tmp_path/'2')], [50, 200], [10], frames_after=2, cams=[0])}
+    fires = results[50, 10]
+    assert fires['events'] == 1 and fires['recordings'] == 2
+    assert fires['missed_rate'] == 0 and fires['latency'] == 0
+    assert fires['false_rate'] == 0.5 # fires in the max-time event
+    never = results[200, 10]
+    assert never['missed_rate'] == 1 and never['false_rate'] == 0